@@ -0,0 +1,41 @@
+"""
+benchmark of how Network.build scales with the number of nodes, using a
+synthetic network of a SequentialNode containing IdentityNode's and
+ReferenceNode's (which add long range dependencies)
+
+usage:
+python benchmarks/build_scaling.py
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import treeano.nodes as tn
+
+SIZES = [625, 1250, 2500, 5000, 10000]
+
+
+def synthetic_network(num_nodes):
+    children = [tn.InputNode("i", shape=(3,))]
+    for idx in range(num_nodes // 2):
+        children.append(tn.IdentityNode("id%d" % idx))
+        children.append(tn.ReferenceNode("ref%d" % idx,
+                                         reference="id%d" % idx))
+    return tn.SequentialNode("seq", children).network()
+
+
+def time_build(num_nodes):
+    network = synthetic_network(num_nodes)
+    start_time = time.time()
+    network.build()
+    return time.time() - start_time
+
+
+if __name__ == "__main__":
+    print("%8s %12s %16s" % ("nodes", "build (s)", "per node (ms)"))
+    for num_nodes in SIZES:
+        total_time = time_build(num_nodes)
+        print("%8d %12.3f %16.4f" % (num_nodes,
+                                     total_time,
+                                     1000 * total_time / num_nodes))
@@ -0,0 +1,126 @@
+"""
+benchmark of the fused optimizer updates (fused_updates=True) against the
+per-parameter updates, on the MLP and CNN architectures from
+examples/mnist_mlp.py and examples/mnist_cnn.py, using synthetic data of the
+same shape as MNIST
+
+usage:
+python benchmarks/fused_updates.py
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+import treeano.lasagne.nodes as tl
+
+fX = theano.config.floatX
+
+BATCH_SIZE = 500
+NUM_STEPS = 20
+
+
+def mlp_model():
+    return tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 28 * 28)),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu1"),
+             tn.DropoutNode("do1"),
+             tn.DenseNode("fc2"),
+             tn.ReLUNode("relu2"),
+             tn.DropoutNode("do2"),
+             tn.DenseNode("fc3", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_units=512,
+        dropout_probability=0.5,
+        inits=[treeano.inits.XavierNormalInit()],
+    )
+
+
+def cnn_model():
+    return tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 1, 28, 28)),
+             tl.Conv2DNode("conv1"),
+             tn.ReLUNode("relu1"),
+             tl.MaxPool2DNode("mp1"),
+             tl.Conv2DNode("conv2"),
+             tn.ReLUNode("relu2"),
+             tl.MaxPool2DNode("mp2"),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu3"),
+             tn.DropoutNode("do1"),
+             tn.DenseNode("fc2", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_filters=32,
+        filter_size=(5, 5),
+        pool_size=(2, 2),
+        num_units=256,
+        dropout_probability=0.5,
+        inits=[treeano.inits.XavierNormalInit()],
+    )
+
+
+UPDATES_NODES = [("sgd", tn.SGDNode, dict(learning_rate=0.01)),
+                 ("adam", tn.AdamNode, {}),
+                 ("nesterov", tl.NesterovMomentumNode,
+                  dict(learning_rate=0.01))]
+
+
+def train_fn(model, updates_cls, fused, hyperparameters):
+    network = tn.HyperparameterNode(
+        "with_updates",
+        updates_cls(
+            "updates",
+            {"subtree": model,
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="model"),
+                 "target": tn.InputNode("y", shape=(None,), dtype="int32")},
+             )},
+            fused_updates=fused,
+            **hyperparameters),
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+    ).network()
+    return network.function(["x", "y"], ["cost"], include_updates=True)
+
+
+def time_steps(fn, x, y):
+    # first call is a warmup
+    fn(x, y)
+    start_time = time.time()
+    for _ in range(NUM_STEPS):
+        fn(x, y)
+    return (time.time() - start_time) / NUM_STEPS
+
+
+if __name__ == "__main__":
+    y = np.random.randint(0, 10, size=BATCH_SIZE).astype("int32")
+    print("%6s %10s %14s %14s %8s" % ("model", "updates", "unfused (ms)",
+                                      "fused (ms)", "speedup"))
+    for model_name, model_fn, x_shape in [("mlp", mlp_model, (28 * 28,)),
+                                          ("cnn", cnn_model, (1, 28, 28))]:
+        x = np.random.rand(BATCH_SIZE, *x_shape).astype(fX)
+        for updates_name, updates_cls, hyperparameters in UPDATES_NODES:
+            times = [time_steps(train_fn(model_fn(),
+                                         updates_cls,
+                                         fused,
+                                         hyperparameters),
+                                x,
+                                y)
+                     for fused in (False, True)]
+            print("%6s %10s %14.3f %14.3f %8.2f" % (model_name,
+                                                    updates_name,
+                                                    1000 * times[0],
+                                                    1000 * times[1],
+                                                    times[0] / times[1]))
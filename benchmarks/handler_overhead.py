@@ -0,0 +1,59 @@
+"""
+microbenchmark of the per-call overhead of canopy handled functions, using
+a no-op network (the output is the input), compared to calling the compiled
+theano function directly
+
+usage:
+python benchmarks/handler_overhead.py
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import numpy as np
+import theano
+import treeano.nodes as tn
+import canopy
+
+fX = theano.config.floatX
+
+NUM_CALLS = 10000
+NUM_HANDLERS = [0, 4, 16]
+
+
+class PassThrough(canopy.handlers.NetworkHandlerImpl):
+
+    def call(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def time_calls(fn, arg):
+    # warm up
+    fn(arg)
+    start_time = time.time()
+    for _ in range(NUM_CALLS):
+        fn(arg)
+    return (time.time() - start_time) / NUM_CALLS
+
+
+if __name__ == "__main__":
+    network = tn.InputNode("i", shape=(1,)).network()
+    x = np.zeros((1,), dtype=fX)
+
+    raw_fn = network.function(["i"], ["i"])
+    print("%-24s %10.2f us" % ("theano function",
+                               1e6 * time_calls(lambda v: raw_fn(v), x)))
+
+    for num_handlers in NUM_HANDLERS:
+        for flatten in [False, True]:
+            fn = canopy.handlers.handled_fn(
+                network,
+                [PassThrough() for _ in range(num_handlers)],
+                {"x": "i"},
+                {"out": "i"},
+                flatten=flatten)
+            name = "%d handlers%s" % (num_handlers,
+                                      " (flatten)" if flatten else "")
+            print("%-24s %10.2f us" % (name,
+                                       1e6 * time_calls(fn, {"x": x})))
@@ -0,0 +1,122 @@
+"""
+convergence of hogwild training (canopy.hogwild) against single-process
+training, on the MLP of examples/mnist_mlp.py with SGD
+
+each configuration trains for the same number of epochs over the training
+set (split into a shard per worker), and reports the time taken, the
+validation accuracy, and the staleness of the hogwild updates
+
+NOTE: canopy.hogwild isn't in-place hogwild - each worker step copies the
+parameters out of shared memory and adds their changes back, so the times
+include those copies (see compute_fraction in the report)
+
+usage:
+python benchmarks/hogwild_mnist.py
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import numpy as np
+import sklearn.datasets
+import sklearn.cross_validation
+import sklearn.metrics
+import theano
+import treeano
+import treeano.nodes as tn
+import canopy
+
+fX = theano.config.floatX
+
+BATCH_SIZE = 100
+NUM_EPOCHS = 3
+NUM_WORKERS = [1, 2, 4, 8]
+
+mnist = sklearn.datasets.fetch_mldata('MNIST original')
+X = mnist['data'].astype(fX) / 255.0
+y = mnist['target'].astype("int32")
+X_train, X_valid, y_train, y_valid = sklearn.cross_validation.train_test_split(
+    X, y, random_state=42)
+
+
+def make_network():
+    model = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 28 * 28)),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu1"),
+             tn.DropoutNode("do1"),
+             tn.DenseNode("fc2"),
+             tn.ReLUNode("relu2"),
+             tn.DropoutNode("do2"),
+             tn.DenseNode("fc3", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_units=512,
+        dropout_probability=0.5,
+        inits=[treeano.inits.XavierNormalInit()],
+    )
+    network = tn.HyperparameterNode(
+        "with_updates",
+        tn.SGDNode(
+            "sgd",
+            {"subtree": model,
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="model"),
+                 "target": tn.InputNode("y", shape=(None,), dtype="int32")},
+             )}),
+        learning_rate=0.1,
+        cost_function=treeano.utils.categorical_crossentropy_i32,
+    ).network()
+    network.build()
+    return network
+
+
+def generator_fn(worker_idx, num_workers):
+    rng = np.random.RandomState(worker_idx)
+    shard = np.arange(worker_idx, len(X_train), num_workers)
+    for _ in range(NUM_EPOCHS):
+        rng.shuffle(shard)
+        for start in range(0, len(shard) - BATCH_SIZE + 1, BATCH_SIZE):
+            idxs = shard[start:start + BATCH_SIZE]
+            yield [X_train[idxs], y_train[idxs]]
+
+
+def accuracy(network):
+    valid_fn = canopy.handled_fn(
+        network,
+        [canopy.handlers.override_hyperparameters(dropout_probability=0),
+         canopy.handlers.chunk_variables(batch_size=500,
+                                         variables=["x"])],
+        {"x": "x"},
+        {"pred": "pred"})
+    probabilities = valid_fn({"x": X_valid})["pred"]
+    return sklearn.metrics.accuracy_score(y_valid,
+                                          np.argmax(probabilities, axis=1))
+
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    network = make_network()
+    fn = network.function(["x", "y"], ["cost"], include_updates=True)
+    start_time = time.time()
+    for args in generator_fn(0, 1):
+        fn(*args)
+    print("single process: time=%0.1fs, accuracy=%f"
+          % (time.time() - start_time, accuracy(network)))
+
+    for num_workers in NUM_WORKERS:
+        np.random.seed(42)
+        network = make_network()
+        hogwild = canopy.hogwild.Hogwild(network,
+                                         ["x", "y"],
+                                         ["cost"],
+                                         num_workers=num_workers)
+        start_time = time.time()
+        results = hogwild.run(generator_fn)
+        print("hogwild with %d workers: time=%0.1fs, accuracy=%f"
+              % (num_workers, time.time() - start_time, accuracy(network)))
+        print(hogwild.report(results))
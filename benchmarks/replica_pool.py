@@ -0,0 +1,66 @@
+"""
+throughput of calling an MLP (the architecture of examples/mnist_mlp.py)
+from a thread per replica, for different numbers of replicas of the
+compiled function
+
+usage:
+python benchmarks/replica_pool.py
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+import canopy
+
+fX = theano.config.floatX
+
+BATCH_SIZE = 64
+NUM_CALLS = 400
+REPLICA_COUNTS = [1, 2, 4, 8]
+
+
+if __name__ == "__main__":
+    network = tn.HyperparameterNode(
+        "model",
+        tn.SequentialNode(
+            "seq",
+            [tn.InputNode("x", shape=(None, 28 * 28)),
+             tn.DenseNode("fc1"),
+             tn.ReLUNode("relu1"),
+             tn.DenseNode("fc2"),
+             tn.ReLUNode("relu2"),
+             tn.DenseNode("fc3", num_units=10),
+             tn.SoftmaxNode("pred"),
+             ]),
+        num_units=512,
+        inits=[treeano.inits.XavierNormalInit()],
+    ).network()
+    x = np.random.randn(BATCH_SIZE, 28 * 28).astype(fX)
+
+    fn = network.function(["x"], ["pred"])
+    print("theano function")
+    for res in canopy.replicas.throughput_by_replica_count(
+            lambda n: canopy.replicas.theano_function_replicas(fn, n),
+            [x],
+            replica_counts=REPLICA_COUNTS,
+            num_calls=NUM_CALLS):
+        print("%d replicas\t%0.1f calls/s"
+              % (res["num_replicas"], res["calls_per_second"]))
+
+    print("handled function")
+    for res in canopy.replicas.throughput_by_replica_count(
+            lambda n: canopy.replicas.handled_fn_replicas(
+                n,
+                network,
+                lambda: [canopy.handlers.batch_pad(32, keys=["x"])],
+                {"x": "x"},
+                {"pred": "pred"}),
+            [{"x": x}],
+            replica_counts=REPLICA_COUNTS,
+            num_calls=NUM_CALLS):
+        print("%d replicas\t%0.1f calls/s"
+              % (res["num_replicas"], res["calls_per_second"]))
@@ -1,8 +1,15 @@
+import data_parallel
+import datasets
 import fn_utils
 import handlers
+import hogwild
 import network_utils
 import node_utils
+import parameter_server
+import prefetch
+import replicas
 import serialization
+import serving
 import transforms
 import walk_utils
 
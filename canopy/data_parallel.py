@@ -0,0 +1,456 @@
+"""
+synchronous data-parallel training in local worker processes
+
+each worker compiles the same network and evaluates a shard of the rows of
+every call. the gradients of the workers are averaged through shared
+memory before the update (with each worker reducing a segment of the
+gradients, in the same order every time), so the parameters of all workers
+stay bit-identical
+
+NOTE: only the gradients are averaged, so update deltas that depend on the
+data of a worker in other ways (eg. the running statistics of batch
+normalization) would make the workers diverge - DataParallel.start raises
+a ValueError for networks with such update deltas
+
+usage:
+>>> network.build()
+>>> train_fn = DataParallel(network,
+...                         {"x": "x", "y": "y"},
+...                         {"cost": "cost"},
+...                         num_workers=8,
+...                         include_updates=True).start()
+>>> train_fn({"x": x, "y": y})
+>>> train_fn.sync_network()  # copy the trained parameters into network
+>>> train_fn.stop()
+
+NOTE: workers are forked from the current process, and each uses as many
+BLAS / OpenMP threads as it is configured to (eg. OMP_NUM_THREADS), so the
+number of threads per worker should usually be reduced
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import ctypes
+import traceback
+import multiprocessing
+
+import numpy as np
+import theano
+import theano.tensor as T
+from six.moves import queue
+
+from . import network_utils
+from . import prefetch
+from .handlers import batch
+from .handlers import fn
+from .handlers import nodes
+
+
+class _ProcessBarrier(object):
+
+    """
+    barrier for a fixed number of processes (multiprocessing.Barrier isn't
+    available in python 2)
+
+    timeout:
+    optional number of seconds after which waiting raises a RuntimeError
+    (eg. when another process will never reach the barrier), which leaves
+    the barrier unusable
+    """
+
+    def __init__(self, parties, timeout=None):
+        self.parties = parties
+        self.timeout = timeout
+        self.count = multiprocessing.RawValue(ctypes.c_int, 0)
+        self.generation = multiprocessing.RawValue(ctypes.c_int, 0)
+        self.condition = multiprocessing.Condition()
+
+    def wait(self):
+        with self.condition:
+            generation = self.generation.value
+            self.count.value += 1
+            if self.count.value == self.parties:
+                self.count.value = 0
+                self.generation.value += 1
+                self.condition.notify_all()
+            else:
+                if self.timeout is not None:
+                    deadline = time.time() + self.timeout
+                while generation == self.generation.value:
+                    if self.timeout is None:
+                        self.condition.wait()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise RuntimeError(
+                            "Timed out waiting for other workers (eg. "
+                            "because their shards had different numbers "
+                            "of mini-batches)")
+                    self.condition.wait(remaining)
+
+
+class AllReduceMeanOp(theano.Op):
+
+    """
+    op that averages each of its inputs across the workers of a
+    GradientAllReduce
+    """
+
+    def __init__(self, all_reduce):
+        self.all_reduce = all_reduce
+
+    def make_node(self, *inputs):
+        inputs = [T.as_tensor_variable(x) for x in inputs]
+        outputs = [x.type() for x in inputs]
+        return theano.Apply(self, inputs, outputs)
+
+    def perform(self, node, inputs, output_storage):
+        for storage, value in zip(output_storage,
+                                  self.all_reduce.mean(inputs)):
+            storage[0] = value
+
+    def infer_shape(self, node, shapes):
+        return shapes
+
+
+class GradientAllReduce(object):
+
+    """
+    averages gradients across worker processes through shared memory, to be
+    used as the gradient_transform hyperparameter of StandardUpdatesNode
+
+    each worker writes its gradients (as a flat vector) into its slot, then
+    sums a segment of all slots into the result, so the reduction takes
+    time proportional to the number of parameters, rather than the number
+    of parameters times the number of workers
+
+    size:
+    total number of elements of the gradients
+
+    timeout:
+    optional number of seconds to wait for the other workers
+    """
+
+    def __init__(self,
+                 num_workers,
+                 size,
+                 dtype=theano.config.floatX,
+                 timeout=None):
+        self.num_workers = num_workers
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        # one row per worker
+        self.slots = self._shared_array((num_workers, size))
+        self.result = self._shared_array((size,))
+        self.barrier = _ProcessBarrier(num_workers, timeout)
+        # set in each worker process
+        self.worker_idx = None
+        # factor to scale the gradients of the worker by, so that shards
+        # of different sizes are weighted by their number of rows
+        self.scale = 1.0
+
+    def _shared_array(self, shape):
+        num_bytes = int(np.prod(shape)) * self.dtype.itemsize
+        raw = multiprocessing.RawArray(ctypes.c_uint8, num_bytes)
+        return np.frombuffer(raw, dtype=self.dtype).reshape(shape)
+
+    def __call__(self, grads):
+        return AllReduceMeanOp(self)(*grads)
+
+    def mean(self, arrays):
+        assert self.worker_idx is not None, "not in a worker process"
+        slot = self.slots[self.worker_idx]
+        offset = 0
+        for arr in arrays:
+            size = arr.size
+            assert offset + size <= self.size, "gradients too large"
+            np.multiply(arr.ravel(),
+                        self.scale,
+                        out=slot[offset:offset + size])
+            offset += size
+        self.barrier.wait()
+        # reduce this worker's segment
+        segment = -(-offset // self.num_workers)
+        start = min(self.worker_idx * segment, offset)
+        stop = min(start + segment, offset)
+        np.sum(self.slots[:, start:stop], axis=0, out=self.result[start:stop])
+        self.result[start:stop] /= self.num_workers
+        self.barrier.wait()
+        results = []
+        offset = 0
+        for arr in arrays:
+            size = arr.size
+            results.append(self.result[offset:offset + size].reshape(
+                arr.shape).astype(arr.dtype))
+            offset += size
+        return results
+
+
+def _depends_on_local_data(variable):
+    """
+    returns whether or not the variable depends on the inputs of the graph
+    (ie. the data of a worker), other than through averaged gradients
+    """
+    seen = set()
+    stack = [variable]
+    while stack:
+        var = stack.pop()
+        if var in seen:
+            continue
+        seen.add(var)
+        if var.owner is None:
+            if not isinstance(var, (theano.compile.SharedVariable,
+                                    theano.gof.graph.Constant)):
+                return True
+        elif not isinstance(var.owner.op, AllReduceMeanOp):
+            stack.extend(var.owner.inputs)
+    return False
+
+
+def _local_update_deltas(network):
+    """
+    returns the names of the variables whose update deltas depend on the
+    data of a worker, other than through averaged gradients
+    """
+    if not network.update_deltas_computed:
+        return []
+    return sorted(str(var)
+                  for var, delta in network.update_deltas.deltas.items()
+                  if _depends_on_local_data(T.as_tensor_variable(delta)))
+
+
+def _worker(worker_idx,
+            all_reduce,
+            network,
+            handlers_fn,
+            inputs,
+            outputs,
+            kwargs,
+            task_queue,
+            result_queue,
+            slot):
+    all_reduce.worker_idx = worker_idx
+    try:
+        handlers = [nodes.override_hyperparameters(
+            gradient_transform=all_reduce)]
+        if handlers_fn is not None:
+            handlers += handlers_fn()
+        train_fn = fn.handled_fn(network, handlers, inputs, outputs, **kwargs)
+        local_deltas = _local_update_deltas(train_fn.state.network)
+    except Exception:
+        result_queue.put((worker_idx, "error", traceback.format_exc()))
+        return
+    result_queue.put((worker_idx, "ready", local_deltas))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        kind, payload, scale = task
+        try:
+            if kind == "values":
+                res = network_utils.to_value_dict(network)
+            else:
+                if kind == "shm":
+                    in_dict = prefetch.decode(payload, slot)
+                else:
+                    in_dict = payload
+                all_reduce.scale = scale
+                res = train_fn(in_dict)
+        except Exception:
+            result_queue.put((worker_idx, "error", traceback.format_exc()))
+            break
+        result_queue.put((worker_idx, "result", res))
+
+
+class DataParallel(object):
+
+    """
+    function that splits the rows of its inputs across worker processes,
+    each with a handled function of the network whose gradients are averaged
+    across workers
+
+    network:
+    network whose parameters are copied to each worker (built if it isn't
+    already, so that the workers start with the same parameters)
+
+    handlers_fn:
+    optional function returning a new list of handlers for each worker -
+    since handlers can evaluate a shard with several calls (eg.
+    chunk_variables), and every call of every worker waits for the other
+    workers to average the gradients, the number of rows of each call then
+    has to be divisible by the number of workers (so that the shards have
+    the same size)
+
+    slot_bytes:
+    size of the shared memory used to send each worker its shard - larger
+    shards are pickled
+
+    cost_reduction:
+    how the cost reduces over the rows of a call, so that the gradients of
+    the shards are combined into the gradient of the whole call:
+    - "mean" = the cost is a mean over rows (the gradient of each shard is
+      weighted by its fraction of the rows)
+    - "sum" = the cost is a sum over rows (the gradients of the shards are
+      summed)
+
+    barrier_timeout:
+    number of seconds a worker waits for the other workers to average the
+    gradients before failing (eg. if they make different numbers of
+    calls), after which the workers are stopped
+
+    kwargs are passed to handled_fn (eg. include_updates=True)
+    """
+
+    def __init__(self,
+                 network,
+                 inputs,
+                 outputs=None,
+                 num_workers=2,
+                 handlers_fn=None,
+                 slot_bytes=2 ** 26,
+                 cost_reduction="mean",
+                 barrier_timeout=600.0,
+                 **kwargs):
+        assert cost_reduction in ("mean", "sum")
+        network.build()
+        self.network = network
+        self.inputs = inputs
+        self.outputs = outputs
+        self.num_workers = num_workers
+        self.handlers_fn = handlers_fn
+        self.slot_bytes = slot_bytes
+        self.cost_reduction = cost_reduction
+        self.kwargs = kwargs
+        parameters = network[network.root_node.name].find_vws_in_subtree(
+            tags=["parameter"])
+        size = sum(int(np.prod(p.shape)) for p in parameters)
+        self.all_reduce = GradientAllReduce(num_workers,
+                                            size,
+                                            timeout=barrier_timeout)
+        self.processes = []
+
+    def start(self):
+        assert not self.processes, "already started"
+        self.slots = [np.frombuffer(multiprocessing.RawArray(ctypes.c_uint8,
+                                                             self.slot_bytes),
+                                    dtype=np.uint8)
+                      for _ in range(self.num_workers)]
+        self.task_queues = [multiprocessing.Queue()
+                            for _ in range(self.num_workers)]
+        self.result_queue = multiprocessing.Queue()
+        for worker_idx in range(self.num_workers):
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(worker_idx,
+                      self.all_reduce,
+                      self.network,
+                      self.handlers_fn,
+                      self.inputs,
+                      self.outputs,
+                      self.kwargs,
+                      self.task_queues[worker_idx],
+                      self.result_queue,
+                      self.slots[worker_idx]))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+        # wait for all workers to compile
+        local_deltas = self._receive_all()[0]
+        if local_deltas:
+            self.stop()
+            raise ValueError("The update deltas of %s depend on the data of "
+                             "each worker other than through the gradients "
+                             "(eg. batch normalization statistics), so the "
+                             "workers would diverge" % local_deltas)
+        return self
+
+    def stop(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def _receive_all(self):
+        """
+        returns the results of each worker, in order of worker index
+        """
+        results = [None] * self.num_workers
+        for _ in range(self.num_workers):
+            while True:
+                try:
+                    worker_idx, kind, payload = self.result_queue.get(
+                        timeout=1.0)
+                    break
+                except queue.Empty:
+                    for process in self.processes:
+                        if process.exitcode not in (None, 0):
+                            self.stop()
+                            raise RuntimeError("Worker process died with "
+                                               "exit code %d"
+                                               % process.exitcode)
+            if kind == "error":
+                # other workers might be waiting for this one
+                self.stop()
+                raise RuntimeError("Error in worker process %d:\n%s"
+                                   % (worker_idx, payload))
+            results[worker_idx] = payload
+        return results
+
+    def __call__(self, in_dict):
+        assert self.processes, "not started"
+        num_rows = {len(v) for v in in_dict.values()}
+        assert len(num_rows) == 1, "inputs have different numbers of rows"
+        num_rows = num_rows.pop()
+        assert num_rows >= self.num_workers, "fewer rows than workers"
+        if (self.handlers_fn is not None
+                and num_rows % self.num_workers != 0):
+            # shards of different sizes could be evaluated with different
+            # numbers of calls, which would wait for each other forever
+            raise ValueError("Number of rows (%d) must be divisible by the "
+                             "number of workers (%d) when using handlers"
+                             % (num_rows, self.num_workers))
+        bounds = np.linspace(0, num_rows, self.num_workers + 1).astype(int)
+        shard_rows = []
+        for worker_idx in range(self.num_workers):
+            start, stop = bounds[worker_idx], bounds[worker_idx + 1]
+            shard = {k: v[start:stop] for k, v in in_dict.items()}
+            # the gradients are averaged across workers, so scale them such
+            # that the average is the gradient of the whole call
+            if self.cost_reduction == "mean":
+                # weight the gradient of the mean cost of the shard by the
+                # fraction of rows in the shard
+                scale = (stop - start) * self.num_workers / num_rows
+            else:
+                scale = self.num_workers
+            try:
+                meta, _ = prefetch.encode(shard, self.slots[worker_idx])
+                task = ("shm", meta, scale)
+            except prefetch.SlotFull:
+                task = ("pickle", shard, scale)
+            self.task_queues[worker_idx].put(task)
+            shard_rows.append(stop - start)
+        assembler = batch.OutputAssembler("mean")
+        for res, rows in zip(self._receive_all(), shard_rows):
+            assembler.add(res, rows)
+        return assembler.merge()
+
+    def parameter_values(self):
+        """
+        returns a list of the value dicts (see
+        canopy.network_utils.to_value_dict) of each worker
+        """
+        for task_queue in self.task_queues:
+            task_queue.put(("values", None, None))
+        return self._receive_all()
+
+    def sync_network(self):
+        """
+        loads the parameters of the workers into the network
+        """
+        network_utils.load_value_dict(self.network,
+                                      self.parameter_values()[0])
@@ -0,0 +1,170 @@
+"""
+out-of-core data sources, which read datasets stored as shards on disk
+through memory maps, so that memory usage depends on the chunk size instead
+of the size of the dataset
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import struct
+import zipfile
+
+import six
+import numpy as np
+
+
+def memmap_npz_member(path, key):
+    """
+    returns a read-only memory map of an array in an uncompressed .npz file
+    (eg. saved with np.savez, but not np.savez_compressed)
+    """
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(key + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("Can't memory map compressed array %s in %s"
+                         % (key, path))
+    with open(path, "rb") as f:
+        # the data of the member starts after its local file header, whose
+        # size depends on the lengths of the name and extra fields
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            header = np.lib.format.read_array_header_2_0(f)
+        else:
+            raise ValueError("Unsupported .npy format version %d.%d for "
+                             "array %s in %s" % (version + (key, path)))
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    return np.memmap(path,
+                     dtype=dtype,
+                     mode="r",
+                     shape=shape,
+                     order="F" if fortran_order else "C",
+                     offset=offset)
+
+
+def memmap_shard(shard):
+    """
+    returns a map from key to a read-only memory map for a shard
+
+    shard:
+    either the path to an uncompressed .npz file, or a map from key to the
+    path of a .npy file
+    """
+    if isinstance(shard, six.string_types):
+        with zipfile.ZipFile(shard) as zf:
+            names = zf.namelist()
+        keys = [name[:-len(".npy")] for name in names
+                if name.endswith(".npy")]
+        return {key: memmap_npz_member(shard, key) for key in keys}
+    else:
+        return {key: np.load(path, mmap_mode="r")
+                for key, path in shard.items()}
+
+
+class MemmapShards(object):
+
+    """
+    iterable of chunks (maps from key to array, with the same number of rows)
+    read from shards through memory maps - every iteration is one epoch over
+    all of the shards, and is meant to be used with
+    canopy.handlers.chunk_variables or prefetch_chunk_variables
+
+    chunks span shard boundaries, and only the last chunk can be smaller
+    than chunk_size
+
+    shards:
+    list of shards (see memmap_shard)
+
+    chunk_size:
+    number of rows in each chunk
+
+    batch_size:
+    if given, chunks only contain whole mini-batches (ie. the rows at the end
+    of the epoch that don't fit in a mini-batch are dropped)
+
+    shuffle_shards:
+    whether to iterate over the shards in a random order every epoch
+
+    keys:
+    keys to read from each shard (defaults to all of them)
+    """
+
+    def __init__(self,
+                 shards,
+                 chunk_size,
+                 batch_size=None,
+                 shuffle_shards=False,
+                 seed=None,
+                 keys=None):
+        if batch_size is not None:
+            assert chunk_size % batch_size == 0
+        self.shards = shards
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.shuffle_shards = shuffle_shards
+        self.rng = np.random.RandomState(seed)
+        self.keys = keys
+
+    def _shard_order(self):
+        if self.shuffle_shards:
+            return self.rng.permutation(len(self.shards))
+        else:
+            return range(len(self.shards))
+
+    def _open_shard(self, shard_idx):
+        maps = memmap_shard(self.shards[shard_idx])
+        if self.keys is not None:
+            maps = {key: maps[key] for key in self.keys}
+        num_rows = {len(m) for m in maps.values()}
+        assert len(num_rows) == 1, "arrays in shard have different lengths"
+        return maps, num_rows.pop()
+
+    def _new_chunk(self, maps):
+        # allocating new arrays for every chunk, because the inputs of
+        # chunk_variables may be cached by id
+        return {key: np.empty((self.chunk_size,) + m.shape[1:],
+                              dtype=m.dtype)
+                for key, m in maps.items()}
+
+    def _trim(self, chunk, num_rows):
+        if self.batch_size is not None:
+            num_rows -= num_rows % self.batch_size
+        if num_rows == 0:
+            return None
+        return {key: arr[:num_rows] for key, arr in chunk.items()}
+
+    def __iter__(self):
+        chunk = None
+        chunk_rows = 0
+        for shard_idx in self._shard_order():
+            maps, shard_rows = self._open_shard(shard_idx)
+            shard_offset = 0
+            while shard_offset < shard_rows:
+                if chunk is None:
+                    chunk = self._new_chunk(maps)
+                    chunk_rows = 0
+                num_rows = min(self.chunk_size - chunk_rows,
+                               shard_rows - shard_offset)
+                for key, arr in chunk.items():
+                    arr[chunk_rows:chunk_rows + num_rows] = \
+                        maps[key][shard_offset:shard_offset + num_rows]
+                chunk_rows += num_rows
+                shard_offset += num_rows
+                if chunk_rows == self.chunk_size:
+                    yield chunk
+                    chunk = None
+            # close the memory maps of the shard
+            del maps
+        if chunk is not None:
+            trimmed = self._trim(chunk, chunk_rows)
+            if trimmed is not None:
+                yield trimmed
+
+memmap_shards = MemmapShards
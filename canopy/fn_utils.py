@@ -19,6 +19,10 @@ def evaluate_until(fn,
 
     fn:
     handled_fn
+
+    gen:
+    generator of inputs to fn (see canopy.prefetch for generating them in
+    worker processes)
     """
     start_time = time.time()
     new_gen = enumerate(gen)
@@ -1,10 +1,14 @@
+import profiler
 import base
 import conditional
 import nodes
 import batch
 import fn
 import monitor
+import autotune
+import parameter_server
 
+from profiler import (Profiler)
 from base import (NetworkHandlerAPI,
                   NetworkHandlerImpl)
 from fn import (handled_fn)
@@ -12,6 +16,11 @@ from conditional import (call_after_every)
 from nodes import (with_hyperparameters,
                    override_hyperparameters)
 from batch import (chunk_variables,
+                   shuffled_chunk_variables,
+                   prefetch_chunk_variables,
                    batch_pad)
 from monitor import (time_call,
-                     time_per_row)
+                     time_per_row,
+                     profile)
+from autotune import (autotune_batch_size)
+from parameter_server import (parameter_server_sync)
@@ -0,0 +1,175 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import re
+import time
+import resource
+
+from . import base
+from . import batch
+
+
+def _reset_peak_rss():
+    """
+    resets the peak resident set size of the process (only on linux),
+    returning whether or not it was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss_bytes():
+    """
+    returns the peak resident set size of the process, in bytes
+    """
+    try:
+        with open("/proc/self/status") as f:
+            match = re.search(r"VmHWM:\s+(\d+) kB", f.read())
+        if match is not None:
+            return int(match.group(1)) * 1024
+    except (IOError, OSError):
+        pass
+    # NOTE: never reset, and in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class AutotuneBatchSize(base.NetworkHandlerImpl):
+
+    """
+    handler that tries each of the given mini-batch sizes for the
+    ChunkVariables / BatchPad handlers inside of it for the first calls,
+    measuring rows per second and peak resident set size (as well as the
+    time to rebuild for each size, which isn't printed), and then fixes the
+    fastest mini-batch size whose peak resident set size is within
+    max_rss_bytes
+
+    input_key:
+    key of an input with one row per example, to count the rows of a call
+    (the handler can also be called with an iterator of chunks, eg. for
+    PrefetchChunkVariables, in which case the rows of each chunk are counted
+    as they are consumed)
+
+    calls_per_size:
+    how many calls to measure for each mini-batch size (if more than 1, the
+    first call of each size is used for warm up and not measured)
+
+    after tuning, batch_size_ is the chosen mini-batch size and curve_ is a
+    list of measurements for each mini-batch size (see report)
+    """
+
+    def __init__(self,
+                 input_key,
+                 batch_sizes,
+                 calls_per_size=2,
+                 max_rss_bytes=None):
+        assert len(batch_sizes) > 0
+        self.input_key = input_key
+        self.batch_sizes = list(batch_sizes)
+        self.calls_per_size = calls_per_size
+        self.max_rss_bytes = max_rss_bytes
+        self.batch_size_ = None
+        self.curve_ = []
+        self._trial_idx = 0
+        self._trial_calls = 0
+        self._trial_rows = 0
+        self._trial_time = 0.0
+        self._trial_build_time = 0.0
+
+    def _batch_handlers(self):
+        handlers = []
+        handler = self._inner_handler
+        while handler is not None:
+            if isinstance(handler, (batch.ChunkVariables, batch.BatchPad)):
+                handlers.append(handler)
+            handler = getattr(handler, "_inner_handler", None)
+        return handlers
+
+    def _set_batch_size(self, state, batch_size):
+        handlers = self._batch_handlers()
+        assert handlers, "no ChunkVariables or BatchPad handlers to tune"
+        for handler in handlers:
+            handler.batch_size = batch_size
+        # recompile, since the batch size is part of the graph (without
+        # printing the build time of each trial, which is in the report
+        # instead)
+        print_times = state.print_times
+        state.print_times = False
+        start_time = time.time()
+        try:
+            self.rebuild(state)
+        finally:
+            state.print_times = print_times
+        return time.time() - start_time
+
+    def _choose(self):
+        within_cap = [m for m in self.curve_
+                      if (self.max_rss_bytes is None
+                          or m["peak_rss_bytes"] <= self.max_rss_bytes)]
+        if within_cap:
+            best = max(within_cap, key=lambda m: m["rows_per_second"])
+        else:
+            # nothing fits, so use the least memory
+            best = min(self.curve_, key=lambda m: m["peak_rss_bytes"])
+        return best["batch_size"]
+
+    def _count_rows(self, chunks, num_rows):
+        for chunk in chunks:
+            num_rows[0] += len(chunk[self.input_key])
+            yield chunk
+
+    def report(self):
+        """
+        returns a table of the measurements for each mini-batch size
+        """
+        lines = ["batch_size\trows_per_second\tpeak_rss_mb\tbuild_s"]
+        for m in self.curve_:
+            lines.append("%d\t%0.1f\t%0.1f\t%0.2f" % (
+                m["batch_size"],
+                m["rows_per_second"],
+                m["peak_rss_bytes"] / 2 ** 20,
+                m["build_time"]))
+        return "\n".join(lines)
+
+    def __call__(self, state, in_dict, *args, **kwargs):
+        if self.batch_size_ is not None:
+            return self._inner_handler(state, in_dict, *args, **kwargs)
+
+        batch_size = self.batch_sizes[self._trial_idx]
+        if self._trial_calls == 0:
+            self._trial_build_time = self._set_batch_size(state, batch_size)
+            _reset_peak_rss()
+
+        if isinstance(in_dict, dict):
+            num_rows = [len(in_dict[self.input_key])]
+        else:
+            num_rows = [0]
+            in_dict = self._count_rows(in_dict, num_rows)
+        start_time = time.time()
+        res = self._inner_handler(state, in_dict, *args, **kwargs)
+        total_time = time.time() - start_time
+        if self._trial_calls > 0 or self.calls_per_size == 1:
+            self._trial_rows += num_rows[0]
+            self._trial_time += total_time
+        self._trial_calls += 1
+
+        if self._trial_calls == self.calls_per_size:
+            self.curve_.append(dict(
+                batch_size=batch_size,
+                rows_per_second=self._trial_rows / self._trial_time,
+                peak_rss_bytes=peak_rss_bytes(),
+                build_time=self._trial_build_time,
+            ))
+            self._trial_idx += 1
+            self._trial_calls = 0
+            self._trial_rows = 0
+            self._trial_time = 0.0
+            if self._trial_idx == len(self.batch_sizes):
+                self.batch_size_ = self._choose()
+                self._set_batch_size(state, self.batch_size_)
+        return res
+
+autotune_batch_size = AutotuneBatchSize
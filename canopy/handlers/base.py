@@ -9,6 +9,10 @@ import collections
 
 import six
 
+# titles of spans that are printed when they end (one-off events, as opposed
+# to spans on every call)
+PRINTED_TITLES = ("build", "compile_function", "network_compile")
+
 
 class NetworkHandlerAPI(six.with_metaclass(abc.ABCMeta, object)):
 
@@ -121,8 +125,20 @@ class FinalHandler(NetworkHandlerImpl):
 
 class _HandledFunctionState(object):
 
+    """
+    profiler:
+    optional Profiler that records nested spans of all calls to time (set by
+    the canopy.handlers.profile handler)
+
+    print_times:
+    whether or not to print the times of one-off events (see
+    PRINTED_TITLES), eg. handlers that rebuild repeatedly can turn it off
+    """
+
     def __init__(self, initial_network):
         self.initial_network = initial_network
+        self.profiler = None
+        self.print_times = True
         self.time_total = collections.defaultdict(lambda: 0)
         self.time_count = collections.defaultdict(lambda: 0)
 
@@ -141,11 +157,33 @@ class _HandledFunctionState(object):
 
     @contextlib.contextmanager
     def time(self, title):
+        profiler = self.profiler
+        if profiler is None:
+            start_time = time.time()
+            yield
+            self._add_time(title, time.time() - start_time)
+            return
+        path = profiler.push(title)
         start_time = time.time()
-        yield
-        total_time = time.time() - start_time
+        try:
+            yield
+        finally:
+            total_time = time.time() - start_time
+            profiler.pop(path, start_time, total_time)
+            self._add_time(title, total_time)
+
+    def record_time(self, title, total_time):
+        """
+        records time that was measured without the time context manager
+        (eg. on a background thread), as a span nested in the current span
+        """
+        if self.profiler is not None:
+            path = self.profiler.current_path() + (title,)
+            self.profiler.record(path, time.time() - total_time, total_time)
+        self._add_time(title, total_time)
+
+    def _add_time(self, title, total_time):
         self.time_total[title] += total_time
         self.time_count[title] += 1
-        # TODO figure out right way to print network info
-        if title != "network_call":
+        if self.print_times and title in PRINTED_TITLES:
             print("%s took %0.4fs" % (title, total_time))
@@ -1,15 +1,238 @@
 from __future__ import division, absolute_import
 from __future__ import print_function, unicode_literals
 
+import sys
+import time
+import hashlib
+import weakref
+import threading
+import contextlib
+import collections
 
+import six
 import numpy as np
-import theano
 import theano.tensor as T
+from theano.ifelse import ifelse
 import treeano
 
 from . import base
 
 
+class ResidentCache(object):
+
+    """
+    keeps track of which input arrays are resident in the shared variables of
+    ChunkVariables handlers, so that they don't need to be transferred again,
+    and frees the least recently used ones once more than max_bytes are
+    resident
+
+    a single cache can be shared by multiple handlers (by default, all
+    handlers share RESIDENT_CACHE), so that the budget is across all of them
+
+    shared variables in use by a call are pinned (see pinned), so that they
+    aren't evicted before the call is done with them, even if the inputs of
+    the call are over budget
+    """
+
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        # map from shared variable to (key, weakref to value or None, nbytes)
+        # in least recently used order
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.pinned_shared = set()
+
+    @contextlib.contextmanager
+    def pinned(self, shared_vars):
+        """
+        context manager that keeps the given shared variables from being
+        evicted, and evicts values over budget once it exits
+        """
+        shared_vars = set(shared_vars) - self.pinned_shared
+        self.pinned_shared.update(shared_vars)
+        try:
+            yield
+        finally:
+            self.pinned_shared.difference_update(shared_vars)
+            self.evict()
+
+    def is_resident(self, shared, key, value):
+        if shared not in self.entries:
+            return False
+        entry_key, ref, _ = self.entries[shared]
+        if entry_key != key:
+            return False
+        # ids can be reused after an array is garbage collected
+        if ref is not None and ref() is not value:
+            return False
+        # mark as recently used
+        self.entries[shared] = self.entries.pop(shared)
+        return True
+
+    def set_value(self, shared, key, value, weak=False):
+        """
+        transfers value into the shared variable, unless it is already
+        resident there, and returns whether or not a transfer happened
+
+        key:
+        identifies the value, or None if the value shouldn't stay resident
+        """
+        if key is not None and self.is_resident(shared, key, value):
+            return False
+        self._remove(shared)
+        shared.set_value(value)
+        if key is not None and value.nbytes <= self.max_bytes:
+            ref = weakref.ref(value) if weak else None
+            self.entries[shared] = (key, ref, value.nbytes)
+            self.total_bytes += value.nbytes
+            self.evict()
+        return True
+
+    def _remove(self, shared):
+        if shared in self.entries:
+            _, _, nbytes = self.entries.pop(shared)
+            self.total_bytes -= nbytes
+
+    def release(self, shared):
+        """
+        frees the memory of the shared variable, even if its value is
+        resident (eg. when the shared variable won't be used anymore)
+        """
+        self._remove(shared)
+        _free_shared(shared)
+
+    def free(self, shared):
+        """
+        frees the memory of the shared variable, unless its value is
+        resident
+        """
+        if shared not in self.entries:
+            _free_shared(shared)
+
+    def evict(self):
+        """
+        frees least recently used values that aren't pinned until at most
+        max_bytes are resident (or only pinned values are left)
+        """
+        for shared in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if shared in self.pinned_shared:
+                continue
+            self._remove(shared)
+            _free_shared(shared)
+
+    def clear(self):
+        for shared in list(self.entries):
+            self._remove(shared)
+            _free_shared(shared)
+
+
+def _free_shared(shared):
+    shared.set_value(np.zeros([0] * shared.ndim, dtype=shared.dtype))
+
+
+RESIDENT_CACHE = ResidentCache()
+
+
+def _cache_key(cache, value):
+    if cache == "id":
+        return id(value)
+    elif cache == "hash":
+        # include dtype and shape, since they aren't part of the bytes
+        h = hashlib.sha1(np.ascontiguousarray(value).view(np.uint8))
+        return (value.dtype.str, value.shape, h.hexdigest())
+    else:
+        raise ValueError("Unknown cache mode: %s" % cache)
+
+
+class OutputAssembler(object):
+
+    """
+    assembles the outputs of mini-batches by writing array outputs into
+    preallocated arrays (instead of concatenating them at the end) and
+    merging scalar outputs
+
+    array outputs whose shape doesn't match the number of rows of each
+    mini-batch are concatenated instead
+    """
+
+    def __init__(self, scalar_merge):
+        self.scalar_merge = scalar_merge
+        self.capacity = 0
+        self.num_rows = 0
+        self.arrays = {}
+        self.concat_outputs = {}
+        self.scalars = {}
+        self.batch_rows = []
+
+    def reserve(self, num_rows):
+        """
+        makes sure that there is space for num_rows more rows, growing
+        geometrically if necessary
+        """
+        needed = self.num_rows + num_rows
+        if needed <= self.capacity:
+            return
+        new_capacity = max(needed, 2 * self.capacity)
+        for key, arr in self.arrays.items():
+            new_arr = np.empty((new_capacity,) + arr.shape[1:],
+                               dtype=arr.dtype)
+            new_arr[:self.num_rows] = arr[:self.num_rows]
+            self.arrays[key] = new_arr
+        self.capacity = new_capacity
+
+    def add(self, result, num_rows):
+        self.reserve(num_rows)
+        start = self.num_rows
+        stop = start + num_rows
+        for key, value in result.items():
+            if not value.shape:
+                self.scalars.setdefault(key, []).append(value)
+            elif key in self.concat_outputs:
+                self.concat_outputs[key].append(value)
+            elif key in self.arrays:
+                arr = self.arrays[key]
+                if value.shape == (num_rows,) + arr.shape[1:]:
+                    arr[start:stop] = value
+                else:
+                    # eg. an output whose first dimension happened to match
+                    # the size of the previous mini-batches
+                    self.concat_outputs[key] = [arr[:start].copy(), value]
+                    del self.arrays[key]
+            elif value.shape[0] == num_rows and start == 0:
+                arr = np.empty((self.capacity,) + value.shape[1:],
+                               dtype=value.dtype)
+                arr[start:stop] = value
+                self.arrays[key] = arr
+            else:
+                self.concat_outputs[key] = [value]
+        self.batch_rows.append(num_rows)
+        self.num_rows = stop
+
+    def merge(self):
+        assert self.batch_rows, "no mini-batches"
+        res = {}
+        for key, arr in self.arrays.items():
+            # a view, to avoid copying
+            res[key] = arr[:self.num_rows]
+        for key, outputs in self.concat_outputs.items():
+            res[key] = np.concatenate(outputs)
+        for key, outputs in self.scalars.items():
+            if self.scalar_merge == "mean":
+                # weighting by the number of rows, since the last mini-batch
+                # can be smaller
+                merged = np.average(np.array(outputs),
+                                    weights=self.batch_rows)
+                dtype = outputs[0].dtype
+                if np.issubdtype(dtype, np.floating):
+                    merged = dtype.type(merged)
+                res[key] = merged
+            else:
+                res[key] = self.scalar_merge(outputs)
+        return res
+
+
 class ChunkVariables(base.NetworkHandlerImpl):
 
     """
@@ -20,13 +243,24 @@ class ChunkVariables(base.NetworkHandlerImpl):
 
     scalar_merge:
     how scalar outputs should be merged together
+    possible values: "mean" (weighted by the number of rows of each
+    mini-batch), "identity", or a function from a list of outputs
 
     cache:
     how to cache inputs for transfer to the GPU
-    possible values: "id", "hash"
+    possible values: None (default), "id", "hash"
     use case: datasets that fit in memory can be much more efficient because
     we don't need to send it to the GPU repeatedly
-    TODO implement
+    - None = inputs are transferred on every call and freed afterwards
+    - "id" = an input stays resident after the call (until evicted by the
+      resident_cache) while the same array object is passed in
+      (NOTE: in-place modifications of the array are not detected)
+    - "hash" = an input stays resident after the call (until evicted by the
+      resident_cache) while an array with the same contents is passed in
+
+    resident_cache:
+    ResidentCache that bounds the memory used by resident inputs (defaults
+    to RESIDENT_CACHE, which is shared by all handlers)
     """
 
     BATCH_IDX_KEY = "batch_idx"
@@ -35,18 +269,20 @@ class ChunkVariables(base.NetworkHandlerImpl):
                  batch_size,
                  variables,
                  scalar_merge="mean",
-                 cache="id",
-                 strict_size=True):
+                 cache=None,
+                 strict_size=True,
+                 resident_cache=None):
         # TODO figure out serialization of theano vars
         self.variables = variables
         self.batch_size = batch_size
-        if scalar_merge == "mean":
-            scalar_merge = np.mean
-        elif scalar_merge == "identity":
+        if scalar_merge == "identity":
             scalar_merge = treeano.utils.identity
         self.scalar_merge = scalar_merge
-        # TODO actually use cache
+        assert cache in {"id", "hash", None}
         self.cache = cache
+        if resident_cache is None:
+            resident_cache = RESIDENT_CACHE
+        self.resident_cache = resident_cache
         self.strict_size = strict_size
 
     def transform_compile_function_kwargs(self, state, **kwargs):
@@ -63,6 +299,10 @@ class ChunkVariables(base.NetworkHandlerImpl):
         elif isinstance(givens, (list, tuple)):
             new_givens = list(givens)
 
+        if hasattr(self, "key_to_shared_"):
+            # recompiling, so the previous shared variables won't be used
+            for shared in self.key_to_shared_.values():
+                self.resident_cache.release(shared)
         self.idx_var_ = T.iscalar('batch_idx')
         self.key_to_shared_ = {}
         new_inputs = dict(inputs)
@@ -78,10 +318,7 @@ class ChunkVariables(base.NetworkHandlerImpl):
                     dtype=v.dtype,
                 )
                 # create givens for variable
-                idx_slice = slice(self.idx_var_ * self.batch_size,
-                                  (self.idx_var_ + 1) * self.batch_size)
-                batch_value = shared_var[idx_slice]
-                new_givens.append((input_var, batch_value))
+                new_givens.append((input_var, self._batch_value(shared_var)))
                 # store shared variable
                 self.key_to_shared_[input_key] = shared_var
 
@@ -89,7 +326,22 @@ class ChunkVariables(base.NetworkHandlerImpl):
         kwargs["givens"] = new_givens
         return kwargs
 
+    def _batch_value(self, shared_var):
+        """
+        returns the current mini-batch of a chunk in a shared variable
+        """
+        idx_slice = slice(self.idx_var_ * self.batch_size,
+                          (self.idx_var_ + 1) * self.batch_size)
+        return shared_var[idx_slice]
+
     def __call__(self, state, in_dict, *args, **kwargs):
+        # the inputs of this call can't be evicted before it is done with
+        # them (eg. when the inputs together are over budget)
+        with self.resident_cache.pinned(self.key_to_shared_.values()):
+            return self._transfer_and_evaluate(state, in_dict, *args,
+                                               **kwargs)
+
+    def _transfer_and_evaluate(self, state, in_dict, *args, **kwargs):
         # set shared variables, and keep the non-chunked variables
         chunk_size = None
         # make a copy, since we are mutating it
@@ -104,32 +356,272 @@ class ChunkVariables(base.NetworkHandlerImpl):
                 if self.strict_size:
                     # error if chunk size not a multiple of batch size
                     assert (chunk_size % self.batch_size) == 0
-                shared.set_value(input_val)
+                if self.cache is None:
+                    shared.set_value(input_val)
+                elif not isinstance(input_val, np.ndarray):
+                    # only arrays can be cached
+                    self.resident_cache.set_value(shared, None, input_val)
+                else:
+                    self.resident_cache.set_value(
+                        shared,
+                        _cache_key(self.cache, input_val),
+                        input_val,
+                        weak=(self.cache == "id"))
         assert chunk_size is not None
 
         # call function multiple times
-        # TODO maybe factor this out
-        results = []
+        assembler = OutputAssembler(self.scalar_merge)
+        assembler.reserve(chunk_size)
+        self._evaluate_chunk(state, assembler, chunk_size, in_dict,
+                             *args, **kwargs)
+        res = assembler.merge()
+        # free memory of inputs that aren't resident
+        with state.time("data_free"):
+            for shared in self.key_to_shared_.values():
+                if self.cache is None:
+                    _free_shared(shared)
+                else:
+                    self.resident_cache.free(shared)
+        return res
+
+    def _evaluate_chunk(self, state, assembler, chunk_size, in_dict,
+                        *args, **kwargs):
+        """
+        evaluates each mini-batch of the chunk currently in the shared
+        variables, and adds the outputs to the assembler
+        """
         for i in range(int(np.ceil(chunk_size / self.batch_size))):
             in_dict[self.BATCH_IDX_KEY] = i
             result = self._inner_handler(state, in_dict, *args, **kwargs)
-            results.append(result)
-        res = {}
-        for key in results[0].keys():  # assumes at least 1 batch
-            outputs = [r[key] for r in results]
-            if outputs[0].shape:
-                res[key] = np.concatenate(outputs)
+            num_rows = min(self.batch_size, chunk_size - i * self.batch_size)
+            assembler.add(result, num_rows)
+
+chunk_variables = ChunkVariables
+
+
+class ShuffledChunkVariables(ChunkVariables):
+
+    """
+    like ChunkVariables, but evaluates the mini-batches of each chunk in a
+    new random order on every call, by gathering the rows of each mini-batch
+    through a permutation index in a shared variable
+
+    since the chunk stays resident (cache defaults to "id", see
+    ChunkVariables), only the permutation is transferred for each epoch,
+    instead of the whole shuffled dataset
+
+    array outputs with a row per example of the chunk are returned in the
+    original order of the rows (ie. row i of the output corresponds to row i
+    of the input)
+
+    seed:
+    seed for the random permutations
+    """
+
+    def __init__(self,
+                 batch_size,
+                 variables,
+                 scalar_merge="mean",
+                 cache="id",
+                 strict_size=True,
+                 resident_cache=None,
+                 seed=None):
+        super(ShuffledChunkVariables, self).__init__(
+            batch_size=batch_size,
+            variables=variables,
+            scalar_merge=scalar_merge,
+            cache=cache,
+            strict_size=strict_size,
+            resident_cache=resident_cache)
+        self.rng = np.random.RandomState(seed)
+
+    def transform_compile_function_kwargs(self, state, **kwargs):
+        self.permutation_ = treeano.utils.shared_empty(ndim=1,
+                                                       dtype="int32")
+        return super(ShuffledChunkVariables,
+                     self).transform_compile_function_kwargs(state, **kwargs)
+
+    def _batch_value(self, shared_var):
+        idx_slice = slice(self.idx_var_ * self.batch_size,
+                          (self.idx_var_ + 1) * self.batch_size)
+        return shared_var[self.permutation_[idx_slice]]
+
+    def __call__(self, state, in_dict, *args, **kwargs):
+        input_key = next(iter(self.key_to_shared_))
+        chunk_size = len(in_dict[input_key])
+        permutation = self.rng.permutation(chunk_size).astype("int32")
+        with state.time("permutation_transfer"):
+            self.permutation_.set_value(permutation)
+        res = super(ShuffledChunkVariables, self).__call__(
+            state, in_dict, *args, **kwargs)
+        # row j of the outputs is for row permutation[j] of the inputs
+        inverse = np.argsort(permutation)
+        for key, value in res.items():
+            if (getattr(value, "ndim", 0) > 0
+                    and value.shape[0] == chunk_size):
+                res[key] = value[inverse]
+        return res
+
+shuffled_chunk_variables = ShuffledChunkVariables
+
+
+class PrefetchChunkVariables(ChunkVariables):
+
+    """
+    like ChunkVariables, but called with an iterator of chunks (maps from
+    input key to value) instead of a single chunk, and returns the merged
+    results of all of them
+
+    there are 2 sets of shared variables: while the mini-batches of one chunk
+    are evaluated, the next chunk is generated and transferred into the other
+    set on a background thread
+
+    the time spent loading chunks in the background, waiting for them, and
+    the overlap between the two are recorded in state.time_total as
+    "prefetch_load", "prefetch_wait", and "prefetch_overlap"
+    """
+
+    BUFFER_IDX_KEY = "buffer_idx"
+
+    def __init__(self,
+                 batch_size,
+                 variables,
+                 scalar_merge="mean",
+                 strict_size=True):
+        super(PrefetchChunkVariables, self).__init__(
+            batch_size=batch_size,
+            variables=variables,
+            scalar_merge=scalar_merge,
+            cache=None,
+            strict_size=strict_size)
+
+    def transform_compile_function_kwargs(self, state, **kwargs):
+        inputs = kwargs["inputs"]
+        givens = kwargs.get("givens")
+
+        assert isinstance(inputs, dict)
+        assert self.BATCH_IDX_KEY not in inputs
+        assert self.BUFFER_IDX_KEY not in inputs
+
+        if givens is None:
+            new_givens = []
+        elif isinstance(givens, dict):
+            new_givens = list(givens.items())
+        elif isinstance(givens, (list, tuple)):
+            new_givens = list(givens)
+
+        self.idx_var_ = T.iscalar('batch_idx')
+        self.buffer_idx_var_ = T.iscalar('buffer_idx')
+        # one map from key to shared variable for each buffer
+        self.buffers_ = [{}, {}]
+        new_inputs = dict(inputs)
+        new_inputs[self.BATCH_IDX_KEY] = self.idx_var_
+        new_inputs[self.BUFFER_IDX_KEY] = self.buffer_idx_var_
+        for input_key, input_var in inputs.items():
+            if input_var in self.variables:
+                # remove key from inputs
+                new_inputs.pop(input_key)
+                # create shared variables
+                v = state.network.network_variable(input_var)
+                shared_vars = [treeano.utils.shared_empty(ndim=v.ndim,
+                                                          dtype=v.dtype)
+                               for _ in self.buffers_]
+                # create givens for variable, lazily reading from the
+                # current buffer
+                idx_slice = slice(self.idx_var_ * self.batch_size,
+                                  (self.idx_var_ + 1) * self.batch_size)
+                batch_value = ifelse(T.eq(self.buffer_idx_var_, 0),
+                                     shared_vars[0][idx_slice],
+                                     shared_vars[1][idx_slice])
+                new_givens.append((input_var, batch_value))
+                # store shared variables
+                for buffer_, shared_var in zip(self.buffers_, shared_vars):
+                    buffer_[input_key] = shared_var
+
+        kwargs["inputs"] = new_inputs
+        kwargs["givens"] = new_givens
+        return kwargs
+
+    def _load_chunk(self, chunk, key_to_shared):
+        """
+        transfers a chunk into the given shared variables, and returns the
+        chunk size and the remaining (non-chunked) inputs
+        """
+        chunk_size = None
+        # make a copy, since we are mutating it
+        in_dict = dict(chunk)
+        for input_key, shared in key_to_shared.items():
+            input_val = in_dict.pop(input_key)
+            if chunk_size is None:
+                chunk_size = len(input_val)
             else:
-                res[key] = self.scalar_merge(outputs)
+                assert len(input_val) == chunk_size
+            if self.strict_size:
+                # error if chunk size not a multiple of batch size
+                assert (chunk_size % self.batch_size) == 0
+            shared.set_value(input_val)
+        assert chunk_size is not None
+        return chunk_size, in_dict
+
+    def _start_load(self, chunks, buffer_idx):
+        """
+        starts loading the next chunk into the given buffer on a background
+        thread
+        """
+        loaded = {}
+
+        def load():
+            start_time = time.time()
+            try:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    loaded["chunk"] = self._load_chunk(
+                        chunk,
+                        self.buffers_[buffer_idx])
+            except Exception:
+                loaded["exc_info"] = sys.exc_info()
+            loaded["time"] = time.time() - start_time
+
+        thread = threading.Thread(target=load)
+        thread.daemon = True
+        thread.start()
+        return thread, loaded
+
+    def __call__(self, state, chunks, *args, **kwargs):
+        chunks = iter(chunks)
+        assembler = OutputAssembler(self.scalar_merge)
+        buffer_idx = 0
+        thread, loaded = self._start_load(chunks, buffer_idx)
+        while True:
+            wait_start_time = time.time()
+            thread.join()
+            wait_time = time.time() - wait_start_time
+            if "exc_info" in loaded:
+                six.reraise(*loaded["exc_info"])
+            if "chunk" not in loaded:
+                # no more chunks
+                break
+            state.record_time("prefetch_load", loaded["time"])
+            state.record_time("prefetch_wait", wait_time)
+            state.record_time("prefetch_overlap",
+                              max(0, loaded["time"] - wait_time))
+            chunk_size, in_dict = loaded["chunk"]
+            # load the next chunk into the other buffer while this one is
+            # being evaluated
+            thread, loaded = self._start_load(chunks, 1 - buffer_idx)
+            in_dict[self.BUFFER_IDX_KEY] = buffer_idx
+            self._evaluate_chunk(state, assembler, chunk_size, in_dict,
+                                 *args, **kwargs)
+            buffer_idx = 1 - buffer_idx
+        res = assembler.merge()
         # free memory
-        # may be inefficient if not necessary
         with state.time("data_free"):
-            for shared in self.key_to_shared_.values():
-                shared.set_value(np.zeros([0] * shared.ndim,
-                                          dtype=shared.dtype))
+            for buffer_ in self.buffers_:
+                for shared in buffer_.values():
+                    _free_shared(shared)
         return res
 
-chunk_variables = ChunkVariables
+prefetch_chunk_variables = PrefetchChunkVariables
 
 
 class BatchPad(base.NetworkHandlerImpl):
@@ -1,3 +1,6 @@
+import time
+import functools
+
 from . import base
 
 
@@ -51,13 +54,51 @@ class ReturnDict(base.NetworkHandlerImpl):
 return_dict = ReturnDict
 
 
+def _defining_class(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass
+
+
+def _flatten_handlers(state, handlers, final_fn):
+    """
+    composes the calls of the given handlers (from outermost to innermost)
+    around final_fn once, so that calling the result doesn't create a
+    closure per handler
+
+    handlers that don't override __call__ or call are skipped, and handlers
+    that override __call__ are called as usual (with the rest of the chain
+    not being flattened)
+    """
+    fn = final_fn
+    for handler in reversed(handlers):
+        cls = handler.__class__
+        call_cls = _defining_class(cls, "__call__")
+        if call_cls is not base.NetworkHandlerImpl:
+            fn = functools.partial(handler.__call__, state)
+        elif _defining_class(cls, "call") is not base.NetworkHandlerImpl:
+            fn = functools.partial(handler.call, fn)
+    return fn
+
+
 class _HandledFunction(object):
 
     """
     class that stores handler-chain wide state
+
+    flatten:
+    whether or not to precompute the chain of handler calls once, to reduce
+    per-call overhead (eg. for latency sensitive inference with small
+    batches)
     """
 
-    def __init__(self, network, handlers, inputs, outputs=None, **kwargs):
+    def __init__(self,
+                 network,
+                 handlers,
+                 inputs,
+                 outputs=None,
+                 flatten=False,
+                 **kwargs):
         self.network = network
         self.handlers = handlers + [call_with_dict(),
                                     return_dict(),
@@ -74,8 +115,27 @@ class _HandledFunction(object):
                                      inputs=inputs,
                                      outputs=outputs,
                                      **kwargs)
+        if flatten:
+            # the last 3 handlers are replaced by _flat_final_call
+            self._call = _flatten_handlers(self.state,
+                                           self.handlers[:-3],
+                                           self._flat_final_call)
+        else:
+            self._call = functools.partial(self.outermost, self.state)
+
+    def _flat_final_call(self, in_dict, **kwargs):
+        """
+        equivalent to calling call_with_dict, return_dict and FinalHandler,
+        without the intermediate calls
+        """
+        call_with_dict_handler, return_dict_handler = self.handlers[-3:-1]
+        args = [in_dict[k] for k in call_with_dict_handler.input_key_order_]
+        start_time = time.time()
+        res = self.state.fn(*args, **kwargs)
+        self.state.record_time("network_call", time.time() - start_time)
+        return dict(zip(return_dict_handler.output_key_order_, res))
 
     def __call__(self, *args, **kwargs):
-        return self.outermost(self.state, *args, **kwargs)
+        return self._call(*args, **kwargs)
 
 handled_fn = _HandledFunction
@@ -1,6 +1,7 @@
 import time
 
 from . import base
+from .profiler import Profiler
 
 
 class TimeCall(base.NetworkHandlerImpl):
@@ -45,3 +46,34 @@ class TimePerRow(base.NetworkHandlerImpl):
         return res
 
 time_per_row = TimePerRow
+
+
+class Profile(base.NetworkHandlerImpl):
+
+    """
+    handler that records the time of the inner handler call as a span in a
+    canopy.handlers.profiler.Profiler, along with all other timed sections
+    inside of it (eg. "network_call" or "data_transfer")
+
+    spans are only recorded by functions with this handler, and the handler
+    can be placed at several depths to record nested spans, eg.
+    [profile(), chunk_variables(...), profile("minibatch")] - inner profile
+    handlers record into the profiler of the outermost one
+
+    profiler:
+    optional Profiler (eg. to share one between functions)
+    """
+
+    def __init__(self, title="call", profiler=None):
+        if profiler is None:
+            profiler = Profiler()
+        self.title = title
+        self.profiler = profiler
+
+    def __call__(self, state, *args, **kwargs):
+        if state.profiler is None:
+            state.profiler = self.profiler
+        with state.time(self.title):
+            return self._inner_handler(state, *args, **kwargs)
+
+profile = Profile
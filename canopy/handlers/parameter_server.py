@@ -0,0 +1,110 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+
+from . import base
+from .. import network_utils
+from .. import parameter_server
+
+
+class ParameterServerSync(base.NetworkHandlerImpl):
+
+    """
+    handler that synchronizes the shared variables of the network with a
+    canopy.parameter_server.ParameterServer: pulling the values from the
+    server before a call, and pushing the change of the values during the
+    call (eg. the updates of a training function) afterwards
+
+    NOTE: this handler should be the outermost one, since it pushes every
+    change of the shared variables during its inner call - eg. a chunk of
+    several mini-batch updates is pushed as one delta. every call copies
+    all shared variables before the inner call and diffs them afterwards
+    (regardless of pull_every), which costs a few passes over the
+    parameters per call
+
+    pull_every:
+    how many calls to make between pulls of fresh values (the values are
+    also pulled when the server rejects a push as too stale)
+
+    compression:
+    one of canopy.parameter_server.COMPRESSIONS - the part of each delta
+    lost to compression is kept and added to the next delta (ie. error
+    feedback), so that small updates aren't lost
+    """
+
+    def __init__(self,
+                 address,
+                 authkey=None,
+                 pull_every=1,
+                 compression=None,
+                 top_k_fraction=0.01):
+        assert compression in parameter_server.COMPRESSIONS
+        self.address = address
+        self.authkey = authkey
+        self.pull_every = pull_every
+        self.compression = compression
+        self.top_k_fraction = top_k_fraction
+        self._client = None
+        self._version = None
+        self._calls_since_pull = 0
+        self._residuals = {}
+        self.bytes_pushed = 0
+        self.num_rejected = 0
+
+    def transform_network(self, network):
+        self._shared_dict = network_utils.to_shared_dict(network)
+        return network
+
+    def _pull(self, shared_dict):
+        self._version, values = self._client.pull()
+        for k, value in values.items():
+            shared_dict[k].set_value(value)
+        self._calls_since_pull = 0
+
+    def _compress(self, k, delta):
+        if self.compression is None:
+            return parameter_server.compress(delta)
+        if k in self._residuals:
+            delta = delta + self._residuals[k]
+        compressed = parameter_server.compress(delta,
+                                               self.compression,
+                                               self.top_k_fraction)
+        self._residuals[k] = delta - parameter_server.decompress(compressed,
+                                                                 delta.dtype)
+        return compressed
+
+    def call(self, fn, *args, **kwargs):
+        shared_dict = self._shared_dict
+        if self._client is None:
+            # connecting lazily, so that the function can be created before
+            # forking worker processes
+            self._client = parameter_server.ParameterServerClient(
+                self.address, self.authkey)
+            self._pull(shared_dict)
+        elif self._calls_since_pull >= self.pull_every:
+            self._pull(shared_dict)
+
+        before = {k: shared.get_value() for k, shared in shared_dict.items()}
+        res = fn(*args, **kwargs)
+        deltas = {}
+        for k, shared in shared_dict.items():
+            delta = shared.get_value(borrow=True) - before[k]
+            if np.any(delta) or k in self._residuals:
+                deltas[k] = self._compress(k, delta)
+                self.bytes_pushed += parameter_server.compressed_nbytes(
+                    deltas[k])
+        accepted, version = self._client.push(self._version, deltas)
+        self._calls_since_pull += 1
+        if accepted:
+            # the local values include this push, but not the pushes of
+            # other workers since the last pull
+            self._version += 1
+        else:
+            self.num_rejected += 1
+            # the deltas weren't applied, so the next call needs fresh values
+            self._calls_since_pull = self.pull_every
+            self._residuals = {}
+        return res
+
+parameter_server_sync = ParameterServerSync
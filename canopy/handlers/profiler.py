@@ -0,0 +1,177 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import os
+import math
+import json
+import time
+import threading
+import contextlib
+import collections
+
+# ratio between the bounds of consecutive histogram buckets (ie. latency
+# percentiles are accurate to within ~10%)
+BUCKET_RATIO = 1.1
+_LOG_BUCKET_RATIO = math.log(BUCKET_RATIO)
+
+
+class LatencyHistogram(object):
+
+    """
+    histogram of latencies with logarithmically sized buckets, so that
+    adding a latency is constant time and memory doesn't grow with the
+    number of latencies
+    """
+
+    def __init__(self):
+        self.buckets = collections.defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if latency < self.min:
+            self.min = latency
+        if latency > self.max:
+            self.max = latency
+        bucket = int(math.floor(math.log(max(latency, 1e-9))
+                                / _LOG_BUCKET_RATIO))
+        self.buckets[bucket] += 1
+
+    def percentile(self, q):
+        """
+        returns an estimate of the q-th percentile (0 <= q <= 100)
+        """
+        if self.count == 0:
+            return float("nan")
+        target = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                # geometric middle of the bucket
+                estimate = BUCKET_RATIO ** (bucket + 0.5)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float("nan")
+
+
+class Profiler(object):
+
+    """
+    records nested spans of time (eg. handler -> chunk -> minibatch ->
+    theano call), keeping a latency histogram for each path of nested span
+    titles, and optionally a bounded trace of individual spans that can be
+    exported in the chrome trace event format (chrome://tracing)
+
+    spans are nested per thread
+
+    record_trace:
+    whether or not to keep individual spans (for export_chrome_trace), in
+    addition to the histograms
+    """
+
+    def __init__(self, record_trace=False, max_trace_events=100000):
+        self.record_trace = record_trace
+        # map from tuple of span titles to histogram
+        self.histograms = collections.OrderedDict()
+        self.trace_events = collections.deque(maxlen=max_trace_events)
+        self.start_time = time.time()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def push(self, title):
+        """
+        starts a span nested in the current span of the thread, and returns
+        its path
+        """
+        stack = self._stack()
+        if stack:
+            path = stack[-1] + (title,)
+        else:
+            path = (title,)
+        stack.append(path)
+        return path
+
+    def pop(self, path, start_time, total_time):
+        """
+        ends the current span of the thread
+        """
+        popped = self._stack().pop()
+        assert popped == path
+        self.record(path, start_time, total_time)
+
+    def current_path(self):
+        stack = self._stack()
+        return stack[-1] if stack else ()
+
+    def record(self, path, start_time, total_time):
+        histogram = self.histograms.get(path)
+        if histogram is None:
+            histogram = self.histograms[path] = LatencyHistogram()
+        histogram.add(total_time)
+        if self.record_trace:
+            self.trace_events.append((path,
+                                      start_time,
+                                      total_time,
+                                      threading.current_thread().ident))
+
+    @contextlib.contextmanager
+    def span(self, title):
+        path = self.push(title)
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.pop(path, start_time, time.time() - start_time)
+
+    def summary(self):
+        """
+        returns a tab-separated table of the latencies of each span path,
+        in milliseconds
+        """
+        lines = ["\t".join(["span", "count", "total_s", "mean_ms", "p50_ms",
+                            "p95_ms", "p99_ms"])]
+        for path, histogram in self.histograms.items():
+            lines.append("%s\t%d\t%0.4f\t%0.4f\t%0.4f\t%0.4f\t%0.4f" % (
+                "/".join(path),
+                histogram.count,
+                histogram.total,
+                1000 * histogram.mean,
+                1000 * histogram.percentile(50),
+                1000 * histogram.percentile(95),
+                1000 * histogram.percentile(99)))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+        returns the recorded spans in the chrome trace event format
+        """
+        pid = os.getpid()
+        events = []
+        for path, start_time, total_time, tid in self.trace_events:
+            events.append(dict(
+                name=path[-1],
+                ph="X",
+                ts=1e6 * (start_time - self.start_time),
+                dur=1e6 * total_time,
+                pid=pid,
+                tid=tid,
+                args=dict(path="/".join(path)),
+            ))
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def export_chrome_trace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,67 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+import treeano
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_autotune_batch_size():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 2)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: x.shape[0].astype(fX) + x),
+                      shape_fn=(lambda s: s))]
+    ).network()
+
+    autotune = canopy.handlers.autotune_batch_size("x", [2, 3, 6])
+    fn = canopy.handlers.handled_fn(
+        network,
+        [autotune,
+         canopy.handlers.chunk_variables(3, ["i"])],
+        {"x": "i"},
+        {"out": "seq"})
+    x = np.zeros((18, 2), dtype=fX)
+    for _ in range(6):
+        res = fn({"x": x})
+        # the output depends on the batch size being tried
+        batch_size = res["out"][0, 0]
+        nt.assert_in(batch_size, [2, 3, 6])
+    nt.assert_equal([m["batch_size"] for m in autotune.curve_], [2, 3, 6])
+    nt.assert_in(autotune.batch_size_, [2, 3, 6])
+    for m in autotune.curve_:
+        nt.assert_greater_equal(m["build_time"], 0)
+    nt.assert_true(fn.state.print_times)
+    res = fn({"x": x})
+    np.testing.assert_equal(res["out"],
+                            np.ones((18, 2), dtype=fX) * autotune.batch_size_)
+
+
+def test_autotune_batch_size_prefetch():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 2)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: x.shape[0].astype(fX) + x),
+                      shape_fn=(lambda s: s))]
+    ).network()
+
+    autotune = canopy.handlers.autotune_batch_size("x", [2, 3])
+    fn = canopy.handlers.handled_fn(
+        network,
+        [autotune,
+         canopy.handlers.prefetch_chunk_variables(3, ["i"])],
+        {"x": "i"},
+        {"out": "seq"})
+    chunks = [{"x": np.zeros((6, 2), dtype=fX)} for _ in range(2)]
+    for _ in range(4):
+        fn(iter(chunks))
+    nt.assert_equal([m["batch_size"] for m in autotune.curve_], [2, 3])
+    for m in autotune.curve_:
+        nt.assert_greater(m["rows_per_second"], 0)
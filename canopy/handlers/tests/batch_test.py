@@ -59,3 +59,182 @@ def test_batch_pad():
     res = tmp(True)
 
     np.testing.assert_equal(res["out"], np.ones((18, 2), dtype=fX) * 3)
+
+
+def test_chunk_variables_cache():
+
+    def make_fn(cache, resident_cache):
+        network = tn.SequentialNode(
+            "seq",
+            [tn.InputNode("i", shape=(None, 2)),
+             tn.ApplyNode("a",
+                          fn=(lambda x: x.shape[0].astype(fX) + x),
+                          shape_fn=(lambda s: s))]
+        ).network()
+        return canopy.handlers.handled_fn(
+            network,
+            [canopy.handlers.chunk_variables(3,
+                                             ["i"],
+                                             cache=cache,
+                                             resident_cache=resident_cache)],
+            {"x": "i"},
+            {"out": "seq"})
+
+    resident_cache = canopy.handlers.batch.ResidentCache()
+    x = np.zeros((18, 2), dtype=fX)
+    for cache in ["id", "hash", None]:
+        fn = make_fn(cache, resident_cache)
+        for _ in range(2):
+            np.testing.assert_equal(fn({"x": x})["out"],
+                                    np.ones((18, 2), dtype=fX) * 3)
+        if cache is None:
+            nt.assert_equal(resident_cache.total_bytes, 0)
+        else:
+            nt.assert_equal(resident_cache.total_bytes, x.nbytes)
+        resident_cache.clear()
+
+    # hash mode detects changes to the contents
+    fn = make_fn("hash", resident_cache)
+    fn({"x": x})
+    x2 = x.copy()
+    x2[0] = 1
+    np.testing.assert_equal(fn({"x": x2})["out"][0], [4, 4])
+
+    # values are evicted once the budget is exceeded
+    resident_cache = canopy.handlers.batch.ResidentCache(
+        max_bytes=int(1.5 * x.nbytes))
+    fn1 = make_fn("id", resident_cache)
+    fn2 = make_fn("id", resident_cache)
+    fn1({"x": x})
+    fn2({"x": x2})
+    nt.assert_equal(resident_cache.total_bytes, x2.nbytes)
+    nt.assert_equal(len(resident_cache.entries), 1)
+
+
+def test_chunk_variables_cache_over_budget():
+    network = tn.ElementwiseSumNode(
+        "es",
+        [tn.InputNode("i1", shape=(None, 2)),
+         tn.InputNode("i2", shape=(None, 2))]
+    ).network()
+    x1 = np.ones((18, 2), dtype=fX)
+    x2 = 2 * np.ones((18, 2), dtype=fX)
+    # each input fits in the budget, but both together don't
+    resident_cache = canopy.handlers.batch.ResidentCache(
+        max_bytes=int(1.5 * x1.nbytes))
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.chunk_variables(3,
+                                         ["i1", "i2"],
+                                         cache="id",
+                                         resident_cache=resident_cache)],
+        {"x1": "i1", "x2": "i2"},
+        {"out": "es"})
+    for _ in range(2):
+        np.testing.assert_equal(fn({"x1": x1, "x2": x2})["out"],
+                                3 * np.ones((18, 2), dtype=fX))
+        # the budget is restored once the call is done
+        nt.assert_less_equal(resident_cache.total_bytes,
+                             resident_cache.max_bytes)
+
+
+def test_prefetch_chunk_variables():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 2)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: x.shape[0].astype(fX) + x),
+                      shape_fn=(lambda s: s))]
+    ).network()
+
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.prefetch_chunk_variables(3, ["i"])],
+        {"x": "i"},
+        {"out": "seq"})
+    chunks = [{"x": np.ones((6, 2), dtype=fX) * i} for i in range(4)]
+    res = fn(iter(chunks))
+    np.testing.assert_equal(
+        res["out"],
+        np.concatenate([c["x"] + 3 for c in chunks]))
+    nt.assert_equal(fn.state.time_count["prefetch_load"], 4)
+    nt.assert_equal(fn.state.time_count["prefetch_overlap"], 4)
+
+
+def test_chunk_variables_weighted_mean():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None,)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: x.mean()),
+                      shape_fn=(lambda s: ()))]
+    ).network()
+
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.chunk_variables(3,
+                                         ["i"],
+                                         cache=None,
+                                         strict_size=False)],
+        {"x": "i"},
+        {"out": "seq", "in": "i"})
+    x = np.arange(16).astype(fX)
+    res = fn({"x": x})
+    np.testing.assert_allclose(res["out"], 7.5)
+    np.testing.assert_equal(res["in"], x)
+
+
+def test_chunk_variables_uneven_fixed_size_output():
+    # an output with 3 rows regardless of the batch size
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None,)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: T.ones((3,)) * x.shape[0]),
+                      shape_fn=(lambda s: (3,)))]
+    ).network()
+
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.chunk_variables(3,
+                                         ["i"],
+                                         strict_size=False)],
+        {"x": "i"},
+        {"out": "seq", "in": "i"})
+    x = np.arange(8).astype(fX)
+    res = fn({"x": x})
+    np.testing.assert_equal(res["out"], [3] * 6 + [2] * 3)
+    np.testing.assert_equal(res["in"], x)
+
+
+def test_shuffled_chunk_variables():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 1)),
+         tn.ApplyNode("m",
+                      fn=(lambda x: x.max(axis=0)),
+                      shape_fn=(lambda s: s[1:]))]
+    ).network()
+
+    resident_cache = canopy.handlers.batch.ResidentCache()
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.shuffled_chunk_variables(
+            3,
+            ["i"],
+            seed=42,
+            resident_cache=resident_cache)],
+        {"x": "i"},
+        {"out": "i", "batch_max": "m"})
+    x = np.arange(18).reshape(18, 1).astype(fX)
+    res1 = fn({"x": x})
+    res2 = fn({"x": x})
+    # outputs with a row per example are in the order of the inputs
+    np.testing.assert_equal(res1["out"], x)
+    np.testing.assert_equal(res2["out"], x)
+    # but the mini-batches are shuffled
+    unshuffled_max = np.arange(2, 18, 3).astype(fX)
+    nt.assert_false(np.all(res1["batch_max"] == unshuffled_max))
+    nt.assert_false(np.all(res1["batch_max"] == res2["batch_max"]))
+    # the chunk stays resident between calls
+    nt.assert_equal(len(resident_cache.entries), 1)
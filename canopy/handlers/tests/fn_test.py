@@ -123,3 +123,38 @@ def test_build_handler3():
                                     {"out": "ac"})
     x = np.array(3, dtype=fX)
     np.testing.assert_equal(x + 42, fn({"x": x})["out"])
+
+
+def test_handled_fn_flatten():
+    class plus_n(canopy.handlers.NetworkHandlerImpl):
+
+        def __init__(self, n):
+            self.n = n
+
+        def call(self, fn, *args, **kwargs):
+            res = fn(*args, **kwargs)
+            res["out"] += self.n
+            return res
+
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 2)),
+         tn.ApplyNode("a",
+                      fn=(lambda x: x.shape[0].astype(fX) + x),
+                      shape_fn=(lambda s: s))]
+    ).network()
+    x = np.zeros((18, 2), dtype=fX)
+    results = []
+    for flatten in [False, True]:
+        fn = canopy.handlers.handled_fn(
+            network,
+            [plus_n(1),
+             canopy.handlers.NetworkHandlerImpl(),
+             canopy.handlers.chunk_variables(3, ["i"]),
+             plus_n(2)],
+            {"x": "i"},
+            {"out": "seq"},
+            flatten=flatten)
+        results.append(fn({"x": x})["out"])
+    np.testing.assert_equal(results[0], np.ones((18, 2), dtype=fX) * 6)
+    np.testing.assert_equal(results[0], results[1])
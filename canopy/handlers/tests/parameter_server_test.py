@@ -0,0 +1,60 @@
+import numpy as np
+import theano
+
+import treeano
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_parameter_server_sync():
+    network = tn.HyperparameterNode(
+        "g",
+        tn.SGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode("seq", [
+                tn.InputNode("x", shape=(None, 5)),
+                tn.DenseNode("fc")]),
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+                 "target": tn.InputNode("y", shape=(None, 3))})
+             }),
+        num_units=3,
+        learning_rate=0.1,
+        cost_function=treeano.utils.squared_error,
+    ).network()
+    network.build()
+    server = canopy.parameter_server.ParameterServer(
+        canopy.network_utils.to_value_dict(network)).start()
+    try:
+        for compression in canopy.parameter_server.COMPRESSIONS:
+            fn = canopy.handled_fn(
+                network,
+                [canopy.handlers.parameter_server_sync(
+                    server.address,
+                    compression=compression,
+                    top_k_fraction=0.5)],
+                {"x": "x", "y": "y"},
+                {"cost": "cost"},
+                include_updates=True)
+            x = np.random.randn(4, 5).astype(fX)
+            y = np.random.randn(4, 3).astype(fX)
+            costs = [fn({"x": x, "y": y})["cost"] for _ in range(5)]
+            assert costs[-1] < costs[0]
+        # without compression, the server has the same values as the
+        # network after each call
+        fn = canopy.handled_fn(
+            network,
+            [canopy.handlers.parameter_server_sync(server.address)],
+            {"x": "x", "y": "y"},
+            {"cost": "cost"},
+            include_updates=True)
+        fn({"x": x, "y": y})
+        _, values = server.client().pull()
+        local = canopy.network_utils.to_value_dict(network)
+        for k in values:
+            np.testing.assert_allclose(values[k], local[k], rtol=1e-5)
+    finally:
+        server.stop()
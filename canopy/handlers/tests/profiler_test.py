@@ -0,0 +1,72 @@
+import os
+import json
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+import treeano
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_latency_histogram():
+    histogram = canopy.handlers.profiler.LatencyHistogram()
+    for i in range(1, 1001):
+        histogram.add(i / 1000.0)
+    nt.assert_equal(histogram.count, 1000)
+    np.testing.assert_allclose(histogram.percentile(50), 0.5, rtol=0.1)
+    np.testing.assert_allclose(histogram.percentile(99), 0.99, rtol=0.1)
+    np.testing.assert_allclose(histogram.mean, 0.5005)
+
+
+def test_profiler_spans():
+    network = tn.InputNode("i", shape=(None, 2)).network()
+    profiler = canopy.handlers.Profiler(record_trace=True)
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.profile(profiler=profiler),
+         canopy.handlers.chunk_variables(3, ["i"]),
+         canopy.handlers.profile("minibatch")],
+        {"x": "i"},
+        {"out": "i"})
+    fn({"x": np.zeros((6, 2), dtype=fX)})
+    nt.assert_is(fn.state.profiler, profiler)
+    histograms = profiler.histograms
+    nt.assert_equal(histograms[("call",)].count, 1)
+    nt.assert_equal(histograms[("call", "data_transfer")].count, 1)
+    nt.assert_equal(histograms[("call", "minibatch")].count, 2)
+    nt.assert_equal(histograms[("call",
+                                "minibatch",
+                                "network_call")].count,
+                    2)
+    nt.assert_in("call/minibatch/network_call", profiler.summary())
+
+    dirname = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(dirname, "trace.json")
+        profiler.export_chrome_trace(filename)
+        with open(filename) as f:
+            trace = json.load(f)
+        nt.assert_equal(len(trace["traceEvents"]),
+                        sum(h.count for h in histograms.values()))
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_profiler_off_by_default():
+    network = tn.InputNode("i", shape=(None, 2)).network()
+    fn = canopy.handlers.handled_fn(
+        network,
+        [canopy.handlers.chunk_variables(3, ["i"])],
+        {"x": "i"},
+        {"out": "i"})
+    fn({"x": np.zeros((6, 2), dtype=fX)})
+    nt.assert_is_none(fn.state.profiler)
+    nt.assert_equal(fn.state.time_count["network_call"], 2)
@@ -0,0 +1,295 @@
+"""
+hogwild-style asynchronous training: worker processes run their own
+compiled update function on their own data, and add their updates to
+parameters in shared memory without any locks
+
+NOTE: this isn't in-place hogwild - each step, a worker copies the
+parameters out of shared memory into its function's variables, and adds the
+change of the variables back afterwards, so a step costs a few passes over
+the parameters in addition to the update itself (see compute_fraction in
+Hogwild.summary)
+
+usage:
+>>> network.build()
+>>> hogwild = Hogwild(network, ["x", "y"], ["cost"], num_workers=8)
+>>> results = hogwild.run(generator_fn)  # blocks until workers finish
+>>> print(hogwild.report(results))
+
+where generator_fn(worker_idx, num_workers) returns an iterable of lists of
+arguments for the update function (eg. the mini-batches of a shard)
+
+NOTE: the shared variables of the network are moved into shared memory, so
+the network (eg. a validation function of it) sees the updates of the
+workers as they happen
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import ctypes
+import traceback
+import collections
+import multiprocessing
+
+import numpy as np
+from six.moves import queue
+
+from . import network_utils
+
+
+def _shared_memory_like(value):
+    """
+    returns an array in shared memory (which is inherited by forked
+    processes) with the same contents as the given array
+    """
+    raw = multiprocessing.RawArray(ctypes.c_uint8, max(value.nbytes, 1))
+    arr = np.frombuffer(raw, dtype=value.dtype)[:value.size].reshape(
+        value.shape)
+    arr[...] = value
+    return arr
+
+
+def share_network_memory(network):
+    """
+    moves the values of the shared variables of the network (see
+    canopy.network_utils.to_shared_dict) into shared memory, and returns a
+    map from variable name to the array in shared memory
+    """
+    shared_arrays = {}
+    for name, shared in network_utils.to_shared_dict(network).items():
+        arr = _shared_memory_like(shared.get_value())
+        shared.set_value(arr, borrow=True)
+        shared_arrays[name] = arr
+    return shared_arrays
+
+
+def _add_changed_rows(arr, delta):
+    """
+    adds delta into arr, only writing the rows of arr where delta is nonzero
+    (eg. the rows of an embedding used by a mini-batch), so that rows which
+    other workers are updating aren't rewritten
+    """
+    if delta.ndim == 0 or delta.size == 0:
+        arr += delta
+        return
+    changed = delta.reshape(len(delta), -1).any(axis=1)
+    if changed.all():
+        arr += delta
+    elif changed.any():
+        rows = np.flatnonzero(changed)
+        arr[rows] += delta[rows]
+
+
+def _staleness_percentile(staleness, q):
+    """
+    returns the q-th percentile of a map from staleness to count
+    """
+    total = sum(staleness.values())
+    if total == 0:
+        return float("nan")
+    seen = 0
+    for value in sorted(staleness):
+        seen += staleness[value]
+        if seen >= q / 100 * total:
+            return value
+
+
+def _worker(worker_idx,
+            num_workers,
+            network,
+            inputs,
+            outputs,
+            kwargs,
+            shared_arrays,
+            global_step,
+            generator_fn,
+            max_steps,
+            result_queue):
+    try:
+        fn = network.function(inputs, outputs, include_updates=True, **kwargs)
+        # the function updates its own copy of the variables, whose
+        # changes are then added to shared memory
+        shared_dict = network_utils.to_shared_dict(network)
+        # variables that the function doesn't update never change
+        updated = set(network.update_deltas.deltas)
+        updated.update(dict(kwargs.get("updates") or {}))
+        names = sorted(name for name in shared_arrays
+                       if shared_dict[name] in updated)
+        local = [shared_dict[name] for name in names]
+        shm = [shared_arrays[name] for name in names]
+        # whether or not the function updates each variable in place
+        # (unknown until the first step), in which case it can't be given
+        # the values read without copying them, since they are needed to
+        # compute the changes
+        inplace = [None] * len(names)
+        step_outputs = []
+        # map from staleness (number of updates of other workers between
+        # reading and writing the parameters) to count
+        staleness = collections.Counter()
+        compute_time = 0.0
+        start_time = time.time()
+        for step, args in enumerate(generator_fn(worker_idx, num_workers)):
+            if max_steps is not None and step >= max_steps:
+                break
+            read_step = global_step.value
+            read = [arr.copy() for arr in shm]
+            before = []
+            for idx, (var, value) in enumerate(zip(local, read)):
+                var.set_value(value, borrow=inplace[idx] is False)
+                before.append(var.get_value(borrow=True))
+            compute_start = time.time()
+            step_outputs.append(fn(*args))
+            compute_time += time.time() - compute_start
+            for idx, (var, arr, value) in enumerate(zip(local, shm, read)):
+                new = var.get_value(borrow=True)
+                if inplace[idx] is None:
+                    inplace[idx] = np.may_share_memory(new, before[idx])
+                # read becomes the change of the variable
+                np.subtract(new, value, out=value)
+                _add_changed_rows(arr, value)
+            # NOTE: the increment isn't atomic, so the count is approximate
+            staleness[global_step.value - read_step] += 1
+            global_step.value += 1
+        total_time = time.time() - start_time
+        result_queue.put((worker_idx, "result", dict(
+            outputs=step_outputs,
+            num_steps=len(step_outputs),
+            total_time=total_time,
+            compute_time=compute_time,
+            staleness=dict(staleness),
+        )))
+    except Exception:
+        result_queue.put((worker_idx, "error", traceback.format_exc()))
+
+
+class Hogwild(object):
+
+    """
+    asynchronous training of a network in worker processes, each of which
+    compiles network.function(inputs, outputs, include_updates=True, ...)
+    and adds its updates to parameters in shared memory without locking
+
+    only the shared variables of the network are shared between workers -
+    other state of the update function (eg. the moments of adam) is local
+    to each worker
+
+    NOTE: workers don't update shared memory in place - each step copies
+    the parameters into the worker's variables and adds their changes back
+
+    max_steps:
+    optional maximum number of steps per worker
+    """
+
+    def __init__(self,
+                 network,
+                 inputs,
+                 outputs=None,
+                 num_workers=2,
+                 max_steps=None,
+                 **kwargs):
+        network.build()
+        self.network = network
+        self.inputs = inputs
+        self.outputs = outputs
+        self.num_workers = num_workers
+        self.max_steps = max_steps
+        self.kwargs = kwargs
+        self.shared_arrays = share_network_memory(network)
+        # total number of steps of all workers
+        self.global_step = multiprocessing.RawValue(ctypes.c_long, 0)
+
+    def run(self, generator_fn):
+        """
+        runs the workers until each has exhausted its generator (or reached
+        max_steps), and returns a list of the results of each worker: a map
+        with the outputs of each step, the number of steps, the staleness
+        of the steps, and timings
+        """
+        result_queue = multiprocessing.Queue()
+        processes = []
+        for worker_idx in range(self.num_workers):
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(worker_idx,
+                      self.num_workers,
+                      self.network,
+                      self.inputs,
+                      self.outputs,
+                      self.kwargs,
+                      self.shared_arrays,
+                      self.global_step,
+                      generator_fn,
+                      self.max_steps,
+                      result_queue))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+
+        results = [None] * self.num_workers
+        try:
+            for _ in range(self.num_workers):
+                while True:
+                    try:
+                        worker_idx, kind, payload = result_queue.get(
+                            timeout=1.0)
+                        break
+                    except queue.Empty:
+                        for process in processes:
+                            if process.exitcode not in (None, 0):
+                                raise RuntimeError("Worker process died "
+                                                   "with exit code %d"
+                                                   % process.exitcode)
+                if kind == "error":
+                    raise RuntimeError("Error in worker process %d:\n%s"
+                                       % (worker_idx, payload))
+                results[worker_idx] = payload
+        finally:
+            for process in processes:
+                process.join(timeout=1.0)
+                if process.is_alive():
+                    process.terminate()
+        return results
+
+    @staticmethod
+    def summary(results):
+        """
+        returns throughput and staleness statistics of the results of run
+        """
+        staleness = collections.Counter()
+        for res in results:
+            staleness.update(res["staleness"])
+        num_steps = sum(res["num_steps"] for res in results)
+        total_time = max(res["total_time"] for res in results)
+        num_staleness = sum(staleness.values())
+        return dict(
+            num_steps=num_steps,
+            steps_per_second=num_steps / total_time if total_time else 0.0,
+            worker_steps_per_second=[
+                res["num_steps"] / res["total_time"] if res["total_time"]
+                else 0.0
+                for res in results],
+            # fraction of time spent in the compiled function, as opposed to
+            # copying to / from shared memory
+            compute_fraction=(sum(res["compute_time"] for res in results)
+                              / (sum(res["total_time"] for res in results)
+                                 or 1.0)),
+            mean_staleness=(sum(k * v for k, v in staleness.items())
+                            / num_staleness
+                            if num_staleness else float("nan")),
+            p50_staleness=_staleness_percentile(staleness, 50),
+            p95_staleness=_staleness_percentile(staleness, 95),
+            max_staleness=max(staleness) if staleness else None,
+        )
+
+    def report(self, results):
+        summary = self.summary(results)
+        return "\n".join("%s: %s" % (k, summary[k]) for k in [
+            "num_steps",
+            "steps_per_second",
+            "worker_steps_per_second",
+            "compute_fraction",
+            "mean_staleness",
+            "p50_staleness",
+            "p95_staleness",
+            "max_staleness"])
@@ -0,0 +1,266 @@
+"""
+a parameter server, which owns the values of a network's shared variables
+(see canopy.network_utils.to_value_dict) and applies the deltas pushed by
+workers, so that training can be scaled past a single machine
+
+workers push the changes of their values after each step and pull fresh
+values over sockets (see canopy.handlers.parameter_server_sync)
+
+usage:
+>>> server = ParameterServer(canopy.network_utils.to_value_dict(network),
+...                          address=("localhost", 0),
+...                          max_staleness=4).start()
+>>> train_fn = canopy.handled_fn(
+...     network,
+...     [canopy.handlers.parameter_server_sync(server.address,
+...                                            compression="top_k")],
+...     {"x": "x", "y": "y"},
+...     {"cost": "cost"},
+...     include_updates=True)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import math
+import threading
+import traceback
+import collections
+import multiprocessing
+from multiprocessing import connection
+
+import numpy as np
+
+COMPRESSIONS = (None, "fp16", "top_k")
+
+
+def compress(delta, compression=None, top_k_fraction=0.01):
+    """
+    returns a compressed representation of a delta, which can be sent to
+    the server
+
+    compression:
+    - None = the delta as is
+    - "fp16" = the delta as float16
+    - "top_k" = only the top_k_fraction elements with the largest magnitude
+    """
+    if compression is None:
+        return ("raw", delta)
+    elif compression == "fp16":
+        return ("fp16", delta.astype(np.float16))
+    elif compression == "top_k":
+        flat = delta.ravel()
+        k = min(flat.size, max(1, int(math.ceil(top_k_fraction * flat.size))))
+        idxs = np.argpartition(np.abs(flat), flat.size - k)[flat.size - k:]
+        return ("top_k", delta.shape, idxs.astype(np.int32), flat[idxs])
+    else:
+        raise ValueError("Unknown compression: %s" % compression)
+
+
+def decompress(compressed, dtype):
+    """
+    inverse of compress, returning a dense delta of the given dtype
+    """
+    kind = compressed[0]
+    if kind in ("raw", "fp16"):
+        return compressed[1].astype(dtype)
+    else:
+        assert kind == "top_k"
+        _, shape, idxs, values = compressed
+        delta = np.zeros(int(np.prod(shape)), dtype=dtype)
+        delta[idxs] = values
+        return delta.reshape(shape)
+
+
+def compressed_nbytes(compressed):
+    return sum(x.nbytes for x in compressed if isinstance(x, np.ndarray))
+
+
+def default_authkey():
+    """
+    key to authenticate connections with, which is shared with forked
+    processes (processes on other machines need to be given the same key)
+    """
+    return multiprocessing.current_process().authkey
+
+
+class _ServerState(object):
+
+    def __init__(self, value_dict, max_staleness):
+        self.values = {k: np.array(v) for k, v in value_dict.items()}
+        self.max_staleness = max_staleness
+        # number of pushes applied
+        self.version = 0
+        self.num_rejected = 0
+        # map from staleness of pushes to count
+        self.staleness = collections.Counter()
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    def pull(self):
+        with self.lock:
+            return ("values",
+                    self.version,
+                    {k: v.copy() for k, v in self.values.items()})
+
+    def push(self, base_version, deltas):
+        with self.lock:
+            staleness = self.version - base_version
+            self.staleness[staleness] += 1
+            self.bytes_received += sum(compressed_nbytes(c)
+                                       for c in deltas.values())
+            if (self.max_staleness is not None
+                    and staleness > self.max_staleness):
+                self.num_rejected += 1
+                return ("rejected", self.version)
+            # check all deltas before applying any, so that an invalid push
+            # isn't partially applied
+            dense = {}
+            for k, compressed in deltas.items():
+                if k not in self.values:
+                    raise KeyError("Unknown variable: %s" % k)
+                value = self.values[k]
+                delta = decompress(compressed, value.dtype)
+                if delta.shape != value.shape:
+                    raise ValueError("Delta for %s has shape %s instead of %s"
+                                     % (k, delta.shape, value.shape))
+                dense[k] = delta
+            for k, delta in dense.items():
+                self.values[k] += delta
+            self.version += 1
+            return ("ok", self.version)
+
+    def stats(self):
+        with self.lock:
+            return ("stats", dict(version=self.version,
+                                  num_rejected=self.num_rejected,
+                                  staleness=dict(self.staleness),
+                                  bytes_received=self.bytes_received))
+
+
+def _serve_connection(conn, state):
+    try:
+        while True:
+            message = conn.recv()
+            try:
+                if message[0] == "pull":
+                    reply = state.pull()
+                elif message[0] == "push":
+                    reply = state.push(*message[1:])
+                elif message[0] == "stats":
+                    reply = state.stats()
+                else:
+                    raise ValueError("Unknown message: %s" % message[0])
+            except Exception:
+                # reply instead of dropping the connection, so that the
+                # client doesn't wait forever
+                reply = ("error", traceback.format_exc())
+            conn.send(reply)
+    except EOFError:
+        pass
+    finally:
+        conn.close()
+
+
+def _serve(listener, value_dict, max_staleness):
+    state = _ServerState(value_dict, max_staleness)
+    while True:
+        conn = listener.accept()
+        thread = threading.Thread(target=_serve_connection,
+                                  args=(conn, state))
+        thread.daemon = True
+        thread.start()
+
+
+class ParameterServer(object):
+
+    """
+    server process that owns a value dict, and applies the deltas pushed by
+    workers to it
+
+    address:
+    (host, port) to listen on - a port of 0 picks a free port, and the
+    actual address is available as the address attribute
+
+    max_staleness:
+    optional maximum number of pushes (of any worker) between a worker
+    pulling the values and pushing its deltas - staler pushes are rejected,
+    and the worker pulls fresh values instead
+    """
+
+    def __init__(self,
+                 value_dict,
+                 address=("localhost", 0),
+                 authkey=None,
+                 max_staleness=None):
+        if authkey is None:
+            authkey = default_authkey()
+        self.value_dict = value_dict
+        self.max_staleness = max_staleness
+        self.listener = connection.Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.authkey = authkey
+        self.process = None
+
+    def start(self):
+        assert self.process is None, "already started"
+        self.process = multiprocessing.Process(target=_serve,
+                                               args=(self.listener,
+                                                     self.value_dict,
+                                                     self.max_staleness))
+        self.process.daemon = True
+        self.process.start()
+        # the server process has its own copy of the socket
+        self.listener.close()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def client(self):
+        return ParameterServerClient(self.address, self.authkey)
+
+
+class ParameterServerClient(object):
+
+    """
+    connection to a ParameterServer
+    """
+
+    def __init__(self, address, authkey=None):
+        if authkey is None:
+            authkey = default_authkey()
+        self.conn = connection.Client(tuple(address), authkey=authkey)
+
+    def _request(self, *message):
+        self.conn.send(message)
+        reply = self.conn.recv()
+        if reply[0] == "error":
+            raise RuntimeError("Error in parameter server:\n%s" % reply[1])
+        return reply
+
+    def pull(self):
+        """
+        returns the version of the values on the server (ie. the number of
+        pushes applied) and the values
+        """
+        _, version, values = self._request("pull")
+        return version, values
+
+    def push(self, base_version, deltas):
+        """
+        pushes a map from name to compressed delta, computed from the values
+        of version base_version, returning whether or not the deltas were
+        applied and the current version
+        """
+        status, version = self._request("push", base_version, deltas)
+        return status == "ok", version
+
+    def stats(self):
+        return self._request("stats")[1]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,363 @@
+"""
+prefetching of data in worker processes, so that slow data generation
+(eg. decoding, augmentation) happens in parallel with training
+
+arrays are handed back to the main process through a ring of shared memory
+slots instead of being pickled
+
+usage:
+>>> gen = canopy.prefetch.process_map(augment, shard_indices, num_workers=4)
+>>> canopy.evaluate_until(fn=train_fn, gen=gen)
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import ctypes
+import itertools
+import traceback
+import multiprocessing
+
+import numpy as np
+from six.moves import queue
+
+# alignment of arrays in a slot, in bytes
+ALIGNMENT = 64
+
+
+class SlotFull(Exception):
+
+    """
+    raised by encode when an item can't be written into a slot (eg. it is too
+    large), in which case it should be sent some other way (eg. pickled)
+    """
+
+
+class _Exhausted(Exception):
+    pass
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def encode(item, slot, offset=0):
+    """
+    writes the arrays of the item into the slot, and returns metadata to
+    reconstruct the item from the slot as well as the next free offset
+
+    supports (nested) dicts, lists and tuples of arrays - all other values
+    are part of the metadata
+    """
+    if isinstance(item, np.ndarray):
+        if item.dtype.hasobject:
+            raise SlotFull("can't share arrays of objects")
+        start = _align(offset)
+        if start + item.nbytes > len(slot):
+            raise SlotFull("item doesn't fit in slot")
+        dest = np.ndarray(item.shape,
+                          dtype=item.dtype,
+                          buffer=slot,
+                          offset=start)
+        dest[...] = item
+        meta = ("array", item.dtype.str, item.shape, start)
+        return meta, start + item.nbytes
+    elif isinstance(item, dict):
+        metas = []
+        for k, v in item.items():
+            meta, offset = encode(v, slot, offset)
+            metas.append((k, meta))
+        return ("dict", metas), offset
+    elif isinstance(item, (list, tuple)):
+        metas = []
+        for v in item:
+            meta, offset = encode(v, slot, offset)
+            metas.append(meta)
+        return (item.__class__.__name__, metas), offset
+    else:
+        return ("value", item), offset
+
+
+def decode(meta, slot):
+    """
+    inverse of encode, returning views into the slot
+    """
+    kind = meta[0]
+    if kind == "array":
+        _, dtype, shape, start = meta
+        return np.ndarray(shape,
+                          dtype=np.dtype(dtype),
+                          buffer=slot,
+                          offset=start)
+    elif kind == "dict":
+        return {k: decode(v, slot) for k, v in meta[1]}
+    elif kind == "list":
+        return [decode(v, slot) for v in meta[1]]
+    elif kind == "tuple":
+        return tuple(decode(v, slot) for v in meta[1])
+    else:
+        assert kind == "value"
+        return meta[1]
+
+
+def slot_views(raw_slots):
+    """
+    returns byte views of shared memory slots (multiprocessing.RawArray's)
+
+    the RawArray's themselves should be passed to other processes (and
+    viewed there), since numpy arrays are copied when pickled (eg. when
+    processes are started with spawn or forkserver instead of fork)
+    """
+    return [np.frombuffer(raw, dtype=np.uint8) for raw in raw_slots]
+
+
+def _worker_loop(worker_idx, task_queue, result_queue, raw_slots, produce):
+    """
+    produce:
+    function from a task payload to an item, raising _Exhausted when there
+    are no more items
+    """
+    slots = slot_views(raw_slots)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        seq, slot_idx, payload = task
+        try:
+            item = produce(payload)
+        except _Exhausted:
+            result_queue.put((seq, slot_idx, worker_idx, "done", None))
+            break
+        except Exception:
+            result_queue.put((seq, slot_idx, worker_idx, "error",
+                              traceback.format_exc()))
+            break
+        try:
+            meta, _ = encode(item, slots[slot_idx])
+            result_queue.put((seq, slot_idx, worker_idx, "shm", meta))
+        except SlotFull:
+            # fall back to pickling the item
+            result_queue.put((seq, slot_idx, worker_idx, "pickle", item))
+
+
+def _map_worker(worker_idx, num_workers, task_queue, result_queue, raw_slots,
+                fn):
+    _worker_loop(worker_idx, task_queue, result_queue, raw_slots, fn)
+
+
+def _generator_worker(worker_idx, num_workers, task_queue, result_queue,
+                      raw_slots, generator_fn):
+    gen = generator_fn(worker_idx, num_workers)
+
+    def produce(payload):
+        try:
+            return next(gen)
+        except StopIteration:
+            raise _Exhausted()
+
+    _worker_loop(worker_idx, task_queue, result_queue, raw_slots, produce)
+
+
+class _ProcessPipeline(object):
+
+    """
+    dispatches tasks to worker processes, with at most queue_depth tasks in
+    flight (each of which owns a shared memory slot)
+    """
+
+    def __init__(self,
+                 target,
+                 target_arg,
+                 payloads,
+                 num_workers,
+                 queue_depth,
+                 ordered,
+                 slot_bytes,
+                 per_worker_queues):
+        self.num_workers = num_workers
+        self.ordered = ordered
+        self.payloads = iter(payloads)
+        self.raw_slots = [multiprocessing.RawArray(ctypes.c_uint8,
+                                                   slot_bytes)
+                          for _ in range(queue_depth)]
+        self.slots = slot_views(self.raw_slots)
+        if per_worker_queues:
+            self.task_queues = [multiprocessing.Queue()
+                                for _ in range(num_workers)]
+        else:
+            self.task_queues = [multiprocessing.Queue()]
+        self.result_queue = multiprocessing.Queue()
+        self.processes = []
+        for worker_idx in range(num_workers):
+            task_queue = self.task_queues[worker_idx % len(self.task_queues)]
+            process = multiprocessing.Process(
+                target=target,
+                args=(worker_idx,
+                      num_workers,
+                      task_queue,
+                      self.result_queue,
+                      self.raw_slots,
+                      target_arg))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        self.free_slots = list(range(queue_depth))
+        self.next_seq = 0
+        self.outstanding = 0
+        self.payloads_exhausted = False
+        self.done_workers = set()
+
+    def _dispatch(self):
+        while self.free_slots and not self.payloads_exhausted:
+            try:
+                payload = next(self.payloads)
+            except StopIteration:
+                self.payloads_exhausted = True
+                break
+            slot_idx = self.free_slots.pop()
+            task_queue = self.task_queues[self.next_seq
+                                          % len(self.task_queues)]
+            task_queue.put((self.next_seq, slot_idx, payload))
+            self.next_seq += 1
+            self.outstanding += 1
+
+    def _receive(self):
+        while True:
+            try:
+                result = self.result_queue.get(timeout=1.0)
+                break
+            except queue.Empty:
+                for process in self.processes:
+                    if process.exitcode not in (None, 0):
+                        raise RuntimeError("Worker process died with exit "
+                                           "code %d" % process.exitcode)
+        self.outstanding -= 1
+        return result
+
+    def _release(self, slot_idx):
+        self.free_slots.append(slot_idx)
+        self._dispatch()
+
+    def __iter__(self):
+        # results received out of order
+        pending = {}
+        next_expected = 0
+        try:
+            self._dispatch()
+            while True:
+                if self.ordered:
+                    while next_expected not in pending:
+                        if self.outstanding == 0:
+                            return
+                        result = self._receive()
+                        pending[result[0]] = result
+                    result = pending.pop(next_expected)
+                    next_expected += 1
+                else:
+                    if (self.outstanding == 0
+                            or len(self.done_workers) == self.num_workers):
+                        return
+                    result = self._receive()
+                _, slot_idx, worker_idx, kind, payload = result
+                if kind == "error":
+                    raise RuntimeError("Error in worker process %d:\n%s"
+                                       % (worker_idx, payload))
+                elif kind == "done":
+                    self._release(slot_idx)
+                    self.done_workers.add(worker_idx)
+                    if self.ordered:
+                        # the next item would've come from this worker
+                        return
+                elif kind == "pickle":
+                    self._release(slot_idx)
+                    yield payload
+                else:
+                    assert kind == "shm"
+                    # the slot is only released once the next item is
+                    # requested, since the item is a view into it
+                    yield decode(payload, self.slots[slot_idx])
+                    self._release(slot_idx)
+        finally:
+            self.close()
+
+    def close(self):
+        for task_queue in self.task_queues:
+            for _ in self.processes:
+                task_queue.put(None)
+        deadline = time.time() + 1.0
+        for process in self.processes:
+            process.join(timeout=max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+
+
+def process_map(fn,
+                source,
+                num_workers=2,
+                queue_depth=None,
+                ordered=True,
+                slot_bytes=2 ** 26):
+    """
+    returns a generator of fn(x) for each x in source, where fn is evaluated
+    in worker processes
+
+    source:
+    iterable of (small) values that are sent to the workers, eg. shard
+    indices or filenames
+
+    queue_depth:
+    maximum number of items that are prefetched (defaults to twice the
+    number of workers)
+
+    ordered:
+    whether to return items in the order of source, or as soon as they are
+    ready
+
+    slot_bytes:
+    size of the shared memory used for each item - larger items are pickled
+
+    NOTE: arrays in each item are views into shared memory that is reused
+    once the next item is requested, so they must be copied to be kept
+    around
+    """
+    if queue_depth is None:
+        queue_depth = 2 * num_workers
+    return iter(_ProcessPipeline(target=_map_worker,
+                                 target_arg=fn,
+                                 payloads=source,
+                                 num_workers=num_workers,
+                                 queue_depth=queue_depth,
+                                 ordered=ordered,
+                                 slot_bytes=slot_bytes,
+                                 per_worker_queues=False))
+
+
+def process_generator(generator_fn,
+                      num_workers=1,
+                      queue_depth=None,
+                      ordered=True,
+                      slot_bytes=2 ** 26):
+    """
+    returns a generator of the items of generator_fn(worker_idx,
+    num_workers), run in each of the worker processes - eg. each worker can
+    generate a different shard of the data
+
+    ordered:
+    whether to take items from the workers in round-robin order (ending
+    when the next worker runs out of items), or as soon as they are ready
+    (ending when all workers run out of items)
+
+    see process_map for the other arguments
+    """
+    if queue_depth is None:
+        queue_depth = 2 * num_workers
+    return iter(_ProcessPipeline(target=_generator_worker,
+                                 target_arg=generator_fn,
+                                 payloads=itertools.repeat(None),
+                                 num_workers=num_workers,
+                                 queue_depth=queue_depth,
+                                 ordered=ordered,
+                                 slot_bytes=slot_bytes,
+                                 per_worker_queues=ordered))
@@ -0,0 +1,145 @@
+"""
+pools of replicas of a compiled function, so that the function can be called
+from several threads at once (compiled theano functions have mutable
+input/output storage, so a single function can't be called concurrently, but
+most of the time of a call is spent in BLAS / ops which release the GIL)
+
+usage:
+>>> fn = network.function(["x"], ["y"])
+>>> pool = ReplicaPool(theano_function_replicas(fn, 4))
+>>> pool(x)  # from any thread
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import threading
+import contextlib
+
+from six.moves import queue
+
+
+def theano_function_replicas(fn, num_replicas):
+    """
+    returns the given compiled theano function and num_replicas - 1 copies of
+    it, where each copy has its own input, output and intermediate storage
+    but the same shared variables (and compiled code) as the original
+    """
+    return [fn] + [fn.copy(share_memory=False)
+                   for _ in range(num_replicas - 1)]
+
+
+def handled_fn_replicas(num_replicas,
+                        network,
+                        handlers_fn,
+                        *args,
+                        **kwargs):
+    """
+    returns num_replicas handled functions of the same network, which share
+    the network's shared variables
+
+    handlers_fn:
+    function returning a new list of handlers for each replica, since
+    handlers keep state between calls (eg. the shared variables of
+    chunk_variables)
+    """
+    from .handlers import handled_fn
+    return [handled_fn(network, handlers_fn(), *args, **kwargs)
+            for _ in range(num_replicas)]
+
+
+class ReplicaPool(object):
+
+    """
+    hands out replicas of a function to threads, with each replica being used
+    by at most one thread at a time
+
+    replicas:
+    list of functions that can be called concurrently with each other
+    (eg. from theano_function_replicas or handled_fn_replicas)
+    """
+
+    def __init__(self, replicas, timeout=None):
+        assert len(replicas) > 0
+        self.replicas = list(replicas)
+        self.timeout = timeout
+        self._free = queue.Queue()
+        for replica in self.replicas:
+            self._free.put(replica)
+
+    @property
+    def num_replicas(self):
+        return len(self.replicas)
+
+    @contextlib.contextmanager
+    def replica(self):
+        """
+        context manager that takes a free replica, blocking until one is
+        free, and returns it to the pool afterwards
+        """
+        try:
+            replica = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError("Timed out waiting for a free replica")
+        try:
+            yield replica
+        finally:
+            self._free.put(replica)
+
+    def __call__(self, *args, **kwargs):
+        with self.replica() as replica:
+            return replica(*args, **kwargs)
+
+
+def measure_throughput(pool, args, num_calls=100, num_threads=None):
+    """
+    calls the pool num_calls times with the given args from num_threads
+    threads (by default, one per replica), and returns the number of calls
+    per second
+    """
+    if num_threads is None:
+        num_threads = pool.num_replicas
+    # warm up each replica
+    for replica in pool.replicas:
+        replica(*args)
+
+    remaining = [num_calls]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            pool(*args)
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return num_calls / (time.time() - start_time)
+
+
+def throughput_by_replica_count(make_replicas,
+                                args,
+                                replica_counts=(1, 2, 4),
+                                num_calls=100):
+    """
+    returns a list of the calls per second (with a thread per replica) for
+    each number of replicas
+
+    make_replicas:
+    function from a number of replicas to a list of replicas
+    (eg. lambda n: theano_function_replicas(fn, n))
+    """
+    results = []
+    for num_replicas in replica_counts:
+        pool = ReplicaPool(make_replicas(num_replicas))
+        calls_per_second = measure_throughput(pool, args, num_calls)
+        results.append(dict(num_replicas=num_replicas,
+                            calls_per_second=calls_per_second))
+    return results
@@ -0,0 +1,246 @@
+"""
+micro-batching of inference requests, so that many small requests (eg. a
+few rows each) are evaluated with a single call of a handled function
+
+usage:
+>>> server = MicroBatchServer(fn, max_batch_size=64, max_wait=0.005)
+>>> server.start()
+>>> client = InProcessClient(server)
+>>> client.predict({"x": x})  # from any thread
+>>> server.stop()
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+import threading
+import collections
+
+import six
+import numpy as np
+from six.moves import queue
+
+from .handlers.profiler import LatencyHistogram
+
+
+class Request(object):
+
+    """
+    a pending request, which acts as a future for its result
+    """
+
+    def __init__(self, in_dict):
+        self.in_dict = in_dict
+        num_rows = {len(v) for v in in_dict.values()}
+        assert len(num_rows) == 1, "inputs have different numbers of rows"
+        self.num_rows = num_rows.pop()
+        self.enqueue_time = time.time()
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise RuntimeError("Timed out waiting for result")
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+
+class MicroBatchServer(object):
+
+    """
+    queues requests (maps from input key to arrays with a row per example)
+    and evaluates them in batches on a background thread, where a batch is
+    evaluated once it has max_batch_size rows or its first request has
+    waited for max_wait seconds
+
+    outputs with a row per example are split back into each request, and
+    other outputs (eg. scalars) are given to every request of the batch
+
+    fn:
+    function from a map of inputs to a map of outputs (eg. handled_fn)
+
+    requests that are still queued when the server is stopped fail with a
+    RuntimeError, as do requests submitted after that
+    """
+
+    def __init__(self, fn, max_batch_size=64, max_wait=0.005):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        # a request taken from the queue that didn't fit in the last batch
+        self._carry = collections.deque()
+        self._thread = None
+        self._running = False
+        self._stopped = False
+        # guards _stopped, so that no request is queued after stop drains
+        # the queue
+        self._lock = threading.Lock()
+        # statistics
+        self.latency = LatencyHistogram()
+        self.batch_rows = LatencyHistogram()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.max_queue_depth = 0
+
+    def start(self):
+        assert self._thread is None, "already started"
+        self._running = True
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._fail_pending()
+
+    def _fail_pending(self):
+        """
+        fails all requests that weren't evaluated
+        """
+        try:
+            raise RuntimeError("MicroBatchServer stopped before the request "
+                               "was evaluated")
+        except RuntimeError:
+            exc_info = sys.exc_info()
+        while self._carry:
+            self._carry.popleft().set_exception(exc_info)
+        while True:
+            try:
+                request = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            request.set_exception(exc_info)
+
+    def submit(self, in_dict):
+        """
+        queues a request, and returns a Request whose result method returns
+        the outputs for the request
+        """
+        request = Request(in_dict)
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("MicroBatchServer is stopped")
+            self.queue.put(request)
+        return request
+
+    def _next_request(self, timeout):
+        if self._carry:
+            return self._carry.popleft()
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _next_batch(self):
+        first = self._next_request(timeout=0.1)
+        if first is None:
+            return []
+        batch = [first]
+        num_rows = first.num_rows
+        deadline = first.enqueue_time + self.max_wait
+        while num_rows < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            request = self._next_request(timeout=remaining)
+            if request is None:
+                break
+            if num_rows + request.num_rows > self.max_batch_size:
+                self._carry.append(request)
+                break
+            batch.append(request)
+            num_rows += request.num_rows
+        return batch
+
+    def _evaluate(self, batch):
+        total_rows = sum(request.num_rows for request in batch)
+        try:
+            if len(batch) == 1:
+                merged = batch[0].in_dict
+            else:
+                merged = {key: np.concatenate([r.in_dict[key]
+                                               for r in batch])
+                          for key in batch[0].in_dict}
+            outputs = self.fn(merged)
+        except Exception:
+            exc_info = sys.exc_info()
+            for request in batch:
+                request.set_exception(exc_info)
+            return
+        offset = 0
+        end_time = time.time()
+        for request in batch:
+            result = {}
+            for key, value in outputs.items():
+                if (getattr(value, "ndim", 0) > 0
+                        and value.shape[0] == total_rows):
+                    result[key] = value[offset:offset + request.num_rows]
+                else:
+                    result[key] = value
+            offset += request.num_rows
+            request.set_result(result)
+            self.latency.add(end_time - request.enqueue_time)
+        self.num_requests += len(batch)
+        self.num_batches += 1
+        self.batch_rows.add(total_rows)
+
+    def _loop(self):
+        while self._running:
+            self.max_queue_depth = max(self.max_queue_depth,
+                                       self.queue.qsize() + len(self._carry))
+            batch = self._next_batch()
+            if batch:
+                self._evaluate(batch)
+
+    def stats(self):
+        """
+        returns the queue depth, and the latencies of requests (from being
+        queued to having a result, in milliseconds) and sizes of batches
+        """
+        return dict(
+            queue_depth=self.queue.qsize() + len(self._carry),
+            max_queue_depth=self.max_queue_depth,
+            num_requests=self.num_requests,
+            num_batches=self.num_batches,
+            mean_batch_rows=self.batch_rows.mean,
+            latency_p50_ms=1000 * self.latency.percentile(50),
+            latency_p95_ms=1000 * self.latency.percentile(95),
+            latency_p99_ms=1000 * self.latency.percentile(99),
+        )
+
+
+class InProcessClient(object):
+
+    """
+    client for a MicroBatchServer in the same process
+    """
+
+    def __init__(self, server, timeout=None):
+        self.server = server
+        self.timeout = timeout
+
+    def predict(self, in_dict):
+        return self.server.submit(in_dict).result(self.timeout)
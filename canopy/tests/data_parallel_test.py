@@ -0,0 +1,111 @@
+import nose.tools as nt
+import numpy as np
+import theano
+
+import treeano
+import treeano.nodes as tn
+from treeano.sandbox.nodes import batch_normalization as bn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def _network():
+    return tn.HyperparameterNode(
+        "g",
+        tn.SGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode("seq", [
+                tn.InputNode("x", shape=(None, 5)),
+                tn.DenseNode("fc")]),
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+                 "target": tn.InputNode("y", shape=(None, 3))})
+             }),
+        num_units=3,
+        learning_rate=0.1,
+        cost_function=treeano.utils.squared_error,
+        inits=[treeano.inits.ConstantInit(0.1)],
+    ).network()
+
+
+def test_data_parallel():
+    np.random.seed(42)
+    x = np.random.randn(9, 5).astype(fX)
+    y = np.random.randn(9, 3).astype(fX)
+
+    network = _network()
+    fn = network.function(["x", "y"], ["cost"], include_updates=True)
+    costs = [fn(x, y)[0] for _ in range(3)]
+    expected = canopy.network_utils.to_value_dict(network)
+
+    network = _network()
+    train_fn = canopy.data_parallel.DataParallel(network,
+                                                 {"x": "x", "y": "y"},
+                                                 {"cost": "cost"},
+                                                 num_workers=2,
+                                                 include_updates=True)
+    train_fn.start()
+    try:
+        dp_costs = [train_fn({"x": x, "y": y})["cost"] for _ in range(3)]
+        values = train_fn.parameter_values()
+        train_fn.sync_network()
+    finally:
+        train_fn.stop()
+
+    np.testing.assert_allclose(costs, dp_costs, rtol=1e-5)
+    # parameters are identical across workers
+    for k in values[0]:
+        np.testing.assert_equal(values[0][k], values[1][k])
+    actual = canopy.network_utils.to_value_dict(network)
+    nt.assert_equal(set(expected), set(actual))
+    for k in expected:
+        np.testing.assert_allclose(expected[k], actual[k], rtol=1e-5)
+
+
+def test_data_parallel_handlers_uneven_shards():
+    x = np.random.randn(9, 5).astype(fX)
+    y = np.random.randn(9, 3).astype(fX)
+    train_fn = canopy.data_parallel.DataParallel(
+        _network(),
+        {"x": "x", "y": "y"},
+        {"cost": "cost"},
+        num_workers=2,
+        handlers_fn=lambda: [canopy.handlers.chunk_variables(
+            2, ["x", "y"], strict_size=False)],
+        include_updates=True)
+    train_fn.start()
+    try:
+        nt.assert_raises(ValueError, train_fn, {"x": x, "y": y})
+        # divisible rows are fine
+        train_fn({"x": x[:8], "y": y[:8]})
+    finally:
+        train_fn.stop()
+
+
+def test_data_parallel_local_update_deltas():
+    # the moving statistics of batch normalization depend on the data of
+    # each worker
+    network = tn.HyperparameterNode(
+        "g",
+        tn.SGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode("seq", [
+                tn.InputNode("x", shape=(None, 5)),
+                tn.DenseNode("fc"),
+                bn.AdvancedBatchNormalizationNode("bn")]),
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+                 "target": tn.InputNode("y", shape=(None, 3))})
+             }),
+        num_units=3,
+        learning_rate=0.1,
+        cost_function=treeano.utils.squared_error,
+    ).network()
+    train_fn = canopy.data_parallel.DataParallel(network,
+                                                 {"x": "x", "y": "y"},
+                                                 {"cost": "cost"},
+                                                 num_workers=2,
+                                                 include_updates=True)
+    nt.assert_raises(ValueError, train_fn.start)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import struct
+import zipfile
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+
+import canopy.datasets
+
+
+def _write_shards(dirname, sizes):
+    shards = []
+    total = 0
+    for idx, size in enumerate(sizes):
+        x = np.arange(total, total + size).reshape(-1, 1) * np.ones((1, 3))
+        y = np.arange(total, total + size).astype("int32")
+        total += size
+        if idx % 2 == 0:
+            path = os.path.join(dirname, "shard%d.npz" % idx)
+            np.savez(path, x=x, y=y)
+            shards.append(path)
+        else:
+            x_path = os.path.join(dirname, "x%d.npy" % idx)
+            y_path = os.path.join(dirname, "y%d.npy" % idx)
+            np.save(x_path, x)
+            np.save(y_path, y)
+            shards.append({"x": x_path, "y": y_path})
+    return shards
+
+
+def test_memmap_shards():
+    dirname = tempfile.mkdtemp()
+    try:
+        shards = _write_shards(dirname, [7, 5, 11])
+        chunks = list(canopy.datasets.memmap_shards(shards,
+                                                    chunk_size=6,
+                                                    batch_size=3))
+        nt.assert_equal([len(chunk["y"]) for chunk in chunks], [6, 6, 6, 3])
+        for chunk in chunks:
+            np.testing.assert_equal(chunk["x"][:, 0], chunk["y"])
+        np.testing.assert_equal(np.concatenate([c["y"] for c in chunks]),
+                                np.arange(21))
+
+        shuffled = canopy.datasets.memmap_shards(shards,
+                                                 chunk_size=4,
+                                                 shuffle_shards=True,
+                                                 seed=1)
+        res = np.concatenate([c["y"] for c in shuffled])
+        np.testing.assert_equal(np.sort(res), np.arange(23))
+    finally:
+        shutil.rmtree(dirname)
+
+
+@nt.raises(ValueError)
+def test_memmap_npz_member_compressed():
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, "compressed.npz")
+        np.savez_compressed(path, x=np.ones(3))
+        canopy.datasets.memmap_npz_member(path, "x")
+    finally:
+        shutil.rmtree(dirname)
+
+
+@nt.raises(ValueError)
+def test_memmap_npz_member_unknown_version():
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, "v3.npz")
+        header = b"{'descr': '<f8', 'fortran_order': False, 'shape': (3,), }\n"
+        npy = (b"\x93NUMPY\x03\x00" + struct.pack("<I", len(header))
+               + header + np.ones(3).tobytes())
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+            zf.writestr("x.npy", npy)
+        canopy.datasets.memmap_npz_member(path, "x")
+    finally:
+        shutil.rmtree(dirname)
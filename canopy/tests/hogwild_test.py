@@ -0,0 +1,59 @@
+import nose.tools as nt
+import numpy as np
+import theano
+
+import treeano
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_hogwild():
+    np.random.seed(42)
+    x = np.random.randn(4, 5).astype(fX)
+    y = np.random.randn(4, 3).astype(fX)
+    network = tn.HyperparameterNode(
+        "g",
+        tn.SGDNode(
+            "updates",
+            {"subtree": tn.SequentialNode("seq", [
+                tn.InputNode("x", shape=(None, 5)),
+                tn.DenseNode("fc")]),
+             "cost": tn.TotalCostNode("cost", {
+                 "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+                 "target": tn.InputNode("y", shape=(None, 3))})
+             }),
+        num_units=3,
+        learning_rate=0.05,
+        cost_function=treeano.utils.squared_error,
+    ).network()
+    cost_fn = network.function(["x", "y"], ["cost"])
+    initial_cost = cost_fn(x, y)[0]
+
+    def generator_fn(worker_idx, num_workers):
+        for _ in range(20):
+            yield [x, y]
+
+    hogwild = canopy.hogwild.Hogwild(network,
+                                     ["x", "y"],
+                                     ["cost"],
+                                     num_workers=2)
+    results = hogwild.run(generator_fn)
+    summary = hogwild.summary(results)
+    nt.assert_equal(summary["num_steps"], 40)
+    nt.assert_equal([res["num_steps"] for res in results], [20, 20])
+    # the updates of the workers are visible to the parent process
+    nt.assert_less(cost_fn(x, y)[0], initial_cost)
+
+
+def test_add_changed_rows():
+    arr = np.zeros((4, 2), dtype=fX)
+    delta = np.zeros((4, 2), dtype=fX)
+    delta[1, 0] = 1
+    delta[3] = 2
+    canopy.hogwild._add_changed_rows(arr, delta)
+    np.testing.assert_equal(arr, [[0, 0], [1, 0], [0, 0], [2, 2]])
+    canopy.hogwild._add_changed_rows(arr, delta)
+    np.testing.assert_equal(arr, [[0, 0], [2, 0], [0, 0], [4, 4]])
@@ -0,0 +1,62 @@
+import nose.tools as nt
+import numpy as np
+
+import canopy.parameter_server
+
+
+def test_compress():
+    delta = np.random.randn(10, 20).astype("float32")
+    for compression in canopy.parameter_server.COMPRESSIONS:
+        res = canopy.parameter_server.decompress(
+            canopy.parameter_server.compress(delta, compression),
+            delta.dtype)
+        nt.assert_equal(res.shape, delta.shape)
+        nt.assert_equal(res.dtype, delta.dtype)
+    compressed = canopy.parameter_server.compress(delta,
+                                                  "top_k",
+                                                  top_k_fraction=0.1)
+    res = canopy.parameter_server.decompress(compressed, delta.dtype)
+    nt.assert_equal((res != 0).sum(), 20)
+    # the largest elements are kept
+    np.testing.assert_equal(np.sort(np.abs(res[res != 0])),
+                            np.sort(np.abs(delta).ravel())[-20:])
+
+
+def test_parameter_server_staleness():
+    server = canopy.parameter_server.ParameterServer(
+        {"w": np.zeros(3, dtype="float32")},
+        max_staleness=1).start()
+    try:
+        client1 = server.client()
+        client2 = server.client()
+        version1, _ = client1.pull()
+        version2, _ = client2.pull()
+        delta = {"w": canopy.parameter_server.compress(
+            np.ones(3, dtype="float32"))}
+        nt.assert_equal(client1.push(version1, delta), (True, 1))
+        nt.assert_equal(client2.push(version2, delta), (True, 2))
+        # 2 pushes since client2 pulled
+        nt.assert_equal(client2.push(version2, delta), (False, 2))
+        version, values = client1.pull()
+        nt.assert_equal(version, 2)
+        np.testing.assert_equal(values["w"], 2 * np.ones(3))
+        nt.assert_equal(client1.stats()["num_rejected"], 1)
+    finally:
+        server.stop()
+
+
+def test_parameter_server_error():
+    server = canopy.parameter_server.ParameterServer(
+        {"w": np.zeros(3, dtype="float32")}).start()
+    try:
+        client = server.client()
+        version, _ = client.pull()
+        for deltas in [{"v": canopy.parameter_server.compress(np.ones(3))},
+                       {"w": canopy.parameter_server.compress(np.ones(2))}]:
+            nt.assert_raises(RuntimeError, client.push, version, deltas)
+        # the connection is still usable, and nothing was applied
+        version, values = client.pull()
+        nt.assert_equal(version, 0)
+        np.testing.assert_equal(values["w"], np.zeros(3))
+    finally:
+        server.stop()
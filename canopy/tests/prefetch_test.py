@@ -0,0 +1,54 @@
+import nose.tools as nt
+import numpy as np
+
+import canopy.prefetch
+
+
+def _make_item(i):
+    return {"x": np.ones((3, 4)) * i, "i": i}
+
+
+def test_process_map():
+    res = [item["i"] for item in canopy.prefetch.process_map(_make_item,
+                                                             range(20),
+                                                             num_workers=3)]
+    nt.assert_equal(res, list(range(20)))
+    for item in canopy.prefetch.process_map(_make_item, range(5)):
+        np.testing.assert_equal(item["x"], np.ones((3, 4)) * item["i"])
+
+
+def test_process_map_unordered():
+    res = [item["i"] for item in canopy.prefetch.process_map(_make_item,
+                                                             range(20),
+                                                             num_workers=3,
+                                                             ordered=False)]
+    nt.assert_equal(sorted(res), list(range(20)))
+
+
+def test_process_map_pickle_fallback():
+    res = [item["x"][0, 0]
+           for item in canopy.prefetch.process_map(_make_item,
+                                                   range(5),
+                                                   slot_bytes=8)]
+    nt.assert_equal(res, list(range(5)))
+
+
+def test_process_generator():
+
+    def generator_fn(worker_idx, num_workers):
+        for i in range(worker_idx, 10, num_workers):
+            yield _make_item(i)
+
+    res = [item["i"] for item in canopy.prefetch.process_generator(
+        generator_fn,
+        num_workers=2)]
+    nt.assert_equal(res, list(range(10)))
+
+
+@nt.raises(RuntimeError)
+def test_process_map_error():
+
+    def fn(i):
+        raise ValueError()
+
+    list(canopy.prefetch.process_map(fn, range(3)))
@@ -0,0 +1,68 @@
+import threading
+
+import nose.tools as nt
+import numpy as np
+import theano
+
+import treeano
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_theano_function_replicas():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(None, 3)),
+         tn.LinearMappingNode("lm",
+                              output_dim=2,
+                              inits=[treeano.inits.ConstantInit(1)])]
+    ).network()
+    fn = network.function(["i"], ["seq"])
+    replicas = canopy.replicas.theano_function_replicas(fn, 3)
+    nt.assert_equal(len(replicas), 3)
+    # replicas share parameters
+    network["lm"].get_variable("weight").value = 2 * np.ones((3, 2), dtype=fX)
+    x = np.ones((4, 3), dtype=fX)
+    for replica in replicas:
+        np.testing.assert_equal(replica(x)[0], 6 * np.ones((4, 2), dtype=fX))
+
+
+def test_replica_pool():
+    network = tn.InputNode("i", shape=(None, 2)).network()
+    replicas = canopy.replicas.handled_fn_replicas(
+        2,
+        network,
+        lambda: [canopy.handlers.batch_pad(3, keys=["x"])],
+        {"x": "i"},
+        {"out": "i"})
+    pool = canopy.replicas.ReplicaPool(replicas)
+    errors = []
+
+    def worker(i):
+        x = np.ones((5, 2), dtype=fX) * i
+        for _ in range(10):
+            # batch_pad pads the 5 rows to 6, and doesn't trim the outputs
+            out = pool({"x": x})["out"]
+            if not np.all(out[:len(x)] == x):
+                errors.append(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    nt.assert_equal(errors, [])
+    nt.assert_equal(pool._free.qsize(), 2)
+
+
+def test_throughput_by_replica_count():
+    res = canopy.replicas.throughput_by_replica_count(
+        lambda n: [lambda x: x] * n,
+        [1],
+        replica_counts=[1, 2],
+        num_calls=10)
+    nt.assert_equal([r["num_replicas"] for r in res], [1, 2])
+    nt.assert_true(all(r["calls_per_second"] > 0 for r in res))
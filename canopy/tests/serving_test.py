@@ -0,0 +1,68 @@
+import threading
+
+import nose.tools as nt
+import numpy as np
+import theano
+
+import treeano.nodes as tn
+import canopy
+
+
+fX = theano.config.floatX
+
+
+def test_micro_batch_server():
+    network = tn.InputNode("i", shape=(None, 2)).network()
+    fn = canopy.handlers.handled_fn(network,
+                                    [],
+                                    {"x": "i"},
+                                    {"out": "i"})
+    server = canopy.serving.MicroBatchServer(fn,
+                                             max_batch_size=8,
+                                             max_wait=0.01).start()
+    client = canopy.serving.InProcessClient(server, timeout=10)
+    results = {}
+
+    def predict(i):
+        x = np.ones((1 + i % 3, 2), dtype=fX) * i
+        results[i] = (x, client.predict({"x": x})["out"])
+
+    threads = [threading.Thread(target=predict, args=(i,))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.stop()
+
+    nt.assert_equal(len(results), 20)
+    for x, out in results.values():
+        np.testing.assert_equal(x, out)
+    stats = server.stats()
+    nt.assert_equal(stats["num_requests"], 20)
+    nt.assert_equal(stats["queue_depth"], 0)
+
+
+@nt.raises(ValueError)
+def test_micro_batch_server_exception():
+
+    def fn(in_dict):
+        raise ValueError()
+
+    server = canopy.serving.MicroBatchServer(fn).start()
+    try:
+        canopy.serving.InProcessClient(server).predict(
+            {"x": np.zeros((1, 2))})
+    finally:
+        server.stop()
+
+
+def test_micro_batch_server_stop_fails_pending():
+    server = canopy.serving.MicroBatchServer(lambda in_dict: in_dict)
+    # not started, so the requests stay queued
+    requests = [server.submit({"x": np.zeros((1, 2))}) for _ in range(3)]
+    server.stop()
+    for request in requests:
+        nt.assert_true(request.done())
+        nt.assert_raises(RuntimeError, request.result, 0)
+    nt.assert_raises(RuntimeError, server.submit, {"x": np.zeros((1, 2))})
@@ -52,6 +52,7 @@ def network_to_kwargs(network, priority="post_override"):
         root_node=root_node,
         override_hyperparameters=override_hyperparameters,
         default_hyperparameters=default_hyperparameters,
+        lazy=network.lazy,
     )
 
 
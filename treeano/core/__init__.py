@@ -1,5 +1,9 @@
 import update_deltas
 import graph
+import build_profile
+import function_cache
+import parameter_arena
+import op_profile
 import inits
 import variable
 import serialization_state
@@ -12,6 +16,10 @@ from update_deltas import UpdateDeltas
 from inits import (SharedInit,
                    WeightInit)
 from variable import VariableWrapper
+from build_profile import BuildProfile
+from function_cache import FunctionCache
+from parameter_arena import ParameterArena
+from op_profile import NodeOpProfile
 from serialization_state import (register_node,
                                  register_children_container,
                                  children_container_to_data,
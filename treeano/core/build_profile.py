@@ -0,0 +1,118 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import time
+import contextlib
+import collections
+
+import theano
+
+PHASES = ("init_long_range_dependencies",
+          "init_state",
+          "compute_output",
+          "mutate_update_deltas")
+
+
+def count_apply_nodes(input_vars, output_vars):
+    """
+    returns the number of theano apply nodes needed to compute the given
+    output variables from the given input variables
+    """
+    if not output_vars:
+        return 0
+    return len(theano.gof.graph.io_toposort(list(input_vars),
+                                            list(output_vars)))
+
+
+class BuildProfile(object):
+
+    """
+    per-node wall time and call counts of each phase of Network.build,
+    as well as the number of theano apply nodes added by each node's
+    compute_output
+
+    usage:
+    >>> network.build(profile=True)
+    >>> print(network.build_profile.table())
+    """
+
+    def __init__(self):
+        # map from node name to the profile of that node
+        self.nodes = collections.OrderedDict()
+
+    def _node_profile(self, node):
+        if node.name not in self.nodes:
+            self.nodes[node.name] = dict(
+                node_class=node.__class__.__name__,
+                time={phase: 0.0 for phase in PHASES},
+                count={phase: 0 for phase in PHASES},
+                num_apply_nodes=0,
+            )
+        return self.nodes[node.name]
+
+    @contextlib.contextmanager
+    def time(self, node, phase):
+        assert phase in PHASES
+        node_profile = self._node_profile(node)
+        start_time = time.time()
+        yield
+        node_profile["time"][phase] += time.time() - start_time
+        node_profile["count"][phase] += 1
+
+    def add_apply_nodes(self, node, num_apply_nodes):
+        self._node_profile(node)["num_apply_nodes"] += num_apply_nodes
+
+    def by_node_class(self):
+        """
+        returns the profile aggregated by node class, as a map from node
+        class name to the summed profile of all nodes of that class
+        """
+        classes = collections.OrderedDict()
+        for node_profile in self.nodes.values():
+            node_class = node_profile["node_class"]
+            if node_class not in classes:
+                classes[node_class] = dict(
+                    num_nodes=0,
+                    time={phase: 0.0 for phase in PHASES},
+                    count={phase: 0 for phase in PHASES},
+                    num_apply_nodes=0,
+                )
+            class_profile = classes[node_class]
+            class_profile["num_nodes"] += 1
+            for phase in PHASES:
+                class_profile["time"][phase] += node_profile["time"][phase]
+                class_profile["count"][phase] += node_profile["count"][phase]
+            class_profile["num_apply_nodes"] += node_profile["num_apply_nodes"]
+        return classes
+
+    def table(self, by="node_class"):
+        """
+        returns a table of the profile as a string, sorted by total time in
+        decreasing order
+
+        by:
+        either "node_class" to aggregate by node class or "node" to have
+        a row per node
+        """
+        if by == "node_class":
+            rows = self.by_node_class()
+        elif by == "node":
+            rows = self.nodes
+        else:
+            raise ValueError("Unknown by: %s" % by)
+
+        def total_time(item):
+            return sum(item[1]["time"].values())
+
+        headers = ([by, "total"]
+                   + ["%s (count)" % phase for phase in PHASES]
+                   + ["apply_nodes"])
+        lines = ["\t".join(headers)]
+        for key, row in sorted(rows.items(), key=total_time, reverse=True):
+            cells = [key, "%0.4fs" % sum(row["time"].values())]
+            for phase in PHASES:
+                cells.append("%0.4fs (%d)" % (row["time"][phase],
+                                              row["count"][phase]))
+            cells.append("%d" % row["num_apply_nodes"])
+            lines.append("\t".join(cells))
+        return "\n".join(lines)
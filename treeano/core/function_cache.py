@@ -0,0 +1,258 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import os
+import types
+import pickle
+import hashlib
+import warnings
+
+import six
+import numpy as np
+import theano
+
+# theano flags that affect the compiled function
+THEANO_FLAGS = ("device",
+                "floatX",
+                "mode",
+                "linker",
+                "optimizer",
+                "optimizer_excluding",
+                "optimizer_including",
+                "cast_policy",
+                "allow_gc")
+
+
+def _canonical(obj):
+    """
+    returns a string representation of the given object that is stable
+    across processes, or raises a TypeError if there isn't one
+    """
+    if obj is None or isinstance(obj, (bool, float) + six.integer_types):
+        return repr(obj)
+    elif isinstance(obj, six.string_types):
+        return "s:" + obj
+    elif isinstance(obj, (list, tuple)):
+        return "%s[%s]" % (obj.__class__.__name__,
+                           ",".join(_canonical(x) for x in obj))
+    elif isinstance(obj, (set, frozenset)):
+        return "set[%s]" % ",".join(sorted(_canonical(x) for x in obj))
+    elif isinstance(obj, dict):
+        items = sorted((_canonical(k), _canonical(v))
+                       for k, v in obj.items())
+        return "dict{%s}" % ",".join("%s:%s" % item for item in items)
+    elif isinstance(obj, np.ndarray):
+        return "ndarray(%s,%s,%s)" % (obj.dtype,
+                                      obj.shape,
+                                      hashlib.sha1(obj.tobytes()).hexdigest())
+    elif isinstance(obj, np.generic):
+        return "%s(%r)" % (obj.dtype, obj)
+    elif isinstance(obj, theano.gof.graph.Variable):
+        return "var(%s)" % theano.printing.debugprint(obj,
+                                                      file="str",
+                                                      print_type=True)
+    elif isinstance(obj, types.FunctionType):
+        return "fn(%s.%s,%s,%s,%s)" % (obj.__module__,
+                                       obj.__name__,
+                                       _canonical_code(obj.__code__),
+                                       _canonical(obj.__defaults__),
+                                       _canonical_closure(obj.__closure__))
+    elif isinstance(obj, types.CodeType):
+        return _canonical_code(obj)
+    elif isinstance(obj, type):
+        return "%s.%s" % (obj.__module__, obj.__name__)
+    elif hasattr(obj, "__dict__"):
+        return "%s.%s(%s)" % (obj.__class__.__module__,
+                              obj.__class__.__name__,
+                              _canonical(obj.__dict__))
+    else:
+        raise TypeError("Can't fingerprint object: %s" % repr(obj))
+
+
+def _canonical_code(code):
+    """
+    fingerprints the code of a function, so that different functions with
+    the same name (eg. lambdas, or closures created by the same function)
+    have different representations
+
+    NOTE: the values of globals referenced by the code aren't included,
+    only their names
+    """
+    return "code(%s,%s,%s)" % (hashlib.sha1(code.co_code).hexdigest(),
+                               _canonical(code.co_consts),
+                               _canonical(code.co_names))
+
+
+def _canonical_closure(closure):
+    if closure is None:
+        return "None"
+    contents = []
+    for cell in closure:
+        try:
+            contents.append(cell.cell_contents)
+        except ValueError:
+            raise TypeError("Can't fingerprint closure with an empty cell")
+    return _canonical(tuple(contents))
+
+
+def fingerprint(obj):
+    """
+    returns a hash of the given object that is stable across processes
+    """
+    canonical = _canonical(obj)
+    if isinstance(canonical, six.text_type):
+        canonical = canonical.encode("utf-8")
+    return hashlib.sha1(canonical).hexdigest()
+
+
+def theano_flags():
+    flags = {flag: str(getattr(theano.config, flag, None))
+             for flag in THEANO_FLAGS}
+    flags["version"] = theano.__version__
+    return flags
+
+
+def shared_inputs(inputs, outputs, updates, givens):
+    """
+    returns the shared variables that theano.function would use as implicit
+    inputs for the given arguments, in the same order
+    """
+    _, _, other = theano.compile.pfunc.rebuild_collect_shared(
+        outputs,
+        inputs,
+        replace=givens,
+        updates=updates if updates is not None else [],
+        rebuild_strict=True,
+        copy_inputs_over=True)
+    return other[3]
+
+
+class FunctionCache(object):
+
+    """
+    persistent on-disk cache of compiled theano functions, stored as pickles
+    in a directory and evicted in least-recently-used order once the
+    directory is larger than max_bytes
+
+    cached functions are rebound to the shared variables of the graph that
+    is being compiled, so they share state with the network that requested
+    them
+
+    usage:
+    >>> cache = FunctionCache("/tmp/fn_cache")
+    >>> network.function(["x"], ["y"], function_cache=cache)
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        # the cached graph is already optimized
+        old_reoptimize = getattr(theano.config,
+                                 "reoptimize_unpickled_function",
+                                 None)
+        if old_reoptimize is not None:
+            theano.config.reoptimize_unpickled_function = False
+        try:
+            with open(path, "rb") as f:
+                fn = pickle.load(f)
+        except Exception as e:
+            warnings.warn("Failed to load cached function %s: %s"
+                          % (path, e))
+            return None
+        finally:
+            if old_reoptimize is not None:
+                theano.config.reoptimize_unpickled_function = old_reoptimize
+        # mark as recently used
+        os.utime(path, None)
+        return fn
+
+    def _store(self, key, fn):
+        path = self._path(key)
+        # write to a temporary file, so that concurrent processes never
+        # read a partially written function
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(fn, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        removes least recently used functions until the cache is at most
+        max_bytes large
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+    def _rebind(self, fn, inputs, outputs, updates, givens):
+        """
+        returns a copy of the given cached function using the shared
+        variables of the given graph, or None if they don't match
+        """
+        old_shared = [i.variable for i in fn.maker.inputs if i.implicit]
+        new_shared = shared_inputs(inputs, outputs, updates, givens)
+        if len(old_shared) != len(new_shared):
+            return None
+        for old, new in zip(old_shared, new_shared):
+            if old.type != new.type or old.name != new.name:
+                return None
+        return fn.copy(swap=dict(zip(old_shared, new_shared)))
+
+    def function(self, key_data, inputs, outputs, updates, givens, **kwargs):
+        """
+        like theano.function, but returns a cached function if one exists
+        for the given key_data, which should uniquely identify the graph
+        being compiled
+        """
+        try:
+            key = fingerprint(dict(
+                key_data=key_data,
+                kwargs=kwargs,
+                theano_flags=theano_flags(),
+            ))
+        except (TypeError, RuntimeError) as e:
+            # RuntimeError for objects with recursive references
+            warnings.warn("Not caching function: %s" % e)
+            key = None
+        if key is not None:
+            fn = self._load(key)
+            if fn is not None:
+                fn = self._rebind(fn, inputs, outputs, updates, givens)
+                if fn is not None:
+                    return fn
+        fn = theano.function(inputs=inputs,
+                             outputs=outputs,
+                             updates=updates,
+                             givens=givens,
+                             **kwargs)
+        if key is not None:
+            self._store(key, fn)
+        return fn
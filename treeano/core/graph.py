@@ -40,6 +40,41 @@ def init_architectural_tree(name_to_node):
     return g
 
 
+def architecture_post_order_names(root_node):
+    """
+    returns the names of all nodes in the architectural tree with each
+    node after its children, and children in the order they are given
+    """
+    names = []
+    # DFS traversal
+    stack = [(root_node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            names.append(node.name)
+        else:
+            stack.append((node, True))
+            children = node.architecture_children()
+            stack.extend((child, False) for child in reversed(children))
+    return names
+
+
+def init_architecture_intervals(name_to_node, post_order_names):
+    """
+    returns a map from each node name to the (start, stop) range of its
+    subtree in the given post-order traversal of the architectural tree
+    """
+    subtree_sizes = {}
+    intervals = {}
+    for idx, name in enumerate(post_order_names):
+        children = name_to_node[name].architecture_children()
+        # children are always before their parent in post-order
+        size = 1 + sum(subtree_sizes[child.name] for child in children)
+        subtree_sizes[name] = size
+        intervals[name] = (idx + 1 - size, idx + 1)
+    return intervals
+
+
 class TreeanoGraph(object):
 
     """
@@ -60,6 +95,37 @@ class TreeanoGraph(object):
         #   node multiple times
         self.computation_graph = nx.MultiDiGraph(
             self.architectural_tree.copy())
+        # index of computation graph dependencies for each node, as a map
+        # from to_key to (from_name, from_key)
+        # ---
+        # this is kept in sync with add_dependency / remove_dependency so
+        # that input edge lookups don't have to scan every edge of the graph
+        self.input_edges_index = {name: {} for name in self.name_to_node}
+        # the architectural tree doesn't change, so its topological order
+        # only needs to be computed once
+        self.architecture_order = nx.topological_sort(self.architectural_tree)
+        # in a post-order traversal, each subtree is a contiguous range of
+        # nodes, so subtree queries can be done with a range lookup
+        self.architecture_post_order = architecture_post_order_names(
+            root_node)
+        self.architecture_intervals = init_architecture_intervals(
+            self.name_to_node,
+            self.architecture_post_order)
+        # maintain a topological order of the computation graph across
+        # insertions of dependencies, so that checking for cycles doesn't
+        # require sorting the whole graph
+        # ---
+        # the initial order is a post-order traversal of the tree following
+        # the order of children, since dependencies between siblings (eg. in
+        # sequential nodes) most often go in the same direction, which
+        # makes most insertions not require any reordering
+        self.computation_order_index = {
+            name: idx
+            for idx, name in enumerate(self.architecture_post_order)}
+        self._computation_order = None
+        # cache of ancestors for each node in the architectural tree, since
+        # the tree doesn't change
+        self._architecture_ancestors = {}
         self.is_mutable = True
 
     def _nodes(self, order=None):
@@ -69,9 +135,13 @@ class TreeanoGraph(object):
         if order is None:
             node_names = self.name_to_node.keys()
         elif order == "architecture":
-            node_names = nx.topological_sort(self.architectural_tree)
+            node_names = self.architecture_order
         elif order == "computation":
-            node_names = nx.topological_sort(self.computation_graph)
+            if self._computation_order is None:
+                self._computation_order = sorted(
+                    self.computation_order_index,
+                    key=self.computation_order_index.get)
+            node_names = self._computation_order
         else:
             raise ValueError("Unknown order: %s" % order)
         # make sure that all of the original nodes are returned
@@ -95,7 +165,14 @@ class TreeanoGraph(object):
         removes a computation graph dependency from a node with "from_name" as
         a name to a node with "to_name" as a name
         """
-        self.computation_graph.remove_edge(from_name, to_name)
+        # remove a single (arbitrary) edge between the nodes, keeping the
+        # input edge index in sync
+        edge_dict = self.computation_graph[from_name][to_name]
+        edge_key = max(edge_dict)
+        to_key = edge_dict[edge_key].get("to_key")
+        self.computation_graph.remove_edge(from_name, to_name, key=edge_key)
+        if to_key is not None:
+            del self.input_edges_index[to_name][to_key]
 
     def add_dependency(self,
                        from_name,
@@ -117,45 +194,87 @@ class TreeanoGraph(object):
         assert from_name in self.name_to_node
         assert to_name in self.name_to_node
         # make sure that to_key is unique for to-node
-        for _, edge_to, datamap in self.computation_graph.edges(data=True):
-            if edge_to == to_name and datamap.get("to_key") == to_key:
-                raise ValueError("Non-unique to_key(%s) found for node %s"
-                                 % (to_key, to_name))
+        if to_key in self.input_edges_index[to_name]:
+            raise ValueError("Non-unique to_key(%s) found for node %s"
+                             % (to_key, to_name))
+        # make sure that the dependency doesn't cause any cycles
+        # ---
+        # this is done before adding the edge, so that there is nothing
+        # to undo on failure
+        self._update_computation_order(from_name, to_name)
         # add the dependency
         self.computation_graph.add_edge(from_name,
                                         to_name,
                                         from_key=from_key,
                                         to_key=to_key)
-        # make sure that the dependency doesn't cause any cycles
-        try:
-            nx.topological_sort(self.computation_graph)
-        except nx.NetworkXUnfeasible:
-            # TODO this might not be sufficient, since an edge between
-            # from_name to to_name might have existed before this operation
-            self.computation_graph.remove_edge(from_name, to_name)
+        self.input_edges_index[to_name][to_key] = (from_name, from_key)
+
+    def _update_computation_order(self, from_name, to_name):
+        """
+        updates the topological order of the computation graph for a new
+        edge from a node with "from_name" as a name to a node with "to_name"
+        as a name, raising if the edge would create a cycle
+
+        uses the online algorithm from "A Dynamic Topological Sort Algorithm
+        for Directed Acyclic Graphs" (Pearce and Kelly 2006): only nodes
+        whose position lies between the two endpoints are searched and
+        reordered
+        """
+        order_index = self.computation_order_index
+        lower = order_index[to_name]
+        upper = order_index[from_name]
+        if upper < lower:
+            # the order is already valid for the new edge
+            return
+
+        def search(start_name, neighbors, in_region):
+            visited = {start_name}
+            stack = [start_name]
+            while stack:
+                name = stack.pop()
+                for neighbor in neighbors(name):
+                    if neighbor not in visited and in_region(neighbor):
+                        visited.add(neighbor)
+                        stack.append(neighbor)
+            return visited
+
+        # nodes reachable from to-node that are currently before from-node
+        forward = search(to_name,
+                         self.computation_graph.successors,
+                         lambda name: order_index[name] <= upper)
+        if from_name in forward:
             # TODO maybe use a custom exception
-            raise
+            raise nx.NetworkXUnfeasible(
+                "Dependency from %s to %s would create a cycle"
+                % (from_name, to_name))
+        # nodes that reach from-node that are currently after to-node
+        backward = search(from_name,
+                          self.computation_graph.predecessors,
+                          lambda name: order_index[name] >= lower)
+        # reuse the positions of the affected nodes, placing everything that
+        # reaches from-node before everything reachable from to-node
+        names = (sorted(backward, key=order_index.get)
+                 + sorted(forward, key=order_index.get))
+        positions = sorted(order_index[name] for name in names)
+        for name, position in zip(names, positions):
+            order_index[name] = position
+        self._computation_order = None
 
     def all_input_edges_for_node(self, node_name):
         """
         returns all edges and their corresponding data going into the given
         node
         """
-        edges = self.computation_graph.edges(data=True)
+        edges = self.computation_graph.in_edges(node_name, data=True)
         for edge_from, edge_to, datamap in edges:
-            if edge_to == node_name:
-                yield (edge_from, edge_to, datamap)
+            yield (edge_from, edge_to, datamap)
 
     def input_edge_for_node(self, node_name, to_key="default"):
         """
         searches for the input node and from_key of a given node with a given
         to_key, and returns None if not found
         """
-        for edge_from, _, datamap in self.all_input_edges_for_node(node_name):
-            if datamap.get("to_key") == to_key:
-                from_key = datamap["from_key"]
-                return (edge_from, from_key)
-        return None
+        return self.input_edges_index[node_name].get(to_key)
 
     def architecture_ancestor_names(self, node_name):
         """
@@ -182,19 +301,53 @@ class TreeanoGraph(object):
         architectural tree, in the order of being closer to the node
         towards the root
         """
-        for ancestor_name in self.architecture_ancestor_names(node_name):
-            yield self.name_to_node[ancestor_name]
+        for ancestor in self.architecture_ancestors_list(node_name):
+            yield ancestor
+
+    def architecture_ancestors_list(self, node_name):
+        """
+        returns a list of ancestors of the current node in the
+        architectural tree, in the order of being closer to the node
+        towards the root
+
+        NOTE: the list is cached and should not be mutated
+        """
+        # walk towards the root until a node with cached ancestors is found
+        uncached_names = []
+        current_name = node_name
+        while current_name not in self._architecture_ancestors:
+            uncached_names.append(current_name)
+            parent_names = self.architectural_tree.successors(current_name)
+            if len(parent_names) == 0:
+                # the root has no ancestors
+                self._architecture_ancestors[current_name] = []
+            else:
+                # in a tree, each node should have a single parent, except
+                # the root
+                current_name, = parent_names
+        # fill in the cache from the root towards the node
+        for name in reversed(uncached_names):
+            if name not in self._architecture_ancestors:
+                parent_name, = self.architectural_tree.successors(name)
+                self._architecture_ancestors[name] = (
+                    [self.name_to_node[parent_name]]
+                    + self._architecture_ancestors[parent_name])
+        return self._architecture_ancestors[node_name]
 
     def architecture_subtree_names(self, node_name):
         """
         returns an unordered set of descendant names of the current node in the
         architectural tree
         """
-        # NOTE: this is actually the descendants, despite the name, because
-        # of the way we set up the tree
-        descendant_names = nx.ancestors(self.architectural_tree, node_name)
-        subtree_names = descendant_names | {node_name}
-        return subtree_names
+        return set(self.architecture_subtree_names_list(node_name))
+
+    def architecture_subtree_names_list(self, node_name):
+        """
+        returns a list of descendant names of the current node in the
+        architectural tree (including the node itself), in post-order
+        """
+        start, stop = self.architecture_intervals[node_name]
+        return self.architecture_post_order[start:stop]
 
     def architecture_subtree(self, node_name):
         """
@@ -1,10 +1,16 @@
+import bisect
 import types
+import contextlib
 
 import theano
 
 from .graph import TreeanoGraph
+from .build_profile import (BuildProfile,
+                            count_apply_nodes)
 from .update_deltas import UpdateDeltas
+from . import op_profile
 from .variable import VariableWrapper
+from .serialization_state import node_to_data
 
 
 class MissingHyperparameter(Exception):
@@ -20,7 +26,15 @@ class Network(object):
     def __init__(self,
                  root_node,
                  override_hyperparameters=None,
-                 default_hyperparameters=None):
+                 default_hyperparameters=None,
+                 lazy=False):
+        """
+        lazy:
+        whether or not to only compute the outputs of nodes when they
+        are requested (eg. by Network.function), so that parts of the
+        network that aren't needed (eg. the cost and updates for inference)
+        are never built
+        """
         if override_hyperparameters is None:
             override_hyperparameters = dict()
         if default_hyperparameters is None:
@@ -32,14 +46,44 @@ class Network(object):
         self.update_deltas = UpdateDeltas()
         self.override_hyperparameters = override_hyperparameters
         self.default_hyperparameters = default_hyperparameters
+        self.lazy = lazy
+        # names of nodes whose outputs have been computed
+        self.computed_node_names = set()
+        self.update_deltas_computed = False
+        # cache of hyperparameters found for each node, as a map from
+        # (node name, hyperparameter keys) to the found values in order of
+        # precedence
+        # ---
+        # this is invalidated whenever a hyperparameter is set
+        self.hyperparameter_cache = {}
+        # inverted index from tag to variables with that tag, as a sorted
+        # list of (architecture position, node name, variable name)
+        # ---
+        # because subtrees are contiguous ranges of architecture positions,
+        # finding tagged variables in a subtree is a range lookup
+        self.variable_tag_index = {}
+        # map from theano variable to the static shape of that variable, for
+        # inferring the shapes of variables without a given shape
+        self.static_shapes = {}
+        # profile of the build, if built with profile=True
+        self.build_profile = None
+        # map from shared variable to the name of the node that last set its
+        # update delta, if built with profile=True
+        self.update_delta_owners = {}
 
     @property
     def is_built(self):
         return hasattr(self, "graph")
 
-    def build(self):
+    def build(self, profile=False):
         """
         initialize network state
+
+        profile:
+        whether or not to record the time and number of calls of each phase
+        of the build for each node, as well as the number of theano apply
+        nodes added by each node, in self.build_profile
+        NOTE: has no effect if the network is already built
         """
         # make building idempotent
         # ---
@@ -49,6 +93,8 @@ class Network(object):
         # network
         if self.is_built:
             return
+        if profile:
+            self.build_profile = BuildProfile()
         self.graph = TreeanoGraph(self.root_node)
         # set node state for each node to be empty
         # ---
@@ -65,7 +111,8 @@ class Network(object):
         # ---
         # order doesn't matter
         for node in self.graph.architectural_tree_nodes_root_to_leaves():
-            node.init_long_range_dependencies(self.relative_network(node))
+            with self._time_build_phase(node, "init_long_range_dependencies"):
+                node.init_long_range_dependencies(self.relative_network(node))
         # initialize state
         # ---
         # outer nodes have their state initialized
@@ -73,49 +120,133 @@ class Network(object):
         # the first child will depend on the input of the sequential node, and
         # we would like to make that dependency explicit
         for node in self.graph.architectural_tree_nodes_root_to_leaves():
-            node.init_state(self.relative_network(node))
+            with self._time_build_phase(node, "init_state"):
+                node.init_state(self.relative_network(node))
         # freeze computation graph
         # ---
         # if a node changes the computation graph while traversing it,
         # there is a chance that the relevant nodes have already been processed
         # thus being a likely source of error
         self.graph.is_mutable = False
+        if not self.lazy:
+            self.compute_all()
+
+    def compute_all(self):
+        """
+        computes the outputs and update deltas of all nodes that have
+        not already been computed
+        """
+        self.build()
         # compute and store outputs
         # ---
         # compute in the order of the computation DAG, so that all
         # dependencies have been computed for each node by the time
         # computation for the node has to occur
         for node in self.graph.computation_graph_nodes_topological():
-            rel_network = self.relative_network(node)
-            # get input keys
-            input_keys = node.get_input_keys(rel_network)
-            # lookup input variables
-            inputs = []
-            for input_key in input_keys:
-                # find which node our input comes from, and the name of
-                # the variable containing the input
-                node_name, from_key = self.graph.input_edge_for_node(node.name,
-                                                                     input_key)
-                inputs.append(self[node_name].get_variable(from_key))
-            # store input variables for the node
-            # ---
-            # there is no immediate reason to do so, but doing it just in case
-            # for now
-            rel_network.store_inputs(dict(zip(input_keys, inputs)))
-            # compute outputs
-            output_res = node.compute_output(rel_network, *inputs)
-            # sanity check to make sure no user accidentaly returns a value
-            # instead of creating a variable
-            assert output_res is None
+            if node.name not in self.computed_node_names:
+                self._compute_node_output(node)
         # compute updates
         # ---
         # compute from top (root) to bottom (leaves) so that low levels
         # of the tree (ie. more specific update rules) can overwrite / mutate
         # the update rules from higher leveles of the tree (ie. more general
         # update rules)
-        for node in self.graph.architectural_tree_nodes_root_to_leaves():
-            node.mutate_update_deltas(self.relative_network(node),
-                                      self.update_deltas)
+        if not self.update_deltas_computed:
+            self.update_deltas_computed = True
+            for node in self.graph.architectural_tree_nodes_root_to_leaves():
+                if self.build_profile is not None:
+                    prev_deltas = dict(self.update_deltas.deltas)
+                with self._time_build_phase(node, "mutate_update_deltas"):
+                    node.mutate_update_deltas(self.relative_network(node),
+                                              self.update_deltas)
+                if self.build_profile is not None:
+                    for var, delta in self.update_deltas.deltas.items():
+                        if prev_deltas.get(var) is not delta:
+                            self.update_delta_owners[var] = node.name
+
+    def compute_outputs(self, node_names):
+        """
+        computes the outputs of the nodes with the given names, as well as
+        all the nodes they transitively depend on in the computation graph,
+        that have not already been computed
+        """
+        self.build()
+        if self.graph.is_mutable:
+            # outputs can't be computed while the computation graph is
+            # still being initialized
+            return
+        # find all nodes that need to be computed
+        # ---
+        # no need to search past computed nodes, because their dependencies
+        # must have been computed as well
+        to_compute = set()
+        stack = [name for name in node_names
+                 if name not in self.computed_node_names]
+        while stack:
+            name = stack.pop()
+            if name in to_compute:
+                continue
+            to_compute.add(name)
+            for dependency_name in self.graph.computation_graph.predecessors(
+                    name):
+                if dependency_name not in self.computed_node_names:
+                    stack.append(dependency_name)
+        # compute in the order of the computation DAG
+        order_index = self.graph.computation_order_index
+        for name in sorted(to_compute, key=order_index.get):
+            # a node may have been computed on demand by an earlier node
+            if name not in self.computed_node_names:
+                self._compute_node_output(self.graph.name_to_node[name])
+
+    def _compute_node_output(self, node):
+        # mark the node as computed before computing it, so that the node
+        # can access its own variables while computing its outputs
+        self.computed_node_names.add(node.name)
+        rel_network = self.relative_network(node)
+        # get input keys
+        input_keys = node.get_input_keys(rel_network)
+        # lookup input variables
+        inputs = []
+        for input_key in input_keys:
+            # find which node our input comes from, and the name of
+            # the variable containing the input
+            node_name, from_key = self.graph.input_edge_for_node(node.name,
+                                                                 input_key)
+            inputs.append(self[node_name].get_variable(from_key))
+        # store input variables for the node
+        # ---
+        # there is no immediate reason to do so, but doing it just in case
+        # for now
+        rel_network.store_inputs(dict(zip(input_keys, inputs)))
+        # compute outputs
+        with self._time_build_phase(node, "compute_output"):
+            output_res = node.compute_output(rel_network, *inputs)
+        # sanity check to make sure no user accidentaly returns a value
+        # instead of creating a variable
+        assert output_res is None
+        if self.build_profile is not None:
+            # only count variables that have already been created, to
+            # not cause lazy variables to be created
+            output_vars = [
+                vw.variable_
+                for vw in rel_network._state["current_variables"].values()
+                if vw.variable_ is not None]
+            self.build_profile.add_apply_nodes(
+                node,
+                count_apply_nodes([vw.variable for vw in inputs],
+                                  output_vars))
+
+    @contextlib.contextmanager
+    def _time_build_phase(self, node, phase):
+        """
+        records the time of a phase of the build for the given node, if
+        profiling the build
+        """
+        if self.build_profile is None:
+            yield
+        else:
+            with self.build_profile.time(node, phase):
+                yield
 
     def relative_network(self, node):
         """
@@ -159,6 +290,8 @@ class Network(object):
                  include_updates=False,
                  updates=None,
                  givens=None,
+                 function_cache=None,
+                 parameter_arena=None,
                  **kwargs):
         """
         wrapper around theano.function that allows reference node outputs
@@ -166,14 +299,45 @@ class Network(object):
 
         example:
         network.function(["input_node"], ["fc_node", "loss", ("conv1", "W")])
+
+        function_cache:
+        optional FunctionCache to load the compiled function from (or store
+        it in), so that compilation can be skipped across processes
+
+        parameter_arena:
+        optional ParameterArena, so that the function reads the shared
+        variables in the arena from their contiguous storage, and updates
+        them with a single update per dtype
+
+        profile:
+        (passed to theano.function) if set, the variables of the graph are
+        tagged with the node that created them, so that the op-level
+        profile can be attributed to nodes (see op_profile.NodeOpProfile)
         """
         self.build()
+        # data identifying the function, before any of the inputs are
+        # transformed
+        if function_cache is not None:
+            key_data = dict(
+                architecture=node_to_data(self.root_node),
+                override_hyperparameters=self.override_hyperparameters,
+                default_hyperparameters=self.default_hyperparameters,
+                inputs=inputs,
+                outputs=outputs,
+                include_updates=include_updates,
+                updates=updates,
+                givens=givens,
+                parameter_arena=parameter_arena is not None,
+            )
         if outputs is None:
             outputs = []
         assert isinstance(inputs, list)
         assert isinstance(outputs, list)
 
         if include_updates:
+            # updates depend on the whole network
+            if not self.update_deltas_computed:
+                self.compute_all()
             # combine update_deltas with manually specified updates
             if updates is None:
                 all_deltas = self.update_deltas
@@ -195,11 +359,34 @@ class Network(object):
             tmp_givens = list(givens)
         transformed_givens = [(self.network_variable(k), v)
                               for k, v in tmp_givens]
-        fn = theano.function(inputs=transformed_inputs,
-                             outputs=transformed_outputs,
-                             updates=updates,
-                             givens=transformed_givens,
-                             **kwargs)
+        if parameter_arena is not None:
+            transformed_givens += parameter_arena.givens()
+            if updates is not None:
+                if isinstance(updates, dict):
+                    updates = list(updates.items())
+                updates = parameter_arena.transform_updates(updates)
+        if kwargs.get("profile"):
+            if isinstance(updates, dict):
+                update_pairs = list(updates.items())
+            else:
+                update_pairs = list(updates or [])
+            op_profile.tag_variables(
+                self,
+                list(transformed_outputs)
+                + [new_value for _, new_value in update_pairs])
+        if function_cache is None:
+            fn = theano.function(inputs=transformed_inputs,
+                                 outputs=transformed_outputs,
+                                 updates=updates,
+                                 givens=transformed_givens,
+                                 **kwargs)
+        else:
+            fn = function_cache.function(key_data,
+                                         inputs=transformed_inputs,
+                                         outputs=transformed_outputs,
+                                         updates=updates,
+                                         givens=transformed_givens,
+                                         **kwargs)
         return fn
 
 
@@ -246,6 +433,9 @@ class RelativeNetwork(object):
         return self._state["additional_data"][key]
 
     def get_variable(self, variable_name):
+        # compute the node on demand, if it hasn't been computed yet
+        if self._name not in self.computed_node_names:
+            self._network.compute_outputs([self._name])
         return self._state["current_variables"][variable_name]
 
     def set_hyperparameter(self, node_name, key, value):
@@ -255,6 +445,9 @@ class RelativeNetwork(object):
         if node_name not in self._state["set_hyperparameters"]:
             self._state["set_hyperparameters"][node_name] = {}
         self._state["set_hyperparameters"][node_name][key] = value
+        # set hyperparameters can affect the lookups of every node in the
+        # subtree, so clear all cached lookups
+        self.hyperparameter_cache.clear()
 
     def forward_hyperparameter(self,
                                node_name,
@@ -301,6 +494,30 @@ class RelativeNetwork(object):
         returns generator of all hyperparameters for the given keys
         in the order of precedence
         """
+        # the default values are not cached, because they don't depend
+        # on the node (and the given default value might not be hashable)
+        cache_key = (self._name, tuple(hyperparameter_keys))
+        if cache_key not in self.hyperparameter_cache:
+            self.hyperparameter_cache[cache_key] = list(
+                self._find_node_hyperparameters(hyperparameter_keys))
+        for value in self.hyperparameter_cache[cache_key]:
+            yield value
+        # try returning the given default value, if any
+        if default_value is not NoDefaultValue:
+            yield default_value
+        # try global default hyperparameters
+        # ---
+        # this has lowest precedence
+        for hyperparameter_key in hyperparameter_keys:
+            if hyperparameter_key in self.default_hyperparameters:
+                yield self.default_hyperparameters[hyperparameter_key]
+
+    def _find_node_hyperparameters(self, hyperparameter_keys):
+        """
+        returns generator of override hyperparameters and hyperparameters
+        of the current node and its ancestors for the given keys in the order
+        of precedence
+        """
         # use override_hyperparameters
         # ---
         # this has highest precedence
@@ -308,7 +525,7 @@ class RelativeNetwork(object):
             if hyperparameter_key in self.override_hyperparameters:
                 yield self.override_hyperparameters[hyperparameter_key]
         # look through hyperparameters of all ancestors
-        ancestors = list(self.graph.architecture_ancestors(self._name))
+        ancestors = self.graph.architecture_ancestors_list(self._name)
         # prefer closer nodes over more specific queries
         done_ancestors_names = []
         for node in [self._node] + ancestors:
@@ -321,44 +538,81 @@ class RelativeNetwork(object):
             node_hps = self.node_state[node.name]["set_hyperparameters"]
             for hyperparameter_key in hyperparameter_keys:
                 # try finding set hyperparameters
-                for ancestor_name in done_ancestors_names:
-                    try:
-                        yield node_hps[ancestor_name][hyperparameter_key]
-                    except KeyError:
-                        pass
+                # ---
+                # most nodes don't set any hyperparameters, so avoid looping
+                # over the done ancestors in that case
+                if node_hps:
+                    for ancestor_name in done_ancestors_names:
+                        try:
+                            yield node_hps[ancestor_name][hyperparameter_key]
+                        except KeyError:
+                            pass
                 # try finding provided hyperparameters
                 try:
                     yield node.get_hyperparameter(self, hyperparameter_key)
                 except MissingHyperparameter:
                     pass
-        # try returning the given default value, if any
-        if default_value is not NoDefaultValue:
-            yield default_value
-        # try global default hyperparameters
-        # ---
-        # this has lowest precedence
-        for hyperparameter_key in hyperparameter_keys:
-            if hyperparameter_key in self.default_hyperparameters:
-                yield self.default_hyperparameters[hyperparameter_key]
 
     def find_vws_in_subtree(self, tags=None, is_shared=None):
         """
         return variable wrappers matching all of the given tags
         """
-        remaining_vws = [
-            variable
-            for name in self.graph.architecture_subtree_names(self._name)
-            for variable in self[name]._state["current_variables"].values()]
-        if tags is not None:
-            tags = set(tags)
-            # only keep variables where all tags match
-            remaining_vws = filter(lambda v: len(tags - v.tags) == 0,
-                                   remaining_vws)
+        if self.lazy:
+            # make sure all variables of the subtree exist
+            self._network.compute_outputs(
+                self.graph.architecture_subtree_names_list(self._name))
+        if tags:
+            remaining_vws = self._find_tagged_vws_in_subtree(set(tags))
+        else:
+            remaining_vws = [
+                variable
+                for name in self.graph.architecture_subtree_names_list(
+                    self._name)
+                for variable in self.node_state[name][
+                    "current_variables"].values()]
         if is_shared is not None:
             remaining_vws = filter(lambda v: v.is_shared == is_shared,
                                    remaining_vws)
         return remaining_vws
 
+    def _find_tagged_vws_in_subtree(self, tags):
+        """
+        return variable wrappers matching all of the given (non-empty) tags,
+        using the variable tag index
+        """
+        start, stop = self.graph.architecture_intervals[self._name]
+        # only look through the variables of the least common tag
+        entries = min([self.variable_tag_index.get(tag, []) for tag in tags],
+                      key=len)
+        lo = bisect.bisect_left(entries, (start,))
+        hi = bisect.bisect_left(entries, (stop,))
+        vws = []
+        for _, node_name, variable_name in entries[lo:hi]:
+            state = self.node_state[node_name]
+            variable = state["current_variables"][variable_name]
+            # only keep variables where all tags match
+            # ---
+            # the variable may have been replaced since it was indexed
+            if len(tags - variable.tags) == 0:
+                vws.append(variable)
+        return vws
+
+    def _index_variable(self, name, variable):
+        """
+        adds the given variable of the current node to the variable tag
+        index
+        """
+        # variables without tags can't match a tag query
+        if not variable.tags_:
+            return
+        _, stop = self.graph.architecture_intervals[self._name]
+        entry = (stop - 1, self._name, name)
+        for tag in variable.tags:
+            entries = self.variable_tag_index.setdefault(tag, [])
+            idx = bisect.bisect_left(entries, entry)
+            if idx == len(entries) or entries[idx] != entry:
+                entries.insert(idx, entry)
+
     def find_nodes_in_subtree(self, cls):
         """
         return all nodes with the given class
@@ -384,6 +638,7 @@ class RelativeNetwork(object):
         # save variable
         self._state['current_variables'][name] = variable
         self._state['original_variables'][name] = variable
+        self._index_variable(name, variable)
         return variable
 
     def copy_variable(self, name, previous_variable, tags=None):
@@ -410,6 +665,7 @@ class RelativeNetwork(object):
         """
         assert name in self._state['original_variables']
         self._state['current_variables'][name] = new_variable
+        self._index_variable(name, new_variable)
         return new_variable
 
     def forward_input_to(self,
@@ -0,0 +1,289 @@
+"""
+attribution of theano's op-level profile of a compiled function to the
+treeano nodes that created each apply node
+
+usage:
+>>> network.build(profile=True)  # to attribute updates to their nodes
+>>> fn = network.function(["x"], ["cost"], include_updates=True,
+...                       profile=True)
+>>> fn(x)
+>>> print(NodeOpProfile(network, fn).table(by="node_class"))
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import collections
+
+import numpy as np
+
+# owners for apply nodes that weren't created by a node's compute_output
+UPDATES_OWNER = "<updates>"
+UNKNOWN_OWNER = "<unknown>"
+
+# index of the input whose last dimension is the contracted dimension of
+# dot products
+_DOT_INPUT_IDX = {
+    "Dot": 0,
+    "Dot22": 0,
+    "Dot22Scalar": 0,
+    "GpuDot22": 0,
+    "GpuDot22Scalar": 0,
+    "Gemm": 2,
+    "GpuGemm": 2,
+    "Gemv": 2,
+    "GpuGemv": 2,
+    "CGemv": 2,
+}
+
+
+def _claim(variables, owner_name, owners):
+    """
+    assigns all apply nodes needed to compute the given variables that
+    aren't already assigned to owner_name
+    """
+    stack = list(variables)
+    while stack:
+        var = stack.pop()
+        apply_node = var.owner
+        if apply_node is None or apply_node in owners:
+            continue
+        owners[apply_node] = owner_name
+        stack.extend(apply_node.inputs)
+
+
+def apply_node_owners(network, variables):
+    """
+    returns a map from each apply node needed to compute the given
+    variables to the name of the treeano node that created it
+
+    apply nodes are assigned in computation order, so each node owns the
+    apply nodes between its inputs and its variables. apply nodes of the
+    update deltas are owned by the nodes that set them when the network is
+    built with profile=True, and by UPDATES_OWNER otherwise
+    """
+    owners = {}
+    for node in network.graph.computation_graph_nodes_topological():
+        if node.name not in network.computed_node_names:
+            continue
+        node_variables = [
+            vw.variable_
+            for vw in network.node_state[node.name][
+                "current_variables"].values()
+            if vw.variable_ is not None]
+        _claim(node_variables, node.name, owners)
+    for var, owner_name in network.update_delta_owners.items():
+        delta = network.update_deltas.deltas.get(var)
+        if delta is not None and hasattr(delta, "owner"):
+            _claim([delta], owner_name, owners)
+    _claim(variables, UPDATES_OWNER, owners)
+    return owners
+
+
+def tag_variables(network, variables):
+    """
+    tags the outputs of each apply node needed to compute the given variables
+    with the name of the treeano node that created it, so that the apply
+    nodes of the compiled (optimized) graph can be attributed to nodes
+    """
+    for apply_node, owner_name in apply_node_owners(network,
+                                                    variables).items():
+        for output in apply_node.outputs:
+            output.tag.treeano_node = owner_name
+
+
+def _tagged_owner(var):
+    return getattr(var.tag, "treeano_node", None)
+
+
+def optimized_apply_node_owner(apply_node, max_steps=100):
+    """
+    returns the name of the treeano node that created the (possibly
+    optimized) apply node, using the tags from tag_variables
+
+    if the outputs of the apply node aren't tagged (eg. because they were
+    created by an optimization), the closest tagged variable downstream is
+    used, then the closest tagged variable upstream
+    """
+    for output in apply_node.outputs:
+        owner_name = _tagged_owner(output)
+        if owner_name is not None:
+            return owner_name
+
+    def search(start, neighbors):
+        seen = set()
+        queue = collections.deque(start)
+        steps = 0
+        while queue and steps < max_steps:
+            var = queue.popleft()
+            if var in seen:
+                continue
+            seen.add(var)
+            steps += 1
+            owner_name = _tagged_owner(var)
+            if owner_name is not None:
+                return owner_name
+            queue.extend(neighbors(var))
+
+    def downstream(var):
+        for client, _ in getattr(var, "clients", []):
+            # clients can be the string "output"
+            if hasattr(client, "outputs"):
+                for output in client.outputs:
+                    yield output
+
+    def upstream(var):
+        if var.owner is not None:
+            for input_var in var.owner.inputs:
+                yield input_var
+
+    for start, neighbors in [(apply_node.outputs, downstream),
+                             (apply_node.inputs, upstream)]:
+        owner_name = search(start, neighbors)
+        if owner_name is not None:
+            return owner_name
+    return UNKNOWN_OWNER
+
+
+def _size(shape):
+    if shape is None or any(s is None for s in shape):
+        return None
+    return int(np.prod(shape))
+
+
+def apply_node_flops(apply_node, variable_shape):
+    """
+    returns an estimate of the number of floating point operations of a
+    single call of the apply node, or None if it can't be estimated
+    """
+    op = apply_node.op
+    input_shapes = [variable_shape.get(v) for v in apply_node.inputs]
+    output_shapes = [variable_shape.get(v) for v in apply_node.outputs]
+    if hasattr(op, "flops"):
+        try:
+            return op.flops(input_shapes, output_shapes)
+        except Exception:
+            pass
+    op_name = op.__class__.__name__
+    output_size = _size(output_shapes[0]) if output_shapes else None
+    if output_size is None:
+        return None
+    if op_name in _DOT_INPUT_IDX:
+        input_shape = input_shapes[_DOT_INPUT_IDX[op_name]]
+        if input_shape is None or len(input_shape) == 0:
+            return None
+        return 2 * output_size * input_shape[-1]
+    if "Elemwise" in op_name:
+        # number of scalar ops for fused elementwise ops
+        scalar_op = getattr(op, "scalar_op", None)
+        fgraph = getattr(scalar_op, "fgraph", None)
+        num_ops = len(fgraph.apply_nodes) if fgraph is not None else 1
+        return output_size * num_ops
+    return None
+
+
+def apply_node_bytes(apply_node, variable_shape):
+    """
+    returns the number of bytes of the outputs of the apply node
+    """
+    total = 0
+    for output in apply_node.outputs:
+        size = _size(variable_shape.get(output))
+        dtype = getattr(output.type, "dtype", None)
+        if size is None or dtype is None:
+            continue
+        total += size * np.dtype(dtype).itemsize
+    return total
+
+
+class NodeOpProfile(object):
+
+    """
+    theano's op-level profile of a function compiled with profile=True
+    (eg. network.function(..., profile=True)), aggregated by the treeano
+    node that created each apply node
+
+    flops and memory require shapes, which theano only records with
+    theano.config.profile_memory=True
+    """
+
+    def __init__(self, network, fn):
+        profile = fn.profile
+        assert profile is not None, "function not compiled with profile=True"
+        variable_shape = getattr(profile, "variable_shape", {}) or {}
+        self.nodes = collections.OrderedDict()
+        for key, apply_time in profile.apply_time.items():
+            # newer versions of theano key by (fgraph, apply node)
+            apply_node = key[1] if isinstance(key, tuple) else key
+            call_count = profile.apply_callcount.get(key, 0)
+            owner_name = optimized_apply_node_owner(apply_node)
+            if owner_name in network.graph.name_to_node:
+                node_class = network.graph.name_to_node[
+                    owner_name].__class__.__name__
+            else:
+                node_class = owner_name
+            if owner_name not in self.nodes:
+                self.nodes[owner_name] = dict(
+                    node_class=node_class,
+                    time=0.0,
+                    num_apply_nodes=0,
+                    flops=0,
+                    bytes=0,
+                )
+            node_profile = self.nodes[owner_name]
+            node_profile["time"] += apply_time
+            node_profile["num_apply_nodes"] += 1
+            flops = apply_node_flops(apply_node, variable_shape)
+            if flops is not None:
+                node_profile["flops"] += flops * call_count
+            node_profile["bytes"] += apply_node_bytes(apply_node,
+                                                      variable_shape)
+
+    def by_node_class(self):
+        """
+        returns the profile aggregated by node class
+        """
+        classes = collections.OrderedDict()
+        for node_profile in self.nodes.values():
+            node_class = node_profile["node_class"]
+            if node_class not in classes:
+                classes[node_class] = dict(num_nodes=0,
+                                           time=0.0,
+                                           num_apply_nodes=0,
+                                           flops=0,
+                                           bytes=0)
+            class_profile = classes[node_class]
+            class_profile["num_nodes"] += 1
+            for key in ["time", "num_apply_nodes", "flops", "bytes"]:
+                class_profile[key] += node_profile[key]
+        return classes
+
+    def table(self, by="node"):
+        """
+        returns a table of the profile as a string, sorted by time in
+        decreasing order
+
+        by:
+        either "node_class" to aggregate by node class or "node" to have
+        a row per node
+        """
+        if by == "node_class":
+            rows = self.by_node_class()
+        elif by == "node":
+            rows = self.nodes
+        else:
+            raise ValueError("Unknown by: %s" % by)
+        total_time = sum(row["time"] for row in rows.values()) or 1.0
+        lines = ["\t".join([by, "time", "%", "apply_nodes", "mflops",
+                            "memory_mb"])]
+        for key, row in sorted(rows.items(),
+                               key=lambda item: item[1]["time"],
+                               reverse=True):
+            lines.append("%s\t%0.4fs\t%0.1f\t%d\t%0.1f\t%0.1f" % (
+                key,
+                row["time"],
+                100 * row["time"] / total_time,
+                row["num_apply_nodes"],
+                row["flops"] / 1e6,
+                row["bytes"] / 2 ** 20))
+        return "\n".join(lines)
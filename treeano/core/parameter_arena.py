@@ -0,0 +1,147 @@
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import collections
+
+import numpy as np
+import theano
+import theano.tensor as T
+
+
+class ParameterArena(object):
+
+    """
+    stores the values of several shared variables contiguously, in one flat
+    shared variable per dtype
+
+    functions compiled with the arena (eg.
+    network.function(..., parameter_arena=arena)) read each shared variable
+    as a view into the flat variable of its dtype, and all of their updates
+    are combined into a single update per dtype
+
+    NOTE: while the arena is in use, the original shared variables are not
+    updated - use sync_to_shared to copy the values back into them (eg.
+    before serializing the network)
+    """
+
+    def __init__(self, shared_vars):
+        # map from dtype to list of (shared_var, offset, size)
+        self.layout = collections.OrderedDict()
+        # map from shared_var to its view into the flat variable
+        self.views = collections.OrderedDict()
+        for var in shared_vars:
+            if var in self.views:
+                # already in the arena
+                continue
+            entries = self.layout.setdefault(var.dtype, [])
+            if entries:
+                _, prev_offset, prev_size = entries[-1]
+                offset = prev_offset + prev_size
+            else:
+                offset = 0
+            size = int(np.prod(var.get_value(borrow=True).shape))
+            entries.append((var, offset, size))
+            # placeholder until the flat variables are created
+            self.views[var] = None
+        self.flat_vars = collections.OrderedDict()
+        for dtype, entries in self.layout.items():
+            _, last_offset, last_size = entries[-1]
+            flat_var = theano.shared(np.zeros(last_offset + last_size,
+                                              dtype=dtype),
+                                     name="parameter_arena_%s" % dtype)
+            self.flat_vars[dtype] = flat_var
+            for var, offset, size in entries:
+                view = flat_var[offset:offset + size].reshape(
+                    var.get_value(borrow=True).shape)
+                self.views[var] = T.patternbroadcast(view, var.broadcastable)
+        self.sync_from_shared()
+
+    @classmethod
+    def from_network(cls, network):
+        """
+        creates an arena for all shared variables of a network, as well as
+        all shared variables updated by the network's update deltas (eg.
+        optimizer state such as the moments of adam)
+        """
+        network.compute_all()
+        vws = network[network.root_node.name].find_vws_in_subtree(
+            is_shared=True)
+        shared_vars = [vw.variable for vw in vws]
+        shared_vars += [var for var, _ in network.update_deltas.to_updates()]
+        return cls(shared_vars)
+
+    def givens(self):
+        """
+        returns givens replacing each shared variable with its view
+        """
+        return list(self.views.items())
+
+    def transform_updates(self, updates):
+        """
+        converts a list of (variable, new_value) updates into updates where
+        all updates of variables in the arena are combined into a single
+        update of each flat variable
+
+        the new values are written into their ranges of the flat variable
+        with set_subtensor, which theano's inplace optimizations turn into
+        writes into the flat variable's storage (instead of concatenating
+        every value of the arena into a new flat variable)
+        """
+        new_values = {}
+        other_updates = []
+        for var, new_value in updates:
+            if var in self.views:
+                new_values[var] = new_value
+            else:
+                other_updates.append((var, new_value))
+        arena_updates = []
+        for dtype, entries in self.layout.items():
+            flat_var = self.flat_vars[dtype]
+            flat_new = flat_var
+            for var, offset, size in entries:
+                if var in new_values:
+                    flat_new = T.set_subtensor(
+                        flat_new[offset:offset + size],
+                        new_values[var].flatten().astype(dtype))
+            if flat_new is not flat_var:
+                arena_updates.append((flat_var, flat_new))
+        return arena_updates + other_updates
+
+    def get_value(self):
+        """
+        returns a snapshot of all values, as a map from dtype to a flat
+        array
+        """
+        return {dtype: flat_var.get_value()
+                for dtype, flat_var in self.flat_vars.items()}
+
+    def set_value(self, value):
+        """
+        restores a snapshot from get_value
+        """
+        for dtype, flat_var in self.flat_vars.items():
+            new_value = value[dtype]
+            assert new_value.shape == flat_var.get_value(borrow=True).shape
+            flat_var.set_value(new_value)
+
+    def sync_from_shared(self):
+        """
+        copies the values of the original shared variables into the arena
+        """
+        for dtype, entries in self.layout.items():
+            flat = np.empty(self.flat_vars[dtype].get_value(
+                borrow=True).shape, dtype=dtype)
+            for var, offset, size in entries:
+                flat[offset:offset + size] = var.get_value(
+                    borrow=True).ravel()
+            self.flat_vars[dtype].set_value(flat, borrow=True)
+
+    def sync_to_shared(self):
+        """
+        copies the values in the arena into the original shared variables
+        """
+        for dtype, entries in self.layout.items():
+            flat = self.flat_vars[dtype].get_value(borrow=True)
+            for var, offset, size in entries:
+                shape = var.get_value(borrow=True).shape
+                var.set_value(flat[offset:offset + size].reshape(shape))
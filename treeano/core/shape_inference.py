@@ -0,0 +1,102 @@
+"""
+static shape inference for theano variables, without compiling or
+evaluating anything
+
+shapes are tuples with an int for each dimension that is known statically,
+and None for each dimension that isn't
+"""
+
+from __future__ import division, absolute_import
+from __future__ import print_function, unicode_literals
+
+import theano
+import theano.tensor as T
+
+from .. import utils
+
+
+def _symbolic_shape(variable, static_shape):
+    """
+    returns a tuple of symbolic scalars for the shape of the variable,
+    using constants for known dimensions
+    """
+    shape = []
+    for idx, size in enumerate(static_shape):
+        if size is not None:
+            shape.append(T.constant(size, dtype="int64"))
+        elif variable.broadcastable[idx]:
+            shape.append(T.constant(1, dtype="int64"))
+        else:
+            shape.append(variable.shape[idx])
+    return tuple(shape)
+
+
+def _input_static_shape(variable, known_shapes):
+    """
+    returns the static shape of an input of the graph
+    """
+    if variable in known_shapes:
+        return tuple(known_shapes[variable])
+    elif isinstance(variable, T.TensorConstant):
+        return variable.data.shape
+    elif utils.is_shared_variable(variable):
+        # assuming that shared variables don't change shape
+        return variable.get_value(borrow=True).shape
+    else:
+        return (None,) * variable.ndim
+
+
+def _to_static(size):
+    try:
+        return int(T.get_scalar_constant_value(size))
+    except T.NotScalarConstantError:
+        return None
+
+
+def infer_shape(variable, known_shapes=None):
+    """
+    propagates static shapes through the graph of the given variable,
+    using each op's infer_shape, and returns the static shape of the
+    variable
+
+    known_shapes:
+    optional map from theano variables to their static shapes - the
+    propagation stops at these variables
+    """
+    if known_shapes is None:
+        known_shapes = {}
+    if variable in known_shapes:
+        return tuple(known_shapes[variable])
+
+    # map from variable to its symbolic shape
+    shape_of = {}
+
+    def get_shape(v):
+        if v not in shape_of:
+            if not isinstance(v.type, T.TensorType):
+                # shapes are only defined for tensors
+                shape_of[v] = None
+            else:
+                shape_of[v] = _symbolic_shape(
+                    v,
+                    _input_static_shape(v, known_shapes))
+        return shape_of[v]
+
+    # the dict itself is used as blockers, for constant time membership
+    # checks
+    inputs = theano.gof.graph.inputs([variable], blockers=known_shapes)
+    for node in theano.gof.graph.io_toposort(inputs, [variable]):
+        input_shapes = [get_shape(v) for v in node.inputs]
+        try:
+            output_shapes = node.op.infer_shape(node, input_shapes)
+        except Exception:
+            # either the op can't infer shapes or one of the shapes is
+            # unknown, so the output shapes are unknown
+            output_shapes = [None] * len(node.outputs)
+        for output, output_shape in zip(node.outputs, output_shapes):
+            if output_shape is None and isinstance(output.type, T.TensorType):
+                output_shape = _symbolic_shape(output,
+                                               (None,) * output.ndim)
+            shape_of[output] = output_shape
+
+    return tuple(_to_static(size) for size in get_shape(variable))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+from treeano import core
+
+fX = theano.config.floatX
+
+
+def test_fingerprint():
+    fingerprint = core.function_cache.fingerprint
+    nt.assert_equal(fingerprint({"a": [1, 2], "b": "c"}),
+                    fingerprint({"b": "c", "a": [1, 2]}))
+    nt.assert_not_equal(fingerprint({"a": [1, 2]}),
+                        fingerprint({"a": (1, 2)}))
+    nt.assert_equal(fingerprint(treeano.inits.ConstantInit(1)),
+                    fingerprint(treeano.inits.ConstantInit(1)))
+    nt.assert_not_equal(fingerprint(treeano.inits.ConstantInit(1)),
+                        fingerprint(treeano.inits.ConstantInit(2)))
+
+
+def test_function_cache():
+    def make_network():
+        return tn.SequentialNode(
+            "seq",
+            [tn.InputNode("i", shape=(3, 4)),
+             tn.LinearMappingNode(
+                 "lm",
+                 output_dim=5,
+                 inits=[treeano.inits.ConstantInit(1)])]
+        ).network()
+
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = core.FunctionCache(dirname)
+        x = np.random.randn(3, 4).astype(fX)
+
+        network1 = make_network()
+        fn1 = network1.function(["i"], ["seq"], function_cache=cache)
+        nt.assert_equal(1, len(os.listdir(dirname)))
+
+        network2 = make_network()
+        fn2 = network2.function(["i"], ["seq"], function_cache=cache)
+        # the cached function should be bound to the new network's
+        # parameters
+        w = network2["lm"].get_variable("weight").variable
+        w.set_value(2 * w.get_value())
+        np.testing.assert_allclose(2 * fn1(x)[0], fn2(x)[0], rtol=1e-5)
+        nt.assert_equal(1, len(os.listdir(dirname)))
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_function_cache_eviction():
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = core.FunctionCache(dirname, max_bytes=0)
+        network = tn.InputNode("i", shape=(3,)).network()
+        network.function(["i"], ["i"], function_cache=cache)
+        nt.assert_equal([], os.listdir(dirname))
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_fingerprint_functions():
+    fingerprint = core.function_cache.fingerprint
+    f1 = lambda x: x + 1
+    f2 = lambda x: x + 2
+    nt.assert_not_equal(fingerprint(f1), fingerprint(f2))
+
+    def make_fn(y):
+        return lambda x: x + y
+
+    nt.assert_equal(fingerprint(make_fn(1)), fingerprint(make_fn(1)))
+    nt.assert_not_equal(fingerprint(make_fn(1)), fingerprint(make_fn(2)))
+
+
+def test_function_cache_different_lambdas():
+    def make_network(fn):
+        return tn.SequentialNode(
+            "seq",
+            [tn.InputNode("i", shape=(3,)),
+             tn.ApplyNode("a", fn=fn, shape_fn=(lambda s: s))]
+        ).network()
+
+    dirname = tempfile.mkdtemp()
+    try:
+        cache = core.FunctionCache(dirname)
+        x = np.zeros((3,), dtype=fX)
+        fn1 = make_network(lambda x: x + 1).function(["i"],
+                                                     ["seq"],
+                                                     function_cache=cache)
+        fn2 = make_network(lambda x: x + 2).function(["i"],
+                                                     ["seq"],
+                                                     function_cache=cache)
+        nt.assert_equal(2, len(os.listdir(dirname)))
+        np.testing.assert_equal(fn1(x)[0], x + 1)
+        np.testing.assert_equal(fn2(x)[0], x + 2)
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,55 @@
+import nose.tools as nt
+import networkx as nx
+from treeano import core
+import treeano.nodes as tn
+
+
+def _graph():
+    root = tn.SequentialNode(
+        "seq",
+        [tn.IdentityNode("a"),
+         tn.IdentityNode("b"),
+         tn.IdentityNode("c")])
+    return core.graph.TreeanoGraph(root)
+
+
+def test_input_edge_for_node():
+    g = _graph()
+    nt.assert_equal(None, g.input_edge_for_node("b"))
+    g.add_dependency("a", "b", from_key="foo", to_key="bar")
+    nt.assert_equal(("a", "foo"), g.input_edge_for_node("b", "bar"))
+    nt.assert_equal(None, g.input_edge_for_node("b"))
+    g.remove_dependency("a", "b")
+    nt.assert_equal(None, g.input_edge_for_node("b", "bar"))
+
+
+@nt.raises(ValueError)
+def test_add_dependency_non_unique_to_key():
+    g = _graph()
+    g.add_dependency("a", "c")
+    g.add_dependency("b", "c")
+
+
+def test_add_dependency_cycle():
+    g = _graph()
+    g.add_dependency("a", "b")
+    # the architectural edge from child to parent should remain
+    g.add_dependency("a", "seq", to_key="first")
+
+    @nt.raises(nx.NetworkXUnfeasible)
+    def add_cycle():
+        g.add_dependency("b", "a")
+
+    add_cycle()
+    # the failed edge should not be in the index
+    nt.assert_equal(None, g.input_edge_for_node("a"))
+    nt.assert_equal(("a", "default"), g.input_edge_for_node("seq", "first"))
+    nt.assert_equal(4, len(list(g.all_input_edges_for_node("seq"))))
+
+
+def test_computation_graph_nodes_topological():
+    g = _graph()
+    g.add_dependency("c", "a")
+    g.add_dependency("b", "c")
+    names = [node.name for node in g.computation_graph_nodes_topological()]
+    nt.assert_equal(["b", "c", "a", "seq"], names)
@@ -25,3 +25,102 @@ def test_find_hyperparameters():
     nt.assert_equal([10, 11, 12, 4, 5, 6, 13, 7, 8, 9],
                     list(network["top"].find_hyperparameters(["a", "b", "c"],
                                                              13)))
+
+
+def test_find_hyperparameters_after_set_hyperparameter():
+    class FooNode(core.WrapperNodeImpl):
+        hyperparameter_names = ("a",)
+
+    network = FooNode("top", [FooNode("last", [tn.InputNode("i", shape=(1,))],
+                                      a=1)]).network()
+
+    nt.assert_equal([1, 2],
+                    list(network["last"].find_hyperparameters(["a"], 2)))
+    # lookups should be cached
+    nt.assert_equal([1, 3],
+                    list(network["last"].find_hyperparameters(["a"], 3)))
+    # setting a hyperparameter should invalidate cached lookups
+    network["top"].set_hyperparameter("last", "a", 4)
+    nt.assert_equal([1, 4, 2],
+                    list(network["last"].find_hyperparameters(["a"], 2)))
+
+
+def test_find_vws_in_subtree():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.SequentialNode(
+             "inner",
+             [tn.LinearMappingNode("lm", output_dim=5),
+              tn.AddBiasNode("b")]),
+         tn.LinearMappingNode("lm2", output_dim=6)]
+    ).network()
+
+    def names(vws):
+        return sorted(vw.name for vw in vws)
+
+    nt.assert_equal(["b:bias", "lm2:weight", "lm:weight"],
+                    names(network["seq"].find_vws_in_subtree(
+                        tags=["parameter"])))
+    nt.assert_equal(["b:bias", "lm:weight"],
+                    names(network["inner"].find_vws_in_subtree(
+                        tags=["parameter"])))
+    nt.assert_equal(["lm:weight"],
+                    names(network["inner"].find_vws_in_subtree(
+                        tags=["parameter", "weight"])))
+    nt.assert_equal(["lm:weight"],
+                    names(network["lm"].find_vws_in_subtree(
+                        is_shared=True)))
+    nt.assert_equal([],
+                    names(network["i"].find_vws_in_subtree(
+                        tags=["parameter"])))
+
+
+def test_build_profile():
+    network = tn.SequentialNode(
+        "seq",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.LinearMappingNode("lm1", output_dim=5),
+         tn.LinearMappingNode("lm2", output_dim=6)]
+    ).network()
+    network.build(profile=True)
+    profile = network.build_profile
+    nt.assert_is_instance(profile, core.BuildProfile)
+    nt.assert_equal(4, len(profile.nodes))
+    for phase in core.build_profile.PHASES:
+        nt.assert_equal(1, profile.nodes["lm1"]["count"][phase])
+    # input node creates no apply nodes, identity node doesn't either
+    nt.assert_equal(0, profile.nodes["i"]["num_apply_nodes"])
+    nt.assert_equal(0, profile.nodes["seq"]["num_apply_nodes"])
+    nt.assert_greater(profile.nodes["lm1"]["num_apply_nodes"], 0)
+    by_class = profile.by_node_class()
+    nt.assert_equal(2, by_class["LinearMappingNode"]["num_nodes"])
+    nt.assert_equal(4, len(profile.table().split("\n")))
+    nt.assert_equal(5, len(profile.table(by="node").split("\n")))
+
+
+def test_lazy_build():
+    network = tn.ContainerNode(
+        "c",
+        [tn.SequentialNode(
+            "seq1",
+            [tn.InputNode("i1", shape=(3, 4)),
+             tn.LinearMappingNode("lm1", output_dim=5)]),
+         tn.SequentialNode(
+             "seq2",
+             [tn.InputNode("i2", shape=(3, 4)),
+              tn.LinearMappingNode("lm2", output_dim=5)])]
+    ).network(lazy=True)
+
+    network.function(["i1"], ["seq1"])
+    nt.assert_equal({"seq1", "i1", "lm1"}, network.computed_node_names)
+    nt.assert_false(network.update_deltas_computed)
+    # other nodes are computed on demand
+    network["lm2"].get_variable("weight")
+    nt.assert_equal({"seq1", "i1", "lm1", "seq2", "i2", "lm2"},
+                    network.computed_node_names)
+    nt.assert_equal(["lm1:weight", "lm2:weight"],
+                    sorted(vw.name for vw in network["c"].find_vws_in_subtree(
+                        tags=["parameter"])))
+    network.function(["i1", "i2"], ["c"], include_updates=True)
+    nt.assert_true(network.update_deltas_computed)
@@ -0,0 +1,53 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+
+import treeano
+import treeano.nodes as tn
+from treeano.core import op_profile
+
+fX = theano.config.floatX
+
+
+def _network():
+    return tn.SGDNode(
+        "sgd",
+        {"subtree": tn.SequentialNode("seq", [
+            tn.InputNode("x", shape=(3, 4)),
+            tn.DenseNode("fc", num_units=5),
+            tn.ReLUNode("relu")]),
+         "cost": tn.TotalCostNode("cost", {
+             "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+             "target": tn.InputNode("y", shape=(3, 5))})},
+        learning_rate=0.1,
+        cost_function=lambda preds, y_true: (preds - y_true) ** 2,
+    ).network()
+
+
+def test_apply_node_owners():
+    network = _network()
+    network.build(profile=True)
+    relu_out = network["relu"].get_variable("default").variable
+    cost = network["cost"].get_variable("default").variable
+    owners = op_profile.apply_node_owners(network, [cost])
+    nt.assert_equal(owners[relu_out.owner], "relu")
+    nt.assert_equal(owners[cost.owner], "cost")
+    weight = network["fc_linear"].get_variable("weight").variable
+    delta = network.update_deltas[weight]
+    nt.assert_equal(op_profile.apply_node_owners(network, [delta])[
+        delta.owner], "sgd")
+
+
+def test_node_op_profile():
+    network = _network()
+    network.build(profile=True)
+    fn = network.function(["x", "y"],
+                          ["cost"],
+                          include_updates=True,
+                          profile=True)
+    fn(np.random.randn(3, 4).astype(fX), np.random.randn(3, 5).astype(fX))
+    profile = op_profile.NodeOpProfile(network, fn)
+    nt.assert_in("relu", profile.nodes)
+    nt.assert_in("ReLUNode", profile.by_node_class())
+    nt.assert_in("relu", profile.table(by="node"))
@@ -0,0 +1,54 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import treeano
+import treeano.nodes as tn
+from treeano import core
+
+fX = theano.config.floatX
+
+
+def _network():
+    return tn.AdamNode(
+        "adam",
+        {"subtree": tn.SequentialNode("seq", [
+            tn.InputNode("input", shape=(3, 4)),
+            tn.DenseNode("fc", num_units=5)]),
+         "cost": tn.TotalCostNode("cost", {
+             "pred": tn.ReferenceNode("pred_ref", reference="seq"),
+             "target": tn.InputNode("target", shape=(3, 5))},
+             cost_function=treeano.utils.squared_error)},
+        inits=[treeano.inits.ConstantInit(0.1)],
+    ).network()
+
+
+def test_parameter_arena():
+    x = np.random.randn(3, 4).astype(fX)
+    y = np.random.randn(3, 5).astype(fX)
+
+    network1 = _network()
+    fn1 = network1.function(["input", "target"], ["cost"],
+                            include_updates=True)
+    network2 = _network()
+    arena = core.ParameterArena.from_network(network2)
+    # 2 parameters + adam's 2 moments per parameter and time step
+    nt.assert_equal(7, len(arena.views))
+    fn2 = network2.function(["input", "target"], ["cost"],
+                            include_updates=True,
+                            parameter_arena=arena)
+    snapshot = arena.get_value()
+    for _ in range(5):
+        np.testing.assert_allclose(fn1(x, y), fn2(x, y), rtol=1e-5)
+
+    # restoring a snapshot restores the original cost
+    arena.set_value(snapshot)
+    network3 = _network()
+    fn3 = network3.function(["input", "target"], ["cost"])
+    np.testing.assert_allclose(fn3(x, y), fn2(x, y), rtol=1e-5)
+
+    # values can be copied back into the original shared variables
+    arena.sync_to_shared()
+    fn4 = network2.function(["input", "target"], ["cost"])
+    fn5 = network2.function(["input", "target"], ["cost"],
+                            parameter_arena=arena)
+    np.testing.assert_allclose(fn4(x, y), fn5(x, y), rtol=1e-5)
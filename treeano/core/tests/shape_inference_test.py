@@ -0,0 +1,27 @@
+import nose.tools as nt
+import numpy as np
+import theano
+import theano.tensor as T
+import treeano
+import treeano.nodes as tn
+from treeano.core.shape_inference import infer_shape
+
+fX = theano.config.floatX
+
+
+def test_infer_shape():
+    x = T.matrix()
+    w = theano.shared(np.zeros((4, 5), dtype=fX))
+    nt.assert_equal((3, 5), infer_shape(T.dot(x, w), {x: (3, 4)}))
+    nt.assert_equal((None, 5), infer_shape(T.dot(x, w), {x: (None, 4)}))
+    nt.assert_equal((None, 5), infer_shape(T.dot(x, w)))
+    nt.assert_equal((4, 3), infer_shape(x.T, {x: (3, 4)}))
+
+
+def test_variable_wrapper_inferred_shape():
+    network = tn.SequentialNode(
+        "s",
+        [tn.InputNode("i", shape=(3, 4)),
+         tn.ApplyNode("a", fn=lambda x: T.concatenate([x, x], axis=1))]
+    ).network()
+    nt.assert_equal((3, 8), network["a"].get_variable("default").shape)
@@ -7,6 +7,7 @@ import theano.tensor as T
 
 from .. import utils
 from .inits import ZeroInit
+from . import shape_inference
 
 ENABLE_TEST_VALUE = theano.config.compute_test_value != "off"
 
@@ -47,6 +48,7 @@ class VariableWrapper(object):
         # their shape
         self.relative_network = relative_network
         self.validate()
+        self._register_static_shape()
 
     def to_state(self, name):
         return dict(
@@ -80,6 +82,17 @@ class VariableWrapper(object):
         if tags is not None:
             self.verify_tags(set(tags))
 
+    def _register_static_shape(self):
+        """
+        makes the static shape of the variable available for shape inference
+        of variables computed from it
+        """
+        if (self.relative_network is not None
+                and self.shape_ is not None
+                and self.variable_ is not None):
+            static_shapes = self.relative_network.static_shapes
+            static_shapes[self.variable_] = tuple(self.shape_)
+
     def verify_tags(self, tags):
         for tag in tags:
             assert tag in VALID_TAGS
@@ -164,8 +177,11 @@ class VariableWrapper(object):
             # this must be done after self.variable_ is set to avoid a
             # recursive loop when calling self.shape
             if (not self.is_shared) and ENABLE_TEST_VALUE:
-                test_value = np.random.rand(*self.shape).astype(self.dtype)
+                # use a size of 1 for unknown dimensions
+                test_shape = [1 if s is None else s for s in self.shape]
+                test_value = np.random.rand(*test_shape).astype(self.dtype)
                 variable.tag.test_value = test_value
+            self._register_static_shape()
 
         return self.variable_
 
@@ -181,9 +197,15 @@ class VariableWrapper(object):
             # won't change shape (maybe we can add a flag of whether or not
             # shape doesn't change that defaults to True)
 
-            # FIXME calculate shape
-            # assert False
-            self.shape_ = tuple(self.variable_.shape.eval())
+            # infer the shape statically from the shapes of the variables
+            # it is computed from
+            if self.relative_network is None:
+                known_shapes = {}
+            else:
+                known_shapes = self.relative_network.static_shapes
+            self.shape_ = shape_inference.infer_shape(self.variable,
+                                                      known_shapes)
+            self._register_static_shape()
         return self.shape_
 
     def symbolic_shape(self):
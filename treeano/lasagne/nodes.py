@@ -126,6 +126,30 @@ class SGDNode(LasagneUpdatesNode):
                                    learning_rate=learning_rate)
 
 
+def nesterov_momentum_fused(all_grads, all_params, learning_rate, momentum):
+    """
+    like lasagne.updates.nesterov_momentum, but computing the updates of all
+    parameters of the same dtype with a single elementwise operation, and
+    storing their velocities in a single flat shared variable
+    """
+    updates = []
+    for idxs in nodes.updates.group_by_dtype(all_params):
+        params = [all_params[idx] for idx in idxs]
+        grads = [all_grads[idx] for idx in idxs]
+        param = nodes.updates.flatten_concat(params)
+        grad = nodes.updates.flatten_concat(grads)
+        velocity = nodes.updates.flat_zeros_like(params, params[0].dtype)
+        # same computation as lasagne.updates.apply_nesterov_momentum
+        # applied to lasagne.updates.sgd
+        sgd_param = param - learning_rate * grad
+        x = momentum * velocity + sgd_param - param
+        updates.append((velocity, x))
+        param_next = momentum * x + sgd_param
+        updates.extend(zip(params,
+                           nodes.updates.split_like(param_next, params)))
+    return updates
+
+
 @core.register_node("lasagne_nesterov_momentum")
 class NesterovMomentumNode(LasagneUpdatesNode):
 
@@ -134,11 +158,17 @@ class NesterovMomentumNode(LasagneUpdatesNode):
     """
 
     hyperparameter_names = ("learning_rate",
-                            "momentum")
+                            "momentum",
+                            "fused_updates")
 
     def _lasagne_updates(self, network, parameter_variables, grads):
         learning_rate = network.find_hyperparameter(["learning_rate"])
         momentum = network.find_hyperparameter(["momentum"], 0.9)
+        if network.find_hyperparameter(["fused_updates"], False):
+            return nesterov_momentum_fused(grads,
+                                           parameter_variables,
+                                           learning_rate=learning_rate,
+                                           momentum=momentum)
         return lasagne.updates.nesterov_momentum(grads,
                                                  parameter_variables,
                                                  learning_rate=learning_rate,
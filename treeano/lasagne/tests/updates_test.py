@@ -9,3 +9,9 @@ def test_sgd_node():
 def test_nesterov_momentum_node():
     tn.test_utils.check_updates_node(tl.NesterovMomentumNode,
                                      learning_rate=0.01)
+
+
+def test_nesterov_momentum_node_fused():
+    tn.test_utils.check_updates_node(tl.NesterovMomentumNode,
+                                     learning_rate=0.01,
+                                     fused_updates=True)
@@ -49,3 +49,48 @@ def test_sgd_node():
 
 def test_adam_node():
     nodes.test_utils.check_updates_node(nodes.AdamNode)
+
+
+def _updates_node_costs(updates_node, num_steps=5):
+    np.random.seed(42)
+    network = nodes.HyperparameterNode(
+        "g",
+        updates_node(
+            "updates",
+            {"subtree": nodes.SequentialNode("seq", [
+                nodes.InputNode("input", shape=(3, 4, 5)),
+                nodes.DenseNode("b"),
+                nodes.ReLUNode("c")]),
+             "cost": nodes.TotalCostNode("cost", {
+                 "pred": nodes.ReferenceNode("pred_ref", reference="seq"),
+                 "target": nodes.InputNode("target", shape=(3, 14))})
+             }),
+        num_units=14,
+        learning_rate=0.01,
+        cost_function=lambda preds, y_true: (preds - y_true) ** 2,
+        cost_reference="cost",
+    ).network()
+    fn = network.function(["input", "target"],
+                          ["cost"],
+                          include_updates=True)
+    x = np.random.randn(3, 4, 5).astype(floatX)
+    y = np.random.randn(3, 14).astype(floatX)
+    return [fn(x, y)[0] for _ in range(num_steps)]
+
+
+def test_sgd_node_fused():
+    nodes.test_utils.check_updates_node(nodes.SGDNode,
+                                        learning_rate=0.01,
+                                        fused_updates=True)
+    np.testing.assert_allclose(
+        _updates_node_costs(nodes.SGDNode),
+        _updates_node_costs(lambda name, children: nodes.SGDNode(
+            name, children, fused_updates=True)))
+
+
+def test_adam_node_fused():
+    nodes.test_utils.check_updates_node(nodes.AdamNode, fused_updates=True)
+    np.testing.assert_allclose(
+        _updates_node_costs(nodes.AdamNode),
+        _updates_node_costs(lambda name, children: nodes.AdamNode(
+            name, children, fused_updates=True)))
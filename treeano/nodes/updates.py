@@ -31,6 +31,74 @@ class UpdateScaleNode(core.Wrapper1NodeImpl):
             update_deltas[parameter.variable] *= scale_factor
 
 
+# ############################## fused updates ##############################
+# ---
+# utilities for computing the updates of many parameters at once, by
+# concatenating parameters of the same dtype into a single flat vector
+
+
+def group_by_dtype(variables):
+    """
+    returns a list of lists of indices of variables with the same dtype
+    """
+    groups = {}
+    dtypes = []
+    for idx, var in enumerate(variables):
+        if var.dtype not in groups:
+            groups[var.dtype] = []
+            dtypes.append(var.dtype)
+        groups[var.dtype].append(idx)
+    return [groups[dtype] for dtype in dtypes]
+
+
+def flatten_concat(variables):
+    """
+    concatenates the given variables into a single flat vector
+    """
+    return T.concatenate([var.flatten() for var in variables])
+
+
+def split_like(flat, shared_vars):
+    """
+    inverse of flatten_concat, splitting a flat vector into variables with
+    the same shapes and broadcastable patterns as the given shared variables
+    """
+    results = []
+    offset = 0
+    for var in shared_vars:
+        shape = var.get_value(borrow=True).shape
+        size = int(np.prod(shape))
+        result = flat[offset:offset + size].reshape(shape)
+        results.append(T.patternbroadcast(result, var.broadcastable))
+        offset += size
+    return results
+
+
+def flat_zeros_like(shared_vars, dtype):
+    """
+    returns a flat shared variable of zeros, with as many elements as the
+    given shared variables
+    """
+    size = sum(int(np.prod(var.get_value(borrow=True).shape))
+               for var in shared_vars)
+    return theano.shared(np.zeros(size, dtype=dtype))
+
+
+def sgd_fused(all_grads, all_params, learning_rate):
+    """
+    SGD update deltas, computed with one elementwise operation per dtype,
+    as a map from parameter to delta
+    """
+    deltas = {}
+    for idxs in group_by_dtype(all_params):
+        params = [all_params[idx] for idx in idxs]
+        grads = [all_grads[idx] for idx in idxs]
+        deltas.update(zip(params,
+                          split_like(-learning_rate * flatten_concat(grads),
+                                     params)))
+    return deltas
+
+
 # ############################ standard updaters ############################
 # ---
 # updaters that take in the parameters and their gradient w.r.t. a cost
@@ -41,8 +109,13 @@ class StandardUpdatesNode(six.with_metaclass(abc.ABCMeta,
 
     """
     base node class for providing the standard interface for updating
+
+    gradient_transform:
+    optional function from a list of gradients to a list of transformed
+    gradients (eg. to average them across data-parallel workers)
     """
 
+    hyperparameter_names = ("gradient_transform",)
     children_container = core.DictChildrenContainerSchema(
         cost=core.ChildContainer,
         subtree=core.ChildContainer,
@@ -88,6 +161,12 @@ class StandardUpdatesNode(six.with_metaclass(abc.ABCMeta,
         # NOTE: gradient computation is factored out to enable future caching
         parameter_variables = [p.variable for p in parameters]
         grads = T.grad(cost_var, parameter_variables)
+        # optionally transform the gradients (eg. to average them across
+        # data-parallel workers)
+        gradient_transform = network.find_hyperparameter(
+            ["gradient_transform"], None)
+        if gradient_transform is not None:
+            grads = gradient_transform(grads)
 
         # compute update deltas
         return self._new_update_deltas(network, parameters, grads)
@@ -104,13 +183,19 @@ class SGDNode(StandardUpdatesNode):
     node that provides updates via SGD
     """
 
-    hyperparameter_names = ("sgd_learning_rate",
-                            "learning_rate")
+    hyperparameter_names = (StandardUpdatesNode.hyperparameter_names
+                            + ("sgd_learning_rate",
+                               "learning_rate",
+                               "fused_updates"))
 
     def _new_update_deltas(self, network, parameters, grads):
         learning_rate = network.find_hyperparameter(["sgd_learning_rate",
                                                      "learning_rate"])
         parameter_variables = [p.variable for p in parameters]
+        if network.find_hyperparameter(["fused_updates"], False):
+            return core.UpdateDeltas(sgd_fused(grads,
+                                               parameter_variables,
+                                               learning_rate=learning_rate))
         return core.UpdateDeltas({param: -learning_rate * grad
                                   for param, grad in zip(parameter_variables,
                                                          grads)})
@@ -119,19 +204,11 @@ class SGDNode(StandardUpdatesNode):
 # ################################### adam ###################################
 
 
-def adam_v4(all_grads,
-            all_params,
-            learning_rate=0.001,
-            beta1=0.9,
-            beta2=0.999,
-            epsilon=1e-8,
-            lambda_=1 - 1e-8):
+def _adam_v4_schedule(learning_rate, beta1, beta2, epsilon, lambda_):
     """
-    based on Adam update rule http://arxiv.org/abs/1412.6980
-    (v4 or v5, which is the same as v4)
+    returns the time step shared variable, its next value, and the
+    per-step constants of adam that are shared by all parameters
     """
-    updates = []
-
     # alpha / stepsize / learning rate are all the same thing
     # using alpha because that is what is used in the paper
     alpha = learning_rate
@@ -146,6 +223,37 @@ def adam_v4(all_grads,
     v_unbias_term = T.sqrt(1 - beta2 ** t_next)
     epsilon_hat = epsilon * v_unbias_term
     alpha_t = alpha * v_unbias_term / m_unbias_term
+    return t, t_next, beta1_t, alpha_t, epsilon_hat
+
+
+def _adam_v4_step(param, grad, mparam, vparam, beta1_t, beta2, alpha_t,
+                  epsilon_hat):
+    """
+    returns the new values of the 1st moment, 2nd moment and parameter
+    """
+    # new value for 1st moment estimate
+    m = beta1_t * mparam + (1 - beta1_t) * grad
+    # new value for 2nd moment estimate
+    v = beta2 * vparam + (1 - beta2) * T.sqr(grad)
+
+    param_next = param - alpha_t * m / (T.sqrt(v) + epsilon_hat)
+    return m, v, param_next
+
+
+def adam_v4(all_grads,
+            all_params,
+            learning_rate=0.001,
+            beta1=0.9,
+            beta2=0.999,
+            epsilon=1e-8,
+            lambda_=1 - 1e-8):
+    """
+    based on Adam update rule http://arxiv.org/abs/1412.6980
+    (v4 or v5, which is the same as v4)
+    """
+    updates = []
+    t, t_next, beta1_t, alpha_t, epsilon_hat = _adam_v4_schedule(
+        learning_rate, beta1, beta2, epsilon, lambda_)
 
     for param, grad in zip(all_params, all_grads):
         # 1st moment
@@ -155,12 +263,9 @@ def adam_v4(all_grads,
         vparam = theano.shared(np.zeros(param.get_value().shape,
                                         dtype=theano.config.floatX))
 
-        # new value for 1st moment estimate
-        m = beta1_t * mparam + (1 - beta1_t) * grad
-        # new value for 2nd moment estimate
-        v = beta2 * vparam + (1 - beta2) * T.sqr(grad)
-
-        param_next = param - alpha_t * m / (T.sqrt(v) + epsilon_hat)
+        m, v, param_next = _adam_v4_step(param, grad, mparam, vparam,
+                                         beta1_t, beta2, alpha_t,
+                                         epsilon_hat)
 
         updates.append((mparam, m))
         updates.append((vparam, v))
@@ -170,6 +275,43 @@ def adam_v4(all_grads,
     return updates
 
 
+def adam_v4_fused(all_grads,
+                  all_params,
+                  learning_rate=0.001,
+                  beta1=0.9,
+                  beta2=0.999,
+                  epsilon=1e-8,
+                  lambda_=1 - 1e-8):
+    """
+    like adam_v4, but computing the updates of all parameters of the same
+    dtype with a single elementwise operation, and storing their moments in
+    a single flat shared variable
+    """
+    updates = []
+    t, t_next, beta1_t, alpha_t, epsilon_hat = _adam_v4_schedule(
+        learning_rate, beta1, beta2, epsilon, lambda_)
+
+    for idxs in group_by_dtype(all_params):
+        params = [all_params[idx] for idx in idxs]
+        grads = [all_grads[idx] for idx in idxs]
+        # moments for all parameters of the dtype
+        mparam = flat_zeros_like(params, theano.config.floatX)
+        vparam = flat_zeros_like(params, theano.config.floatX)
+
+        m, v, param_next = _adam_v4_step(flatten_concat(params),
+                                         flatten_concat(grads),
+                                         mparam, vparam,
+                                         beta1_t, beta2, alpha_t,
+                                         epsilon_hat)
+
+        updates.append((mparam, m))
+        updates.append((vparam, v))
+        updates.extend(zip(params, split_like(param_next, params)))
+
+    updates.append((t, t_next))
+    return updates
+
+
 @core.register_node("adam")
 class AdamNode(StandardUpdatesNode):
 
@@ -177,11 +319,13 @@ class AdamNode(StandardUpdatesNode):
     node that provides updates via Adam update rule
     """
 
-    hyperparameter_names = ("adam_learning_rate",
-                            "adam_alpha",
-                            "learning_rate",
-                            "adam_beta1",
-                            "beta1")
+    hyperparameter_names = (StandardUpdatesNode.hyperparameter_names
+                            + ("adam_learning_rate",
+                               "adam_alpha",
+                               "learning_rate",
+                               "adam_beta1",
+                               "beta1",
+                               "fused_updates"))
 
     def _new_update_deltas(self, network, parameters, grads):
         learning_rate = network.find_hyperparameter(["adam_learning_rate",
@@ -202,7 +346,11 @@ class AdamNode(StandardUpdatesNode):
                                                "lambda"],
                                               1 - 1e-8)
         parameter_variables = [p.variable for p in parameters]
-        updates = adam_v4(grads,
+        if network.find_hyperparameter(["fused_updates"], False):
+            adam_fn = adam_v4_fused
+        else:
+            adam_fn = adam_v4
+        updates = adam_fn(grads,
                           parameter_variables,
                           learning_rate=learning_rate,
                           beta1=beta1,